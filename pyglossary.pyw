@@ -161,6 +161,219 @@ parser.add_argument(
     dest='sortCacheSize',
     type=int,
     default=None,
+    help='maximum number of entries in each sorted run while sorting in direct mode (in addition to --sort-mem-limit), every run is written to a temporary file, so small values make many temporary files and merge passes; the default is no limit other than memory',
+)
+parser.add_argument(
+    #'-',
+    '--sort-mem-limit',
+    dest='sortMemLimit',
+    type=int,
+    default=None,
+    help='memory budget for sorting in direct mode (in megabytes), sorted runs are written to temporary files beyond that',
+)
+parser.add_argument(
+    #'-',
+    '--workers',
+    dest='workers',
+    type=int,
+    default=None,
+    help='number of processes to run entry filters in, 0 to disable',
+)
+parser.add_argument(
+    #'-',
+    '--batch-size',
+    dest='batchSize',
+    type=int,
+    default=None,
+    help='number of entries sent to each filter process at once',
+)
+parser.add_argument(
+    #'-',
+    '--compact',
+    dest='compactData',
+    action='store_true',
+    default=None,
+    help='in indirect mode, keep entries in compact buffers to use less memory',
+)
+parser.add_argument(
+    #'-',
+    '--compact-zlib',
+    dest='compressData',
+    action='store_true',
+    default=None,
+    help='with --compact, also keep definitions zlib-compressed',
+)
+
+parser.add_argument(
+    #'-',
+    '--profile',
+    dest='profile',
+    default=None,
+    help='write a JSON report of wall and CPU time of every stage of conversion to this file',
+)
+parser.add_argument(
+    #'-',
+    '--profile-plugins',
+    dest='profilePlugins',
+    action='store_true',
+    default=None,
+    help='with --profile, also put cProfile stats of reader and writer plugins in the report',
+)
+parser.add_argument(
+    #'-',
+    '--profile-memory',
+    dest='profileMemory',
+    action='store_true',
+    default=None,
+    help='log peak and retained memory of read, sort and write, with top allocation sites (using tracemalloc, slow), also put in --profile report',
+)
+
+parser.add_argument(
+    #'-',
+    '--merge',
+    dest='mergeInputs',
+    action='append',
+    default=None,
+    metavar='INPUT_FILE',
+    help='merge this input file with INPUT_FILE (sorted k-way merge, entries with the same headword are consolidated), can be given multiple times',
+)
+parser.add_argument(
+    #'-',
+    '--merge-policy',
+    dest='mergePolicy',
+    choices=('concat', 'alternates', 'first'),
+    default=None,
+    help='with --merge, what to do with definitions of the same headword: concat (default), alternates, first',
+)
+parser.add_argument(
+    #'-',
+    '--merge-sep',
+    dest='mergeSep',
+    default=None,
+    help='with --merge-policy=concat, separator of definitions, default: <hr> for html, empty line for plain text',
+)
+
+parser.add_argument(
+    #'-',
+    '--dedupe',
+    dest='dedupe',
+    nargs='?',
+    const='exact',
+    choices=('exact', 'normalized'),
+    default=None,
+    help='remove entries with duplicate headwords (exact, or normalized: case-folded and unicode-normalized), without loading the glossary into memory',
+)
+parser.add_argument(
+    #'-',
+    '--dedupe-policy',
+    dest='dedupePolicy',
+    choices=('drop', 'concat', 'alternates', 'first'),
+    default=None,
+    help='with --dedupe, drop duplicates (default), or merge them into the first entry (like --merge-policy)',
+)
+
+parser.add_argument(
+    #'-',
+    '--checkpoint',
+    dest='checkpoint',
+    action='store_true',
+    default=None,
+    help='save checkpoints while writing (into OUTPUT_FILE.checkpoint), to be able to continue an interrupted conversion with --resume',
+)
+parser.add_argument(
+    #'-',
+    '--checkpoint-interval',
+    dest='checkpointInterval',
+    type=int,
+    default=None,
+    help='seconds between checkpoints, default: 60',
+)
+parser.add_argument(
+    #'-',
+    '--resume',
+    dest='resume',
+    action='store_true',
+    default=None,
+    help='continue the same (interrupted) conversion from its last checkpoint',
+)
+parser.add_argument(
+    #'-',
+    '--incremental',
+    dest='incremental',
+    action='store_true',
+    default=None,
+    help='compare entries with the previous incremental conversion to the same output file (hashes are kept in OUTPUT_FILE.incremental), and reuse the work of unchanged entries',
+)
+
+parser.add_argument(
+    #'-',
+    '--pipeline',
+    dest='pipeline',
+    action='store_true',
+    default=None,
+    help='read in a separate thread while writing (direct mode), to overlap I/O and decompression with processing',
+)
+parser.add_argument(
+    #'-',
+    '--pipeline-queue-size',
+    dest='pipelineQueueSize',
+    type=int,
+    default=None,
+    help='maximum number of batches of entries waiting to be written in pipeline mode, default: 16',
+)
+parser.add_argument(
+    #'-',
+    '--bytes-mode',
+    dest='bytesMode',
+    action='store_true',
+    default=None,
+    help='pass definitions through as utf-8 bytes, decoding only those that need clean-up (for binary to binary conversions like StarDict, DictOrg, MDX and Sdict to StarDict or DictOrg)',
+)
+parser.add_argument(
+    #'-',
+    '--cache',
+    dest='cache',
+    action='store_true',
+    default=None,
+    help='use the cache of conversion results, to get the output of an identical conversion without converting again (can be enabled by "resultCache" in config)',
+)
+parser.add_argument(
+    #'-',
+    '--no-cache',
+    dest='cache',
+    action='store_false',
+    default=None,
+    help='do not use the cache of conversion results',
+)
+
+parser.add_argument(
+    #'-',
+    '--batch',
+    dest='batchManifest',
+    default='',
+    help='batch convert using a manifest file, every line: INPUT<tab>OUTPUT[<tab>FORMAT[<tab>JSON_OPTIONS]]',
+)
+parser.add_argument(
+    #'-',
+    '--batch-glob',
+    dest='batchGlob',
+    default='',
+    help='batch convert all files matching this glob pattern, requires --write-format',
+)
+parser.add_argument(
+    #'-',
+    '--batch-out-dir',
+    dest='batchOutDir',
+    default='',
+    help='output directory for batch conversion',
+)
+parser.add_argument(
+    #'-',
+    '--jobs',
+    dest='jobs',
+    type=int,
+    default=None,
+    help='number of processes for batch conversion, default is number of CPUs',
 )
 
 parser.add_argument(
@@ -355,6 +568,27 @@ convertOptionsKeys = (
     'progressbar',
     'sort',
     'sortCacheSize',
+    'sortMemLimit',
+    'workers',
+    'batchSize',
+    'compactData',
+    'compressData',
+    'profile',
+    'profilePlugins',
+    'profileMemory',
+    'mergeInputs',
+    'mergePolicy',
+    'mergeSep',
+    'dedupe',
+    'dedupePolicy',
+    'checkpoint',
+    'checkpointInterval',
+    'resume',
+    'incremental',
+    'cache',
+    'pipeline',
+    'pipelineQueueSize',
+    'bytesMode',
     #'sortKey',## or sortAlg FIXME
 )
 
@@ -397,6 +631,20 @@ ui_type = args.ui_type
 #    outputFilename = arguments[1]
 
 
+if args.batchManifest or args.batchGlob:
+    from ui import ui_cmd
+    sys.exit(0 if ui_cmd.UI().runBatch(
+        manifest=args.batchManifest,
+        pattern=args.batchGlob,
+        outDir=args.batchOutDir,
+        outputFormat=args.outputFormat,
+        processes=args.jobs,
+        prefOptions=prefOptions,
+        readOptions=readOptions,
+        writeOptions=writeOptions,
+        convertOptions=convertOptions,
+    ) else 1)
+
 if args.inputFilename:
     if args.outputFilename:
         ui_type = 'cmd' ## silently? FIXME
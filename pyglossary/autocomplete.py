@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+"""
+prefix index of words (headwords and alternates) for autocomplete,
+see Glossary.writeCompletionIndex and CompletionIndex
+
+the index file keeps sorted key records in front-coded blocks: the first
+record of every block is kept in full, and other records as the length
+of the prefix shared with the previous record and the rest of it
+the file is memory-mapped, so opening it takes no time and memory,
+and a query decodes only the first records of blocks (binary search)
+and the records of completions
+
+every key record is the folded word (see foldWord), b'\\x00' and the word
+(nothing if the word is the same as folded word), so records are sorted
+by folded words, and completions can ignore case and diacritics or not
+
+file layout (little-endian):
+    magic
+    header: keyCount, blockCount, keysPerBlock, offsets of blocks and
+        blockOffsets sections (uint64)
+    blocks: front-coded blocks of key records, with varint lengths
+    blockOffsets: uint64 offsets of blocks in blocks section
+        (blockCount + 1)
+
+benchmark against naive scanning of a set of words:
+    python3 -m pyglossary.autocomplete [--count 100000]
+"""
+
+import os
+import sys
+import gc
+import mmap
+import struct
+import unicodedata
+import argparse
+import tracemalloc
+from array import array
+from time import perf_counter
+
+from .lookup import bisectLeft
+
+import logging
+log = logging.getLogger('root')
+
+
+completionMagic = b'PGCOMPLETE1\n'
+_header = struct.Struct('<5Q')
+defaultKeysPerBlock = 16
+
+
+def foldWord(word):
+    """
+        case-folded word without diacritics (combining characters after
+        NFKD decomposition), like 'Éclair' => 'eclair'
+    """
+    return ''.join([
+        c for c in unicodedata.normalize('NFKD', word.casefold())
+        if not unicodedata.combining(c)
+    ]).replace('\x00', '')
+
+
+def _keyRecord(word):
+    folded = foldWord(word)
+    if folded == word:
+        return folded.encode('utf-8') + b'\x00'
+    return folded.encode('utf-8') + b'\x00' + word.encode('utf-8')
+
+
+def _recordWord(record):
+    folded, _, word = record.partition(b'\x00')
+    return (word or folded).decode('utf-8')
+
+
+def _varint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+
+def _readVarint(data, pos):
+    """
+        returns (value, newPos)
+    """
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def writeCompletionIndex(path, words, keysPerBlock=defaultKeysPerBlock):
+    """
+        writes the prefix index of iterable `words` (str) into `path`
+        returns the number of (unique) words
+    """
+    records = sorted(set(_keyRecord(word) for word in words))
+    blocks = bytearray()
+    blockOffsets = array('Q')
+    prev = b''
+    for index, record in enumerate(records):
+        if index % keysPerBlock == 0:
+            blockOffsets.append(len(blocks))
+            blocks += _varint(len(record))
+            blocks += record
+        else:
+            shared = 0
+            maxShared = min(len(prev), len(record))
+            while shared < maxShared and prev[shared] == record[shared]:
+                shared += 1
+            blocks += _varint(shared)
+            blocks += _varint(len(record) - shared)
+            blocks += record[shared:]
+        prev = record
+    blockOffsets.append(len(blocks))
+    blocks += bytes(-len(blocks) % 8)
+    if sys.byteorder == 'big':
+        blockOffsets.byteswap()
+    blocksOffset = len(completionMagic) + _header.size
+    blocksOffset += -blocksOffset % 8
+    tmpPath = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmpPath, 'wb') as fp:
+        fp.write(completionMagic)
+        fp.write(_header.pack(
+            len(records),
+            len(blockOffsets) - 1,
+            keysPerBlock,
+            blocksOffset,
+            blocksOffset + len(blocks),
+        ))
+        fp.write(bytes(blocksOffset - fp.tell()))
+        fp.write(blocks)
+        fp.write(blockOffsets.tobytes())
+    os.replace(tmpPath, path)
+    return len(records)
+
+
+class CompletionIndex(object):
+    """
+        completions of a prefix, from a prefix index file
+        (see writeCompletionIndex)
+    """
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mmap
+        if mm[:len(completionMagic)] != completionMagic:
+            self.close()
+            raise ValueError('invalid prefix index file "%s"' % path)
+        (
+            self._keyCount,
+            self._blockCount,
+            self._keysPerBlock,
+            blocksOffset,
+            offsetsOffset,
+        ) = _header.unpack_from(mm, len(completionMagic))
+        self._blocks = memoryview(mm)[blocksOffset:offsetsOffset]
+        offsets = memoryview(mm)[
+            offsetsOffset:offsetsOffset + 8 * (self._blockCount + 1)
+        ]
+        if sys.byteorder == 'little':
+            self._offsetsView = offsets
+            self._blockOffsets = offsets.cast('Q')
+        else:
+            self._offsetsView = None
+            self._blockOffsets = array('Q', bytes(offsets))
+            self._blockOffsets.byteswap()
+            offsets.release()
+
+    def close(self):
+        # memory views must be released before closing mmap
+        for name in ('_blockOffsets', '_offsetsView', '_blocks'):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __len__(self):
+        return self._keyCount
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _firstRecord(self, blockIndex):
+        pos = self._blockOffsets[blockIndex]
+        size, pos = _readVarint(self._blocks, pos)
+        return bytes(self._blocks[pos:pos + size])
+
+    def _iterRecords(self, blockIndex):
+        """
+            yields records from the first record of block `blockIndex`
+            to the end
+        """
+        data = self._blocks
+        blockOffsets = self._blockOffsets
+        for blockIndex in range(blockIndex, self._blockCount):
+            pos = blockOffsets[blockIndex]
+            end = blockOffsets[blockIndex + 1]
+            size, pos = _readVarint(data, pos)
+            record = bytes(data[pos:pos + size])
+            pos += size
+            yield record
+            while pos < end:
+                shared, pos = _readVarint(data, pos)
+                size, pos = _readVarint(data, pos)
+                record = record[:shared] + bytes(data[pos:pos + size])
+                pos += size
+                yield record
+
+    def complete(self, prefix, limit=10, fold=False):
+        """
+            returns a list of (at most `limit`) words that start with
+            `prefix`, sorted by folded words (see foldWord)
+            fold: ignore case and diacritics
+        """
+        key = foldWord(prefix).encode('utf-8')
+        # first block that may have records starting with key
+        blockIndex = max(0, bisectLeft(
+            key,
+            self._firstRecord,
+            0,
+            self._blockCount,
+        ) - 1)
+        words = []
+        if limit <= 0:
+            return words
+        for record in self._iterRecords(blockIndex):
+            if record < key:
+                continue
+            if not record.startswith(key):
+                break
+            word = _recordWord(record)
+            if fold or word.startswith(prefix):
+                words.append(word)
+                if len(words) >= limit:
+                    break
+        return words
+
+
+def naiveComplete(words, prefix, limit=10, fold=False, foldedWords=None):
+    """
+        completions by scanning all words, for benchmark and tests
+        (the same result as CompletionIndex.complete)
+        foldedWords: list of (foldWord(word), word) for fold=True
+    """
+    if fold:
+        key = foldWord(prefix)
+        if foldedWords is None:
+            foldedWords = [(foldWord(word), word) for word in words]
+        matches = [
+            word for folded, word in foldedWords
+            if folded.startswith(key)
+        ]
+    else:
+        matches = [word for word in words if word.startswith(prefix)]
+    matches.sort(key=_keyRecord)
+    return matches[:limit]
+
+
+def _timeQueries(func, prefixes, repeat):
+    """
+        returns seconds per query
+    """
+    best = None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        for prefix in prefixes:
+            func(prefix)
+        seconds = (perf_counter() - t0) / len(prefixes)
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+
+def main(argv):
+    import tempfile
+    import shutil
+    from random import Random
+    from .bench import SyntheticGlossary
+    parser = argparse.ArgumentParser(prog='autocomplete')
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rawEntries = list(SyntheticGlossary(count=args.count).iterRawEntries())
+    # naive: all words (headwords and alternates) in a set
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        words = set()
+        for rawEntry in rawEntries:
+            if isinstance(rawEntry[0], str):
+                words.add(rawEntry[0])
+            else:
+                words.update(rawEntry[0])
+        wordsMemory = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    # folded words are kept in memory by naive scanning (like words)
+    foldedWords = [(foldWord(word), word) for word in words]
+    rng = Random(0)
+    sample = rng.sample(sorted(words), args.queries)
+    prefixes = [word[:rng.randint(1, 4)] for word in sample]
+
+    tmpDir = tempfile.mkdtemp(prefix='pyglossary-autocomplete-')
+    try:
+        path = os.path.join(tmpDir, 'words.complete')
+        t0 = perf_counter()
+        writeCompletionIndex(path, words)
+        buildSeconds = perf_counter() - t0
+        print('%s words, set of words: %.1f KiB (not including strings)' % (
+            len(words),
+            wordsMemory / 1024,
+        ))
+        print('index file: %.1f KiB, built in %.2f seconds' % (
+            os.path.getsize(path) / 1024,
+            buildSeconds,
+        ))
+        index = CompletionIndex(path)
+        for fold in (False, True):
+            for prefix in prefixes[:20]:
+                assert index.complete(prefix, args.limit, fold) == \
+                    naiveComplete(
+                        words, prefix, args.limit, fold, foldedWords,
+                    ), prefix
+            indexSeconds = _timeQueries(
+                lambda prefix: index.complete(prefix, args.limit, fold),
+                prefixes,
+                args.repeat,
+            )
+            naiveSeconds = _timeQueries(
+                lambda prefix: naiveComplete(
+                    words, prefix, args.limit, fold, foldedWords,
+                ),
+                prefixes[:max(1, len(prefixes) // 10)],
+                1,
+            )
+            print('fold=%-5s index %10.1f us/query, naive %10.1f us/query (%.0fx)' % (
+                fold,
+                indexSeconds * 1e6,
+                naiveSeconds * 1e6,
+                naiveSeconds / indexSeconds,
+            ))
+        index.close()
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    return 0
+
+
+def test_completionIndex(count=3000):
+    import tempfile
+    import shutil
+    from random import Random
+    rng = Random(0)
+    letters = 'abABéÉéß '
+    words = set(
+        ''.join(rng.choice(letters) for _ in range(rng.randint(1, 7)))
+        for _ in range(count)
+    )
+    words.add('')
+    assert foldWord('Éclair') == 'eclair'
+    for n in (0, 1, 127, 128, 300, 70000):
+        assert _readVarint(_varint(n), 0) == (n, len(_varint(n)))
+    tmpDir = tempfile.mkdtemp(prefix='pyglossary-autocomplete-')
+    try:
+        path = os.path.join(tmpDir, 'test.complete')
+        assert writeCompletionIndex(path, words, keysPerBlock=5) == len(words)
+        with CompletionIndex(path) as index:
+            assert len(index) == len(words)
+            prefixes = ['', 'a', 'A', 'é', 'e', 'É', 'ab', 'ss', 'zz']
+            prefixes += [word[:3] for word in sorted(words)[::50]]
+            for prefix in prefixes:
+                for fold in (False, True):
+                    for limit in (1, 7, len(words)):
+                        assert index.complete(prefix, limit, fold) == \
+                            naiveComplete(words, prefix, limit, fold), \
+                            (prefix, limit, fold)
+        from .glossary import Glossary
+        glos = Glossary()
+        glos.addEntry(['éclair', 'eclairs'], 'd1')
+        glos.addEntry('ecole', 'd2')
+        glos.addEntry('zebra', 'd3')
+        path = os.path.join(tmpDir, 'glos.complete')
+        assert glos.writeCompletionIndex(path) == 4
+        with CompletionIndex(path) as index:
+            assert index.complete('é') == ['éclair']
+            assert index.complete('ec', 2, fold=True) == ['éclair', 'eclairs']
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    print('CompletionIndex: OK')
+
+
+if __name__ == '__main__':
+    test_completionIndex()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+
+"""
+batch conversion: runs many conversions (jobs) in a pool of processes
+
+jobs come from a manifest file, or from a glob pattern of input files
+every worker process loads the plugins (Glossary.loadPlugins) only once,
+and a failing job does not stop other jobs
+"""
+
+import os
+from os.path import (
+    join,
+    split,
+    splitext,
+    isfile,
+)
+import json
+import traceback
+from glob import glob
+from time import time as now
+
+from .glossary import Glossary
+from .compression import splitCompressionExt
+
+import logging
+log = logging.getLogger('root')
+
+
+# keys allowed in the options column of manifest,
+# which are passed to Glossary.convert
+jobOptionsKeys = (
+    'inputFormat',
+    'direct',
+    'sort',
+    'sortCacheSize',
+    'sortMemLimit',
+    'readOptions',
+    'writeOptions',
+    'workers',
+    'batchSize',
+    'compactData',
+    'compressData',
+    'profile',
+    'profilePlugins',
+    'profileMemory',
+    'dedupe',
+    'dedupePolicy',
+    'checkpoint',
+    'checkpointInterval',
+    'resume',
+    'incremental',
+    'cache',
+    'pipeline',
+    'pipelineQueueSize',
+    'bytesMode',
+)
+
+
+class BatchJob(object):
+    """
+        one conversion of a batch
+        options: dict of keyword arguments for Glossary.convert
+    """
+    def __init__(
+        self,
+        inputFilename,
+        outputFilename='',
+        outputFormat='',
+        options=None,
+        index=0,
+    ):
+        self.inputFilename = inputFilename
+        self.outputFilename = outputFilename
+        self.outputFormat = outputFormat
+        self.options = options or {}
+        self.index = index
+
+    def __repr__(self):
+        return 'BatchJob(%r, %r)' % (
+            self.inputFilename,
+            self.outputFilename,
+        )
+
+    def getOutputFilename(self, outDir=''):
+        """
+            returns outputFilename, or makes it from input file name
+            and extention of outputFormat
+        """
+        if self.outputFilename:
+            if outDir and not os.path.isabs(self.outputFilename):
+                return join(outDir, self.outputFilename)
+            return self.outputFilename
+        try:
+            ext = Glossary.formatsExt[self.outputFormat][0]
+        except (KeyError, IndexError):
+            raise ValueError(
+                'neither output file nor a valid output format is given' +
+                ' for input file "%s"' % self.inputFilename
+            )
+        inputDir, inputName = split(splitCompressionExt(self.inputFilename)[0])
+        return join(outDir or inputDir, splitext(inputName)[0] + ext)
+
+
+def parseManifest(filename):
+    """
+        reads a manifest file, returns a list of BatchJob
+        every line is tab-separated:
+            INPUT_FILE [OUTPUT_FILE [OUTPUT_FORMAT [OPTIONS]]]
+        where OPTIONS is a JSON object of Glossary.convert arguments,
+        for example: {"sort": true, "writeOptions": {"encoding": "utf-8"}}
+        empty lines, and lines starting with # are ignored
+        relative file names are relative to directory of manifest
+    """
+    baseDir = split(os.path.abspath(filename))[0]
+    jobs = []
+    with open(filename, encoding='utf-8') as fp:
+        for lineNum, line in enumerate(fp, 1):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            parts = line.split('\t')
+            if len(parts) > 4:
+                raise ValueError(
+                    '%s:%s: too many columns' % (filename, lineNum)
+                )
+            parts += [''] * (4 - len(parts))
+            inputFilename, outputFilename, outputFormat, optionsStr = parts
+            options = {}
+            if optionsStr.strip():
+                try:
+                    options = json.loads(optionsStr)
+                except ValueError as e:
+                    raise ValueError(
+                        '%s:%s: invalid options: %s' % (filename, lineNum, e)
+                    )
+                if not isinstance(options, dict):
+                    raise ValueError(
+                        '%s:%s: options must be a JSON object' % (
+                            filename,
+                            lineNum,
+                        )
+                    )
+                for key in options:
+                    if key not in jobOptionsKeys:
+                        raise ValueError(
+                            '%s:%s: invalid option %r' % (
+                                filename,
+                                lineNum,
+                                key,
+                            )
+                        )
+            if outputFilename:
+                outputFilename = join(baseDir, outputFilename)
+            jobs.append(BatchJob(
+                join(baseDir, inputFilename),
+                outputFilename=outputFilename,
+                outputFormat=outputFormat,
+                options=options,
+                index=len(jobs),
+            ))
+    return jobs
+
+
+def globJobs(pattern, outputFormat, options=None):
+    """
+        returns a list of BatchJob, one for each file matching `pattern`
+        output file names are made from outputFormat (see getOutputFilename)
+    """
+    return [
+        BatchJob(
+            inputFilename,
+            outputFormat=outputFormat,
+            options=options,
+            index=index,
+        )
+        for index, inputFilename in enumerate(sorted(
+            path for path in glob(pattern)
+            if isfile(path)
+        ))
+    ]
+
+
+class BatchJobUI(object):
+    """
+        minimal ui object for Glossary in batch workers:
+        only keeps preferences, and shows no progress bar
+    """
+    def __init__(self, pref=None):
+        self.pref = pref or {}
+
+    def progressInit(self, title):
+        pass
+
+    def progress(self, rat, text=''):
+        pass
+
+    def progressEnd(self):
+        pass
+
+
+def initBatchWorker(verbosity):
+    """
+        initializer of batch worker processes
+    """
+    if verbosity is not None:
+        log.setVerbosity(verbosity)
+
+
+def _newResult(job, error=None):
+    return {
+        'index': job.index,
+        'inputFilename': job.inputFilename,
+        'outputFilename': job.outputFilename,
+        'ok': False,
+        'seconds': 0,
+        'entryCount': 0,
+        'error': error,
+    }
+
+
+def runBatchJob(job, outDir='', pref=None, convertOptions=None):
+    """
+        runs one job, in a worker process (or in the current process)
+        never raises an exception, returns a dict:
+            index, inputFilename, outputFilename, ok (bool),
+            seconds, entryCount, error (str or None)
+    """
+    tm0 = now()
+    result = _newResult(job)
+    try:
+        outputFilename = job.getOutputFilename(outDir=outDir)
+        result['outputFilename'] = outputFilename
+        options = dict(convertOptions or {})
+        for key, value in job.options.items():
+            if isinstance(value, dict) and isinstance(options.get(key), dict):
+                value = dict(options[key], **value)
+            options[key] = value
+        options['progressbar'] = False
+        glos = Glossary(ui=BatchJobUI(pref))
+        ok = glos.convert(
+            job.inputFilename,
+            outputFilename=outputFilename,
+            outputFormat=job.outputFormat,
+            **options
+        )
+        result['entryCount'] = glos.getIterEntryCount()
+        if ok:
+            result['ok'] = True
+        else:
+            result['error'] = 'conversion failed'
+    except Exception as e:
+        log.error(
+            'job %s: "%s" failed:\n%s' % (
+                job.index,
+                job.inputFilename,
+                traceback.format_exc(),
+            )
+        )
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    result['seconds'] = now() - tm0
+    return result
+
+
+def _runJobsInPool(jobs, processes, verbosity, jobArgs):
+    """
+        returns (results, brokenJobs)
+        brokenJobs: jobs that were lost because a worker process died
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    results = []
+    brokenJobs = []
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=initBatchWorker,
+        initargs=(verbosity,),
+    ) as pool:
+        futures = {
+            pool.submit(runBatchJob, job, *jobArgs): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                brokenJobs.append(job)
+                continue
+            results.append(result)
+            log.info(
+                '[%s/%s] %s: "%s"' % (
+                    len(results),
+                    len(jobs),
+                    'done' if result['ok'] else 'FAILED',
+                    job.inputFilename,
+                )
+            )
+    return results, brokenJobs
+
+
+def runBatch(
+    jobs,
+    processes=None,
+    outDir='',
+    pref=None,
+    convertOptions=None,
+    verbosity=None,
+):
+    """
+        runs conversion jobs (list of BatchJob) in `processes` processes
+        processes: None means the number of CPUs, 1 runs in this process
+        convertOptions: default Glossary.convert arguments for all jobs,
+            options of each job override them
+        verbosity: verbosity of worker processes
+        returns the list of results (see runBatchJob), ordered like jobs
+    """
+    if not processes:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(jobs)) or 1
+    jobArgs = (outDir, pref, convertOptions)
+    log.info(
+        'Running %s conversions in %s processes' % (len(jobs), processes)
+    )
+    if processes == 1:
+        results = [runBatchJob(job, *jobArgs) for job in jobs]
+    else:
+        results, brokenJobs = _runJobsInPool(
+            jobs,
+            processes,
+            verbosity,
+            jobArgs,
+        )
+        # a dead worker process breaks the whole pool, so we don't know
+        # which job killed it, run each of the lost jobs in its own process
+        for job in brokenJobs:
+            log.warning(
+                'worker process died, retrying "%s" alone' % job.inputFilename
+            )
+            retryResults, retryBroken = _runJobsInPool(
+                [job],
+                1,
+                verbosity,
+                jobArgs,
+            )
+            results += retryResults
+            if retryBroken:
+                results.append(_newResult(job, 'worker process died'))
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def formatBatchSummary(results, totalSeconds=None):
+    """
+        returns a text table of batch results, with a line of totals
+    """
+    lines = [
+        '%-6s %9s %10s  %s' % ('status', 'seconds', 'entries', 'file'),
+    ]
+    for result in results:
+        lines.append('%-6s %9.2f %10d  %s -> %s' % (
+            'ok' if result['ok'] else 'FAILED',
+            result['seconds'],
+            result['entryCount'],
+            result['inputFilename'],
+            result['outputFilename'],
+        ))
+        if result['error']:
+            lines.append('%28s%s' % ('', result['error']))
+    failedCount = sum(1 for result in results if not result['ok'])
+    lines.append(
+        '%s jobs, %s succeeded, %s failed, %s entries' % (
+            len(results),
+            len(results) - failedCount,
+            failedCount,
+            sum(result['entryCount'] for result in results),
+        ) + (
+            ', %.1f seconds' % totalSeconds
+            if totalSeconds is not None else ''
+        )
+    )
+    return '\n'.join(lines)
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmark of reader and writer plugins, using synthetic glossaries
+
+usage:
+    python3 -m pyglossary.bench [--count 10000] [--formats Tabfile,Stardict]
+        [--output result.json] [--baseline old-result.json]
+
+for every writable format: generates a deterministic synthetic glossary,
+writes it, and reads it back (if the format is readable), and measures
+entries/s, MB/s and peak RSS; every format runs in a separate process
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import platform
+import argparse
+from random import Random
+from time import perf_counter
+from collections import OrderedDict as odict
+
+from . import VERSION
+
+import logging
+log = logging.getLogger('root')
+
+
+defaultParams = odict([
+    ('count', 10000),
+    ('seed', 0),
+    ('wordLenMean', 8),
+    ('wordLenStd', 3),
+    ('defiLenMean', 200),
+    ('defiLenStd', 150),
+    ('altRatio', 0.1),  # ratio of entries with alternate words
+    ('htmlRatio', 0.2),  # ratio of html definitions
+    ('nonAsciiRatio', 0.1),  # ratio of non-ascii letters
+])
+
+asciiLetters = 'abcdefghijklmnopqrstuvwxyz'
+nonAsciiLetters = (
+    'àáâäçèéêëìíîïñòóôöùúûüßœ' +  # latin
+    'абвгдежзийклмнопрстуфхцчшщыэюя' +  # cyrillic
+    'αβγδεζηθικλμνξοπρστυφχψω' +  # greek
+    'ابپتثجچحخدذرزژسشصضطظعغفقکگلمنوهی' +  # persian
+    '的一是不了人我在有他这中大来上国个到说们'  # chinese
+)
+htmlTags = ('b', 'i', 'u', 'small', 'big')
+
+
+class SyntheticGlossary(object):
+    """
+        generates deterministic random entries
+        the same params (including seed) give the same entries
+    """
+    def __init__(self, **params):
+        self.params = odict(defaultParams)
+        for key, value in params.items():
+            if key not in defaultParams:
+                raise ValueError('invalid param %r' % key)
+            self.params[key] = value
+
+    def _length(self, rng, mean, std):
+        return max(1, int(rng.gauss(mean, std)))
+
+    def _letters(self, rng, length):
+        nonAsciiRatio = self.params['nonAsciiRatio']
+        return ''.join(
+            rng.choice(nonAsciiLetters)
+            if rng.random() < nonAsciiRatio
+            else rng.choice(asciiLetters)
+            for _ in range(length)
+        )
+
+    def _word(self, rng):
+        p = self.params
+        return self._letters(
+            rng,
+            self._length(rng, p['wordLenMean'], p['wordLenStd']),
+        )
+
+    def _text(self, rng, length, html):
+        words = []
+        size = 0
+        while size < length:
+            word = self._letters(rng, self._length(rng, 6, 3))
+            if html and rng.random() < 0.1:
+                tag = rng.choice(htmlTags)
+                word = '<%s>%s</%s>' % (tag, word, tag)
+            elif rng.random() < 0.1:
+                word += rng.choice(',.;')
+            words.append(word)
+            size += len(word) + 1
+        if html:
+            return '<br>'.join(
+                ' '.join(words[i:i+10])
+                for i in range(0, len(words), 10)
+            )
+        return ' '.join(words)
+
+    def iterRawEntries(self):
+        """
+            yields raw entries: (word, defi) or (word, defi, 'h')
+            word is a list if the entry has alternates
+            main words are unique (case-insensitive)
+        """
+        p = self.params
+        rng = Random(p['seed'])
+        seen = set()
+        for index in range(p['count']):
+            word = self._word(rng)
+            if word.lower() in seen:
+                word += str(index)
+            seen.add(word.lower())
+            if rng.random() < p['altRatio']:
+                word = [word] + [
+                    self._word(rng)
+                    for _ in range(rng.randint(1, 3))
+                ]
+            html = rng.random() < p['htmlRatio']
+            defi = self._text(
+                rng,
+                self._length(rng, p['defiLenMean'], p['defiLenStd']),
+                html,
+            )
+            if html:
+                yield (word, defi, 'h')
+            else:
+                yield (word, defi)
+
+    def makeGlossary(self):
+        from .glossary import Glossary
+        glos = Glossary()
+        glos.setInfo('name', 'Synthetic Glossary')
+        glos.setInfo('sourceLang', 'English')
+        glos.setInfo('targetLang', 'English')
+        for rawEntry in self.iterRawEntries():
+            glos.addEntry(*rawEntry)
+        return glos
+
+
+def getPeakRss():
+    """
+        returns peak RSS of this process in megabytes, or None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024**2  # bytes
+    return peak / 1024  # kilobytes
+
+
+def getPathSize(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(dirPath, fname))
+            for dirPath, _, fnames in os.walk(path)
+            for fname in fnames
+        )
+    return os.path.getsize(path)
+
+
+def _opResult(seconds, entryCount, size):
+    seconds = max(seconds, 1e-9)
+    return odict([
+        ('seconds', seconds),
+        ('entries', entryCount),
+        ('entriesPerSecond', entryCount / seconds),
+        ('megabytesPerSecond', size / 1024**2 / seconds),
+        ('peakRssMB', getPeakRss()),
+    ])
+
+
+def benchFormat(format, params):
+    """
+        runs write, read and round-trip benchmark of one format
+        returns an OrderedDict, with 'error' if something failed
+    """
+    from .glossary import Glossary
+    result = odict()
+    tmpDir = tempfile.mkdtemp(prefix='pyglossary-bench-')
+    try:
+        gen = SyntheticGlossary(**params)
+        glos = gen.makeGlossary()
+        entryCount = len(glos)
+        result['dataPeakRssMB'] = getPeakRss()
+        outDir = os.path.join(tmpDir, 'out')
+        os.mkdir(outDir)
+        ext = Glossary.formatsExt[format][0]
+        filename = os.path.join(outDir, 'bench' + ext)
+
+        t0 = perf_counter()
+        if not glos.write(filename, format=format):
+            raise RuntimeError('write failed')
+        writeSeconds = perf_counter() - t0
+        size = sum(
+            getPathSize(os.path.join(outDir, fname))
+            for fname in os.listdir(outDir)
+        )
+        result['size'] = size
+        result['write'] = _opResult(writeSeconds, entryCount, size)
+
+        if format not in Glossary.readFormats:
+            return result
+
+        glos = Glossary()
+        t0 = perf_counter()
+        if not glos.read(filename, format=format, direct=False):
+            raise RuntimeError('read failed')
+        readCount = len(glos)
+        readSeconds = perf_counter() - t0
+        result['read'] = _opResult(readSeconds, readCount, size)
+        result['roundTrip'] = odict([
+            ('seconds', writeSeconds + readSeconds),
+            ('entriesWritten', entryCount),
+            ('entriesRead', readCount),
+            ('ok', readCount == entryCount),
+        ])
+    except Exception as e:
+        log.exception('benchmark of %s failed' % format)
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    return result
+
+
+def runBench(formats=None, params=None, isolate=True):
+    """
+        formats: list of format names, or None for all writable formats
+        isolate: run each format in a new process (for peak RSS,
+            and to survive crashes)
+        returns the JSON-serializable result
+    """
+    from .glossary import Glossary
+    params = SyntheticGlossary(**(params or {})).params
+    if not formats:
+        formats = list(Glossary.writeFormats)
+    results = odict()
+    for format in formats:
+        if format not in Glossary.writeFormats:
+            results[format] = odict([('error', 'not a writable format')])
+            continue
+        log.info('Benchmarking %s' % format)
+        if not isolate:
+            results[format] = benchFormat(format, params)
+            continue
+        from concurrent.futures import ProcessPoolExecutor
+        try:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results[format] = pool.submit(
+                    benchFormat,
+                    format,
+                    params,
+                ).result()
+        except Exception as e:
+            results[format] = odict([
+                ('error', '%s: %s' % (type(e).__name__, e)),
+            ])
+    return odict([
+        ('info', odict([
+            ('version', VERSION),
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('params', params),
+        ])),
+        ('results', results),
+    ])
+
+
+def compareResults(result, baseline, threshold=0.1):
+    """
+        compares entriesPerSecond of `result` with `baseline`
+        returns a list of (format, operation, old, new, ratio, regressed)
+        regressed is True if new < old * (1 - threshold)
+    """
+    rows = []
+    oldResults = baseline.get('results', {})
+    for format, formatResult in result['results'].items():
+        oldFormatResult = oldResults.get(format)
+        if not oldFormatResult:
+            continue
+        for op in ('write', 'read'):
+            try:
+                new = formatResult[op]['entriesPerSecond']
+                old = oldFormatResult[op]['entriesPerSecond']
+            except KeyError:
+                continue
+            ratio = new / old if old else 0
+            rows.append((format, op, old, new, ratio, ratio < 1 - threshold))
+    return rows
+
+
+def formatResults(result):
+    lines = ['%-22s %-6s %12s %9s %9s %10s' % (
+        'format', 'op', 'entries/s', 'MB/s', 'RSS MB', 'round-trip',
+    )]
+    for format, formatResult in result['results'].items():
+        if 'error' in formatResult:
+            lines.append('%-22s error: %s' % (format, formatResult['error']))
+            continue
+        for op in ('write', 'read'):
+            if op not in formatResult:
+                continue
+            opResult = formatResult[op]
+            roundTrip = ''
+            if op == 'read':
+                roundTrip = 'ok' if formatResult['roundTrip']['ok'] \
+                    else 'MISMATCH'
+            lines.append('%-22s %-6s %12.0f %9.2f %9s %10s' % (
+                format,
+                op,
+                opResult['entriesPerSecond'],
+                opResult['megabytesPerSecond'],
+                '%.1f' % opResult['peakRssMB']
+                if opResult['peakRssMB'] is not None else '-',
+                roundTrip,
+            ))
+    return '\n'.join(lines)
+
+
+def formatComparison(rows):
+    lines = ['%-22s %-6s %12s %12s %8s' % (
+        'format', 'op', 'baseline', 'current', 'ratio',
+    )]
+    for format, op, old, new, ratio, regressed in rows:
+        lines.append('%-22s %-6s %12.0f %12.0f %7.2fx%s' % (
+            format,
+            op,
+            old,
+            new,
+            ratio,
+            '  REGRESSION' if regressed else '',
+        ))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pyglossary-bench',
+        description='benchmark reader and writer plugins'
+        ' with synthetic glossaries',
+    )
+    for key, value in defaultParams.items():
+        parser.add_argument(
+            '--' + ''.join(
+                '-' + c.lower() if c.isupper() else c
+                for c in key
+            ),
+            dest=key,
+            type=type(value),
+            default=value,
+        )
+    parser.add_argument(
+        '--formats',
+        default='',
+        help='comma-separated list of formats, default: all writable formats',
+    )
+    parser.add_argument(
+        '--output',
+        default='',
+        help='save JSON result to this file (default: print to stdout)',
+    )
+    parser.add_argument(
+        '--baseline',
+        default='',
+        help='compare with this (saved) JSON result',
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='ratio of slow-down that counts as regression (default: 0.1)',
+    )
+    parser.add_argument(
+        '--no-isolate',
+        dest='isolate',
+        action='store_false',
+        help='run all formats in this process',
+    )
+    args = parser.parse_args(argv)
+
+    if not log.handlers:
+        logging.basicConfig(format='%(message)s')
+    log.setLevel(logging.INFO)
+
+    result = runBench(
+        formats=[f for f in args.formats.split(',') if f],
+        params=odict(
+            (key, getattr(args, key))
+            for key in defaultParams
+        ),
+        isolate=args.isolate,
+    )
+    log.info('\n' + formatResults(result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(result, fp, indent='\t')
+            fp.write('\n')
+    else:
+        print(json.dumps(result, indent='\t'))
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fp:
+            baseline = json.load(fp)
+        if baseline.get('info', {}).get('params') != result['info']['params']:
+            log.warning('baseline was made with different params')
+        rows = compareResults(result, baseline, threshold=args.threshold)
+        log.info('\n' + formatComparison(rows))
+        if any(row[5] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
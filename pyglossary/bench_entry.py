@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+"""
+micro-benchmark of Entry objects, compared with the previous Entry
+(without __slots__, with list storage of alternates, see LegacyEntry)
+
+usage:
+    python3 -m pyglossary.bench_entry [--count 100000]
+
+entries of a synthetic glossary (see bench.SyntheticGlossary) go through
+the path of a conversion: Entry.fromRaw, the default entry filters
+(strip, replace), getWord / getDefi (by writer) and getRaw (by sort,
+dedupe, ...), and time and memory per entry are measured
+"""
+
+import sys
+import gc
+import argparse
+import tracemalloc
+from time import perf_counter
+
+from .entry import Entry
+from .bench import SyntheticGlossary
+
+
+class LegacyEntry(object):
+    """
+        the previous Entry (only methods used by this benchmark)
+    """
+    sep = '|'
+    join = lambda self, parts: self.sep.join([
+        part.replace(self.sep, '\\'+self.sep)
+        for part in parts
+    ])
+
+    def __init__(self, word, defi, defiFormat=None):
+        if isinstance(word, list):
+            if len(word) == 1:
+                word = word[0]
+        elif not isinstance(word, str):
+            raise TypeError('invalid word type %s'%type(word))
+        if isinstance(defi, list):
+            if len(defi) == 1:
+                defi = defi[0]
+        elif not isinstance(defi, str):
+            raise TypeError('invalid defi type %s'%type(defi))
+        self._word = word
+        self._defi = defi
+        self._defiFormat = defiFormat
+
+    def getWord(self):
+        if isinstance(self._word, str):
+            return self._word
+        else:
+            return self.join(self._word)
+
+    def getWords(self):
+        if isinstance(self._word, str):
+            return [self._word]
+        else:
+            return self._word
+
+    def getDefi(self):
+        if isinstance(self._defi, str):
+            return self._defi
+        else:
+            return self.join(self._defi)
+
+    def editFuncWord(self, func):
+        if isinstance(self._word, str):
+            self._word = func(self._word)
+        else:
+            self._word = tuple(
+                func(st) for st in self._word
+            )
+
+    def editFuncDefi(self, func):
+        if isinstance(self._defi, str):
+            self._defi = func(self._defi)
+        else:
+            self._defi = tuple(
+                func(st) for st in self._defi
+            )
+
+    def strip(self):
+        self.editFuncWord(str.strip)
+        self.editFuncDefi(str.strip)
+
+    def replaceInWord(self, source, target):
+        if isinstance(self._word, str):
+            self._word = self._word.replace(source, target)
+        else:
+            self._word = tuple(
+                st.replace(source, target) for st in self._word
+            )
+
+    def replaceInDefi(self, source, target):
+        if isinstance(self._defi, str):
+            self._defi = self._defi.replace(source, target)
+        else:
+            self._defi = tuple(
+                st.replace(source, target) for st in self._defi
+            )
+
+    def replace(self, source, target):
+        self.replaceInWord(source, target)
+        self.replaceInDefi(source, target)
+
+    def getRaw(self):
+        if self._defiFormat:
+            return (
+                self._word,
+                self._defi,
+                self._defiFormat,
+            )
+        else:
+            return (
+                self._word,
+                self._defi,
+            )
+
+    @classmethod
+    def fromRaw(cls, rawEntry, defaultDefiFormat=None):
+        word = rawEntry[0]
+        defi = rawEntry[1]
+        try:
+            defiFormat = rawEntry[2]
+        except IndexError:
+            defiFormat = defaultDefiFormat
+        if isinstance(word, tuple):
+            word = list(word)
+        if isinstance(defi, tuple):
+            defi = list(defi)
+        return cls(word, defi, defiFormat=defiFormat)
+
+
+def runPath(cls, rawEntries):
+    """
+        runs the conversion path on every raw entry
+        returns seconds per entry
+    """
+    fromRaw = cls.fromRaw
+    t0 = perf_counter()
+    for rawEntry in rawEntries:
+        entry = fromRaw(rawEntry, 'm')
+        entry.strip()
+        entry.replace('\r', '')
+        entry.getWords()[0]
+        entry.getWord()
+        entry.getDefi()
+        entry.getRaw()
+    return (perf_counter() - t0) / len(rawEntries)
+
+
+def measureMemory(cls, rawEntries):
+    """
+        returns bytes per entry of keeping Entry objects in a list
+        (not including the strings, which are shared with raw entries)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        entries = [cls.fromRaw(rawEntry, 'm') for rawEntry in rawEntries]
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del entries
+    return size / len(rawEntries)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='bench_entry')
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rawEntries = list(SyntheticGlossary(count=args.count).iterRawEntries())
+    results = {}
+    for name, cls in (('legacy', LegacyEntry), ('current', Entry)):
+        seconds = min(
+            runPath(cls, rawEntries)
+            for _ in range(args.repeat)
+        )
+        results[name] = (seconds, measureMemory(cls, rawEntries))
+        print('%-8s %8.3f us/entry %8.1f bytes/entry' % (
+            name,
+            seconds * 1e6,
+            results[name][1],
+        ))
+    legacy, current = results['legacy'], results['current']
+    print('saved    %8.3f us/entry %8.1f bytes/entry (%.0f%%, %.0f%%)' % (
+        (legacy[0] - current[0]) * 1e6,
+        legacy[1] - current[1],
+        100 * (1 - current[0] / legacy[0]),
+        100 * (1 - current[1] / legacy[1]),
+    ))
+    return 0
+
+
+def test_entry():
+    entry = Entry(['a', 'b|c'], 'd')
+    assert entry.getWords() == ['a', 'b|c']
+    assert entry.getWord() == 'a|b\\|c'
+    entry.addAlt('e')
+    assert entry.getWord() == 'a|b\\|c|e'
+    entry.editFuncWord(str.upper)
+    assert entry.getWord() == 'A|B\\|C|E'
+    assert Entry.fromRaw(entry.getRaw()).getRaw() == entry.getRaw()
+    entry.getWords().append('f')
+    assert entry.getWords() + ['f'] == ['A', 'B|C', 'E', 'f']
+    entry = Entry(['a'], ('d1', 'd2'), 'h')
+    assert entry.getRaw() == ('a', ('d1', 'd2'), 'h')
+    entry.addAlt('b')
+    assert entry.getRaw() == (('a', 'b'), ('d1', 'd2'), 'h')
+    assert not hasattr(entry, '__dict__')
+    entry = Entry('a', (b'd1', 'd|2'.encode('utf-8')))
+    assert entry.isDefiBytes()
+    assert entry.getDefiBytes() == 'd1|d\\|2'.encode('utf-8')
+    assert entry.getDefis() == ['d1', 'd|2']
+    assert not entry.isDefiBytes()
+    print('Entry: OK')
+
+
+if __name__ == '__main__':
+    test_entry()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+checkpoints of long-running conversions, see Glossary.convert(checkpoint=...)
+
+a checkpoint is a JSON file next to the output file, that keeps:
+    job: identity of the conversion (input files with size and mtime,
+        output file, formats and options), so a checkpoint of another
+        job (or of a modified input file) is never used
+    entryCount: number of entries given to the writer
+    reader: index of current reader, number of entries read from it,
+        and its position token (if reader has `getPosToken` method)
+    writer: state of the writer, and sizes of its output files
+
+a writer plugin that supports checkpoints calls glos.setWriterCheckpoint
+with a function that returns its state and its open output files, which
+are flushed and fsync'd before the checkpoint is saved (atomically)
+
+on resume, the writer gets its state from glos.getWriterResume(), and
+opens its output files with openResumable, which truncates them to the
+sizes at checkpoint, so anything written after the checkpoint is dropped
+"""
+
+import os
+from os.path import abspath, dirname
+import json
+from time import time as now
+
+from . import VERSION
+
+import logging
+log = logging.getLogger('root')
+
+
+checkpointVersion = 1
+defaultInterval = 60  # seconds
+
+
+def getCheckpointPath(outputFilename):
+    return abspath(outputFilename) + '.checkpoint'
+
+
+def getFileStat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def getJobInfo(inputFilenames, outputFilename, options):
+    """
+        inputFilenames: list of input file names
+        options: JSON-serializable dict of everything else that affects
+            the output (formats, read and write options, sort, ...)
+    """
+    return {
+        'inputs': [
+            [abspath(filename), getFileStat(filename)]
+            for filename in inputFilenames
+        ],
+        'output': abspath(outputFilename),
+        'options': options,
+    }
+
+
+def fsyncDir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def saveCheckpoint(path, data):
+    """
+        writes `data` into a temporary file, fsyncs it, and renames it
+        to `path`, so a crash never leaves a partial checkpoint
+    """
+    tmpPath = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmpPath, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp, ensure_ascii=False)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmpPath, path)
+    fsyncDir(dirname(path))
+
+
+def loadCheckpoint(path, job):
+    """
+        returns the checkpoint data, or None if there is no checkpoint,
+        or it's not valid for `job` (see getJobInfo)
+    """
+    try:
+        with open(path, encoding='utf-8') as fp:
+            data = json.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.error('invalid checkpoint file "%s": %s' % (path, e))
+        return None
+    if data.get('version') != checkpointVersion or \
+            data.get('pyglossary') != VERSION:
+        log.warning('checkpoint "%s" is from another version' % path)
+        return None
+    if data.get('job') != json.loads(json.dumps(job)):
+        log.warning(
+            'checkpoint "%s" is for another conversion' % path +
+            ', or input files are modified'
+        )
+        return None
+    return data
+
+
+def removeCheckpoint(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def openResumable(filename, mode='wb', resume=None, **kwargs):
+    """
+        opens output file `filename` for writing, like `open`
+        resume: None for a new file, or the result of glos.getWriterResume()
+            then the file is truncated to its size at checkpoint
+            and opened for appending
+    """
+    if resume is None:
+        return open(filename, mode, **kwargs)
+    size = resume['sizes'].get(abspath(filename))
+    if size is None:
+        raise ValueError(
+            'no size of "%s" in checkpoint, can not resume' % filename
+        )
+    with open(filename, 'r+b') as fp:
+        fp.truncate(size)
+    return open(filename, mode.replace('w', 'a'), **kwargs)
+
+
+class Checkpointer(object):
+    """
+        saves checkpoints of a conversion into `path`,
+        at most once every `interval` seconds
+    """
+    def __init__(self, path, job, interval=defaultInterval):
+        self.path = path
+        self.job = job
+        self.interval = interval
+        self.count = 0  # number of saved checkpoints
+        self._lastTime = now()
+
+    def due(self):
+        return now() - self._lastTime >= self.interval
+
+    def save(self, entryCount, reader, writer):
+        saveCheckpoint(self.path, {
+            'version': checkpointVersion,
+            'pyglossary': VERSION,
+            'job': self.job,
+            'time': now(),
+            'entryCount': entryCount,
+            'reader': reader,
+            'writer': writer,
+        })
+        self._lastTime = now()
+        self.count += 1
+
+    def load(self):
+        return loadCheckpoint(self.path, self.job)
+
+    def remove(self):
+        removeCheckpoint(self.path)
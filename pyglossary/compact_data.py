@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+compact, arena-backed alternative for the list of raw entries
+that Glossary keeps in memory in indirect mode (glos._data)
+
+strings are stored as utf-8 bytes packed into large blocks, and every
+string is addressed by (block index, offset, length) columns of arrays
+so there is no per-entry Python object overhead
+"""
+
+import zlib
+from array import array
+from collections import OrderedDict as odict
+
+import logging
+log = logging.getLogger('root')
+
+
+defaultBlockSize = 1024 * 1024
+defaultCompressedBlockSize = 64 * 1024
+decompressedCacheSize = 16
+
+
+class StrColumn(object):
+    """
+        a column of strings, packed into blocks of utf-8 bytes
+        blocks can optionally be zlib-compressed once they are full
+    """
+    def __init__(self, blockSize=defaultBlockSize, compress=False):
+        self._blockSize = blockSize
+        self._compress = compress
+        self._blocks = []  # full (closed) blocks, bytes
+        self._current = bytearray()
+        self._blockIndex = array('L')
+        self._offset = array('Q')
+        self._length = array('Q')
+        self._cache = odict()  # decompressed blocks, LRU
+
+    def __len__(self):
+        return len(self._offset)
+
+    def _closeBlock(self):
+        data = bytes(self._current)
+        if self._compress:
+            data = zlib.compress(data)
+        self._blocks.append(data)
+        self._current = bytearray()
+
+    def append(self, st):
+        """
+            appends string `st` (or its utf-8 bytes), returns its index
+        """
+        if isinstance(st, bytes):
+            data = st
+        else:
+            data = st.encode('utf-8', 'surrogatepass')
+        if self._current and \
+                len(self._current) + len(data) > self._blockSize:
+            self._closeBlock()
+        self._blockIndex.append(len(self._blocks))
+        self._offset.append(len(self._current))
+        self._length.append(len(data))
+        self._current += data
+        return len(self._offset) - 1
+
+    def _getBlock(self, blockIndex):
+        if blockIndex == len(self._blocks):
+            return self._current
+        if not self._compress:
+            return self._blocks[blockIndex]
+        try:
+            block = self._cache.pop(blockIndex)
+        except KeyError:
+            block = zlib.decompress(self._blocks[blockIndex])
+            if len(self._cache) >= decompressedCacheSize:
+                self._cache.popitem(last=False)
+        self._cache[blockIndex] = block
+        return block
+
+    def __getitem__(self, index):
+        block = self._getBlock(self._blockIndex[index])
+        offset = self._offset[index]
+        return block[offset:offset + self._length[index]].decode(
+            'utf-8',
+            'surrogatepass',
+        )
+
+    def getSize(self):
+        """
+            returns the number of bytes used by blocks
+        """
+        return sum(len(block) for block in self._blocks) + len(self._current)
+
+
+class CompactEntryList(object):
+    """
+        a list-like container of raw entries (see Glossary._data)
+        supports `append`, `len`, iteration, indexing and `sortByWord`
+
+        raw entries are returned as tuples of length 2 or 3:
+            (word, defi) or (word, defi, defiFormat)
+        where word and defi are str, or list of str (with alternates)
+        bytes definitions (see Glossary.setBytesMode) are stored as they
+        are, and returned as str
+    """
+    def __init__(self, compressDefi=False):
+        self._words = StrColumn()
+        self._wordStart = array('Q')
+        self._wordCount = array('L')
+        if compressDefi:
+            self._defis = StrColumn(
+                blockSize=defaultCompressedBlockSize,
+                compress=True,
+            )
+        else:
+            self._defis = StrColumn()
+        self._defiStart = array('Q')
+        self._defiCount = array('L')
+        self._defiFormat = array('B')  # 0 means no defiFormat
+        self._perm = None  # index permutation, set by sortByWord
+
+    def __len__(self):
+        return len(self._wordStart)
+
+    def _appendParts(self, column, parts, startArray, countArray):
+        if isinstance(parts, (str, bytes)):
+            parts = (parts,)
+        startArray.append(len(column))
+        countArray.append(len(parts))
+        for part in parts:
+            column.append(part)
+
+    def append(self, rawEntry):
+        self._appendParts(
+            self._words,
+            rawEntry[0],
+            self._wordStart,
+            self._wordCount,
+        )
+        self._appendParts(
+            self._defis,
+            rawEntry[1],
+            self._defiStart,
+            self._defiCount,
+        )
+        try:
+            defiFormat = rawEntry[2]
+        except IndexError:
+            defiFormat = None
+        self._defiFormat.append(ord(defiFormat) if defiFormat else 0)
+        if self._perm is not None:
+            self._perm.append(len(self._perm))
+
+    def _getParts(self, column, start, count):
+        if count == 1:
+            return column[start]
+        return [
+            column[index]
+            for index in range(start, start + count)
+        ]
+
+    def _getRaw(self, index):
+        word = self._getParts(
+            self._words,
+            self._wordStart[index],
+            self._wordCount[index],
+        )
+        defi = self._getParts(
+            self._defis,
+            self._defiStart[index],
+            self._defiCount[index],
+        )
+        defiFormat = self._defiFormat[index]
+        if defiFormat:
+            return (word, defi, chr(defiFormat))
+        return (word, defi)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if self._perm is not None:
+            index = self._perm[index]
+        return self._getRaw(index)
+
+    def __iter__(self):
+        if self._perm is None:
+            indexes = range(len(self))
+        else:
+            indexes = self._perm
+        for index in indexes:
+            yield self._getRaw(index)
+
+    def sortByWord(self, key=None):
+        """
+            sorts entries by main word, like `list.sort` on raw entries
+            with key=Entry.getRawEntrySortKey(key)
+            only an index permutation is sorted, strings are not moved
+        """
+        words = self._words
+        wordStart = self._wordStart
+        if key:
+            keys = [
+                key(words[wordStart[index]])
+                for index in range(len(self))
+            ]
+        else:
+            keys = [
+                words[wordStart[index]]
+                for index in range(len(self))
+            ]
+        self._perm = array('Q', sorted(
+            range(len(keys)),
+            key=keys.__getitem__,
+        ))
+
+    def getDataSize(self):
+        """
+            returns the number of bytes used by string blocks
+        """
+        return self._words.getSize() + self._defis.getSize()
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+"""
+in-process (de)compression of glossary files: .gz, .dz, .bz2, .xz and .zip
+"""
+
+import os
+import time
+import struct
+import zlib
+from collections import deque
+from os.path import (
+    join,
+    split,
+    splitext,
+    basename,
+)
+import io
+import shutil
+import tempfile
+
+import logging
+log = logging.getLogger('root')
+
+
+compressionExtentions = (
+    '.gz',
+    '.dz',  # dictzip, readable as gzip
+    '.bz2',
+    '.xz',
+    '.zip',
+)
+
+
+def splitCompressionExt(filename):
+    """
+        returns (filenameWithoutCompressionExt, compressionExt)
+        compressionExt is '' if file is not compressed
+    """
+    filenameNoExt, ext = splitext(filename)
+    ext = ext.lower()
+    if ext in compressionExtentions:
+        return filenameNoExt, ext
+    return filename, ''
+
+
+def _zipMemberName(zf, filename):
+    names = zf.namelist()
+    innerName = basename(filename)[:-4]
+    if innerName in names:
+        return innerName
+    files = [
+        name for name in names
+        if not name.endswith('/')
+    ]
+    if len(files) == 1:
+        return files[0]
+    raise ValueError(
+        'zip file "%s" must contain only one file' % filename +
+        ', or a file named "%s"' % innerName
+    )
+
+
+def compressionOpen(filename, mode='rt', threads=None, **kwargs):
+    """
+        opens `filename` like built-in `open`, and if it has a compression
+        extention (.gz, .dz, .bz2, .xz or .zip), (de)compresses it on the fly
+        mode: 'rt' (or 'r') and 'wt' (or 'w') for text,
+              'rb' and 'wb' for binary
+        threads: number of compression threads for writing .gz and .bz2
+                 None means the number of CPUs
+        kwargs: passed to `open` (or the module's `open`), like `encoding`
+    """
+    ext = splitCompressionExt(filename)[1]
+    if mode in ('r', 'w'):
+        mode += 't'
+    if mode in ('wt', 'wb'):
+        return _compressionOpenWrite(filename, ext, mode, threads, **kwargs)
+    if ext in ('.gz', '.dz'):
+        import gzip
+        return gzip.open(filename, mode, **kwargs)
+    if ext == '.bz2':
+        import bz2
+        return bz2.open(filename, mode, **kwargs)
+    if ext == '.xz':
+        import lzma
+        return lzma.open(filename, mode, **kwargs)
+    if ext == '.zip':
+        import zipfile
+        if mode not in ('rt', 'rb'):
+            raise ValueError('invalid mode %r for zip file' % mode)
+        with zipfile.ZipFile(filename) as zf:
+            fp = zf.open(_zipMemberName(zf, filename))
+        if mode == 'rb':
+            return fp
+        return io.TextIOWrapper(fp, **kwargs)
+    return open(filename, mode, **kwargs)
+
+
+def compressionOpenWithRaw(filename, mode='rt', **kwargs):
+    """
+        like `compressionOpen` for reading, but also returns the underlying
+        binary file object of the (compressed) input file, so that
+        rawFile.tell() is the number of input bytes consumed so far
+        returns (fileObj, rawFile), the caller must close both
+    """
+    ext = splitCompressionExt(filename)[1]
+    if mode == 'r':
+        mode = 'rt'
+    if mode not in ('rt', 'rb'):
+        raise ValueError('invalid mode %r' % mode)
+    rawFile = open(filename, 'rb')
+    try:
+        if ext in ('.gz', '.dz'):
+            import gzip
+            return gzip.open(rawFile, mode, **kwargs), rawFile
+        if ext == '.bz2':
+            import bz2
+            return bz2.open(rawFile, mode, **kwargs), rawFile
+        if ext == '.xz':
+            import lzma
+            return lzma.open(rawFile, mode, **kwargs), rawFile
+        if ext == '.zip':
+            import zipfile
+            zf = zipfile.ZipFile(rawFile)
+            fp = zf.open(_zipMemberName(zf, filename))
+        else:
+            fp = rawFile
+        if mode == 'rb':
+            return fp, rawFile
+        return io.TextIOWrapper(fp, **kwargs), rawFile
+    except Exception:
+        rawFile.close()
+        raise
+
+
+def extractToTemp(filename):
+    """
+        decompresses `filename` (.gz, .dz, .bz2, .xz or .zip) into a new
+        temporary directory (not next to the input file)
+        returns (path of decompressed file, temporary directory)
+        the caller must remove the temporary directory
+
+        all members of a .zip file are extracted, because some formats
+        have multiple files
+    """
+    filenameNoExt, ext = splitCompressionExt(filename)
+    tmpDir = tempfile.mkdtemp(prefix='pyglossary-')
+    try:
+        if ext == '.zip':
+            import zipfile
+            with zipfile.ZipFile(filename) as zf:
+                memberName = _zipMemberName(zf, filename)
+                zf.extractall(tmpDir)
+            return join(tmpDir, memberName), tmpDir
+        tmpPath = join(tmpDir, split(filenameNoExt)[1])
+        with compressionOpen(filename, 'rb') as src, \
+                open(tmpPath, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024*1024)
+    except Exception:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        raise
+    return tmpPath, tmpDir
+
+
+def _compressionOpenWrite(filename, ext, mode, threads, **kwargs):
+    if ext in ('.gz', '.bz2'):
+        fp = ParallelCompressWriter(
+            filename,
+            ext[1:],
+            threads=threads,
+            level=kwargs.pop('compresslevel', None),
+        )
+    elif ext == '.xz':
+        import lzma
+        return lzma.open(filename, mode, **kwargs)
+    elif ext == '.zip':
+        fp = ZipMemberWriter(filename)
+    elif ext == '.dz':
+        raise ValueError('writing dictzip (.dz) files is not supported')
+    else:
+        return open(filename, mode, **kwargs)
+    if mode == 'wb':
+        return fp
+    return io.TextIOWrapper(fp, **kwargs)
+
+
+def _gzipCompressBlock(block, zdict, last, level):
+    args = [
+        level,
+        zlib.DEFLATED,
+        -zlib.MAX_WBITS,  # raw deflate, we write gzip header ourself
+        9,
+        zlib.Z_DEFAULT_STRATEGY,
+    ]
+    if zdict:
+        args.append(zdict)
+    comp = zlib.compressobj(*args)
+    return comp.compress(block) + comp.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
+
+def _bz2CompressBlock(block, zdict, last, level):
+    import bz2
+    if not block:
+        return b''
+    return bz2.compress(block, level)
+
+
+class ParallelCompressWriter(io.BufferedIOBase):
+    """
+        a writable binary file object that compresses blocks of data
+        in a pool of threads (zlib and bz2 release the GIL while
+        compressing, so threads run in parallel), like pigz
+
+        archiveType 'gz': a single gzip member, made of raw deflate blocks
+            ending with a sync flush, each block primed with the last
+            32 KB of the previous block as dictionary (like pigz)
+        archiveType 'bz2': concatenated bzip2 streams, one per block
+            (readable by bzip2 and python's bz2 module)
+
+        the order of blocks is preserved, and at most 2 blocks per thread
+        are kept in memory waiting to be written
+
+        level: compression level, default is the default of gzip (6)
+            or bzip2 (9) command
+    """
+    blockSizeByType = {
+        'gz': 128 * 1024,
+        'bz2': 900 * 1000,
+    }
+    compressFuncByType = {
+        'gz': _gzipCompressBlock,
+        'bz2': _bz2CompressBlock,
+    }
+    defaultLevelByType = {
+        'gz': 6,
+        'bz2': 9,
+    }
+    def __init__(
+        self,
+        filename,
+        archiveType='gz',
+        threads=None,
+        level=None,
+        blockSize=None,
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+        io.BufferedIOBase.__init__(self)
+        self.name = filename
+        self._archiveType = archiveType
+        self._compressBlock = self.compressFuncByType[archiveType]
+        self._level = level or self.defaultLevelByType[archiveType]
+        self._blockSize = blockSize or self.blockSizeByType[archiveType]
+        if not threads:
+            threads = os.cpu_count() or 1
+        self._maxPending = threads * 2
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()
+        self._buf = bytearray()
+        self._zdict = b''
+        self._crc = 0
+        self._size = 0
+        self._fp = open(filename, 'wb')
+        if archiveType == 'gz':
+            self._fp.write(
+                b'\x1f\x8b\x08\x00' +
+                struct.pack('<L', int(time.time()) & 0xffffffff) +
+                b'\x02\xff'
+            )
+
+    def writable(self):
+        return True
+
+    def _submit(self, block, last=False):
+        self._pending.append(self._pool.submit(
+            self._compressBlock,
+            block,
+            self._zdict,
+            last,
+            self._level,
+        ))
+        if self._archiveType == 'gz':
+            self._zdict = block[-32768:]
+        while len(self._pending) > self._maxPending:
+            self._fp.write(self._pending.popleft().result())
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed file')
+        data = bytes(data)
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buf += data
+        blockSize = self._blockSize
+        while len(self._buf) >= blockSize:
+            block = bytes(self._buf[:blockSize])
+            del self._buf[:blockSize]
+            self._submit(block)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self._buf), last=True)
+            self._buf = bytearray()
+            while self._pending:
+                self._fp.write(self._pending.popleft().result())
+            if self._archiveType == 'gz':
+                self._fp.write(struct.pack(
+                    '<LL',
+                    self._crc & 0xffffffff,
+                    self._size & 0xffffffff,
+                ))
+        finally:
+            self._pool.shutdown()
+            self._fp.close()
+            io.BufferedIOBase.close(self)
+
+
+class ZipMemberWriter(io.BufferedIOBase):
+    """
+        a writable binary file object that writes into a single member
+        of a new zip file, deflate-compressed on the fly
+        the member name is the zip file name without '.zip'
+    """
+    def __init__(self, filename):
+        import zipfile
+        io.BufferedIOBase.__init__(self)
+        self.name = filename
+        self._zf = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+        self._fp = self._zf.open(basename(filename)[:-4], 'w')
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self._fp.write(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._fp.close()
+        finally:
+            self._zf.close()
+            io.BufferedIOBase.close(self)
+
+
+def _levelKwargs(archiveType, level):
+    if level is None or archiveType not in ('gz', 'bz2'):
+        return {}
+    return {'compresslevel': level}
+
+
+def compressFile(filename, archiveType, threads=None, level=None):
+    """
+        compresses the existing file `filename` into `filename.archiveType`
+        archiveType: 'gz', 'bz2', 'xz' or 'zip'
+        level: compression level of 'gz' and 'bz2',
+            None for default (see ParallelCompressWriter)
+        the original file is removed
+    """
+    with open(filename, 'rb') as src, compressionOpen(
+        '%s.%s' % (filename, archiveType),
+        'wb',
+        threads=threads,
+        **_levelKwargs(archiveType, level)
+    ) as dst:
+        shutil.copyfileobj(src, dst, 1024*1024)
+    os.remove(filename)
+
+
+def archiveFiles(archivePath, paths, archiveType, threads=None, level=None):
+    """
+        puts files `paths` into a single archive `archivePath`
+        archiveType 'zip' creates a zip file,
+        'gz', 'bz2' and 'xz' create a (compressed) tar file
+        level: see compressFile
+        files (and directories) are added with their base names,
+        and removed afterwards
+    """
+    if archiveType == 'zip':
+        import zipfile
+        with zipfile.ZipFile(archivePath, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for path in paths:
+                if not os.path.isdir(path):
+                    zf.write(path, basename(path))
+                    continue
+                parentDir = os.path.dirname(path)
+                for dirPath, _, fnames in os.walk(path):
+                    for fname in fnames:
+                        fpath = join(dirPath, fname)
+                        zf.write(fpath, os.path.relpath(fpath, parentDir))
+    else:
+        import tarfile
+        with compressionOpen(
+            archivePath,
+            'wb',
+            threads=threads,
+            **_levelKwargs(archiveType, level)
+        ) as fp, tarfile.open(fileobj=fp, mode='w|') as tar:
+            for path in paths:
+                tar.add(path, basename(path))
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
@@ -81,6 +81,7 @@ else:
 confJsonFile = join(confDir, 'config.json')
 rootConfJsonFile = join(rootDir, 'config.json')
 userPluginsDir = join(confDir, 'plugins')
+cacheDir = join(confDir, 'cache')
 
 
 def checkCreateConfDir():
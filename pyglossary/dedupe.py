@@ -0,0 +1,571 @@
+# -*- coding: utf-8 -*-
+
+"""
+memory-bounded removal of entries with duplicate headwords, for streams
+of raw entries (see Entry.getRaw)
+
+with 'drop' policy, entries are streamed: the first entry of each key
+is yielded as soon as it is read
+    a key that is not in a Bloom filter of seen keys is new (fast path),
+    other keys (candidates) are looked up in an exact set of 16-byte
+    hashes of seen keys, which keeps older hashes in sorted run files
+    (see _KeyHashSet)
+
+with merge policies, the first entry of a key can only be yielded after
+the whole input is read, so:
+1. all entries are spilled into a temporary file (in order), and their
+    keys are added to a Bloom filter of seen keys, keys that are (maybe)
+    seen before are added to a second Bloom filter of duplicate candidates
+    hashes of keys and offsets of entries are written to an index file
+2. entries with a candidate key (all occurrences, including false
+    positives) are hash-partitioned into temporary files by key, using
+    the index file, so other entries are not read again
+3. every partition is loaded (only candidates, one partition at a time),
+    its entries are grouped by key, and the result of each group
+    (the consolidated entry at the index of first occurrence, and
+    nothing at the index of other occurrences) is written sorted by index
+4. the spilled entries are streamed again, and joined with results of
+    partitions (merged by index), so the order of entries is kept
+
+if no key is a candidate (no duplicates), steps 2 and 3 are skipped
+"""
+
+import os
+import re
+import math
+import mmap
+import pickle
+import struct
+import shutil
+import tempfile
+import unicodedata
+from hashlib import blake2b
+from heapq import merge
+
+from .entry import Entry
+from .entry_merge import mergePolicies, consolidateGroup
+
+import logging
+log = logging.getLogger('root')
+
+
+dedupePolicies = ('drop',) + mergePolicies
+
+defaultPartitionCount = 64
+defaultCapacity = 1000000
+
+_spacesPattern = re.compile(r'\s+', re.U)
+
+# record of the index file: hash of key (16 bytes) and offset in spill file
+_indexRecord = struct.Struct('<16sQ')
+
+
+def normalizeWord(word):
+    """
+        key for near-duplicates: unicode NFKC, case-folded,
+        with whitespaces collapsed
+    """
+    word = unicodedata.normalize('NFKC', word).casefold()
+    return _spacesPattern.sub(' ', word).strip()
+
+
+dedupeKeys = {
+    'exact': None,
+    'normalized': normalizeWord,
+}
+
+
+def _keyHash(key):
+    return blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+class _BloomLayer(object):
+    def __init__(self, capacity, errorRate):
+        self.capacity = capacity
+        self.count = 0
+        self.bitCount = int(math.ceil(
+            -capacity * math.log(errorRate) / math.log(2) ** 2
+        ))
+        self.hashCount = max(1, round(self.bitCount / capacity * math.log(2)))
+        self._bits = bytearray((self.bitCount + 7) // 8)
+
+    def add(self, keyHash):
+        bits = self._bits
+        bitCount = self.bitCount
+        pos = int.from_bytes(keyHash[:8], 'little')
+        step = int.from_bytes(keyHash[8:], 'little') | 1
+        found = True
+        for _ in range(self.hashCount):
+            pos = (pos + step) % bitCount
+            byteIndex = pos >> 3
+            mask = 1 << (pos & 7)
+            if not bits[byteIndex] & mask:
+                found = False
+                bits[byteIndex] |= mask
+        return found
+
+    def __contains__(self, keyHash):
+        bits = self._bits
+        bitCount = self.bitCount
+        pos = int.from_bytes(keyHash[:8], 'little')
+        step = int.from_bytes(keyHash[8:], 'little') | 1
+        for _ in range(self.hashCount):
+            pos = (pos + step) % bitCount
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class BloomFilter(object):
+    """
+        capacity: expected number of keys
+        errorRate: false positive rate at `capacity` keys
+        when more keys are added, the filter grows by a layer twice as
+        large with half the false positive rate, so the total false
+        positive rate stays below 2 * errorRate
+        works on 16-byte hashes of keys (see _keyHash), with double hashing
+    """
+    def __init__(self, capacity=defaultCapacity, errorRate=0.01):
+        self._capacity = max(capacity, 1000)
+        self._errorRate = errorRate
+        self._layers = []
+        self._addLayer()
+
+    def _addLayer(self):
+        n = len(self._layers)
+        self._layers.append(_BloomLayer(
+            self._capacity * 2 ** n,
+            self._errorRate / 2 ** n,
+        ))
+
+    def add(self, keyHash):
+        """
+            adds the key, returns True if the key was (maybe) added before
+        """
+        layers = self._layers
+        for layer in layers[:-1]:
+            if keyHash in layer:
+                return True
+        layer = layers[-1]
+        if layer.add(keyHash):
+            return True
+        layer.count += 1
+        if layer.count >= layer.capacity:
+            self._addLayer()
+        return False
+
+    def __contains__(self, keyHash):
+        for layer in self._layers:
+            if keyHash in layer:
+                return True
+        return False
+
+
+class _KeyHashSet(object):
+    """
+        exact set of 16-byte key hashes, with bounded memory:
+        the latest `runSize` hashes are kept in a set, older ones in
+        sorted run files (searched with binary search), and runs of
+        similar size are merged, so there are O(log(n)) runs
+    """
+    def __init__(self, workDir, name, runSize=100000):
+        self._workDir = workDir
+        self._name = name
+        self._runSize = runSize
+        self._recent = set()
+        self._runs = []  # list of (path, fp, mmap, count)
+        self._fileIndex = 0
+
+    def add(self, keyHash):
+        self._recent.add(keyHash)
+        if len(self._recent) >= self._runSize:
+            self._writeRun(sorted(self._recent), len(self._recent))
+            self._recent = set()
+            runs = self._runs
+            while len(runs) > 1 and runs[-2][3] <= runs[-1][3] * 2:
+                second = runs.pop()
+                first = runs.pop()
+                self._writeRun(
+                    merge(_iterRun(first[2]), _iterRun(second[2])),
+                    first[3] + second[3],
+                )
+                _closeRun(first)
+                _closeRun(second)
+
+    def _writeRun(self, keyHashes, count):
+        path = os.path.join(
+            self._workDir,
+            '%s-%d' % (self._name, self._fileIndex),
+        )
+        self._fileIndex += 1
+        with open(path, 'wb', buffering=1024*1024) as fp:
+            for keyHash in keyHashes:
+                fp.write(keyHash)
+        fp = open(path, 'rb')
+        self._runs.append((
+            path,
+            fp,
+            mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ),
+            count,
+        ))
+
+    def __contains__(self, keyHash):
+        if keyHash in self._recent:
+            return True
+        for _, _, mm, count in self._runs:
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                item = mm[mid * 16:mid * 16 + 16]
+                if item < keyHash:
+                    lo = mid + 1
+                elif item > keyHash:
+                    hi = mid
+                else:
+                    return True
+        return False
+
+    def close(self):
+        for run in self._runs:
+            _closeRun(run)
+        self._runs = []
+
+
+def _iterRun(mm):
+    for pos in range(0, len(mm), 16):
+        yield mm[pos:pos + 16]
+
+
+def _closeRun(run):
+    path, fp, mm, _ = run
+    mm.close()
+    fp.close()
+    os.remove(path)
+
+
+def _dumpItems(fp):
+    pickler = pickle.Pickler(fp, pickle.HIGHEST_PROTOCOL)
+
+    def dump(item):
+        pickler.dump(item)
+        # the memo would keep a reference to every item
+        pickler.clear_memo()
+    return dump
+
+
+def _iterItems(path):
+    with open(path, 'rb', buffering=1024*1024) as fp:
+        unpickler = pickle.Unpickler(fp)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                break
+
+
+class DedupeStats(object):
+    def __init__(self):
+        self.entries = 0  # number of input entries
+        self.candidates = 0  # entries with a (maybe) duplicate key
+        self.groups = 0  # number of keys with duplicates
+        self.duplicates = 0  # entries merged into (or dropped for) another
+
+    def toDict(self):
+        return {
+            'entries': self.entries,
+            'candidates': self.candidates,
+            'groups': self.groups,
+            'duplicates': self.duplicates,
+        }
+
+
+def dedupeEntries(
+    rawEntries,
+    key='exact',
+    policy='drop',
+    capacity=defaultCapacity,
+    errorRate=0.01,
+    partitionCount=defaultPartitionCount,
+    tmpDir=None,
+    defaultDefiFormat='m',
+    stats=None,
+):
+    """
+        yields raw entries of `rawEntries` (in the same order), with only
+        one entry for each key of main word
+        key: 'exact' (main word), 'normalized' (see normalizeWord),
+            or a function that takes a word
+        policy:
+            'drop': keep the first entry, drop the others
+            'concat', 'alternates', 'first': merge them into the first
+                entry, see entry_merge.consolidateGroup
+        capacity: expected number of entries, initial size of the
+            Bloom filters (they grow if there are more entries)
+        stats: a DedupeStats instance, or None
+    """
+    if policy not in dedupePolicies:
+        raise ValueError('invalid dedupe policy %r' % policy)
+    keyFunc = dedupeKeys.get(key, key) if isinstance(key, str) else key
+    if isinstance(key, str) and key not in dedupeKeys:
+        raise ValueError('invalid dedupe key %r' % key)
+    rawKey = Entry.getRawEntrySortKey(keyFunc)
+    if stats is None:
+        stats = DedupeStats()
+
+    if policy == 'drop':
+        yield from _dropDuplicates(
+            rawEntries,
+            rawKey,
+            capacity,
+            errorRate,
+            tmpDir,
+            stats,
+        )
+        return
+
+    seen = BloomFilter(capacity, errorRate)
+    candidates = BloomFilter(capacity // 10, errorRate)
+    hasCandidates = False
+    workDir = tempfile.mkdtemp(prefix='pyglossary-dedupe-', dir=tmpDir)
+    try:
+        spillPath = os.path.join(workDir, 'entries')
+        indexPath = os.path.join(workDir, 'index')
+        packRecord = _indexRecord.pack
+        with open(spillPath, 'wb', buffering=1024*1024) as fp, \
+                open(indexPath, 'wb', buffering=1024*1024) as indexFp:
+            dump = _dumpItems(fp)
+            for rawEntry in rawEntries:
+                stats.entries += 1
+                keyHash = _keyHash(rawKey(rawEntry))
+                indexFp.write(packRecord(keyHash, fp.tell()))
+                dump(rawEntry)
+                if seen.add(keyHash):
+                    candidates.add(keyHash)
+                    hasCandidates = True
+        del seen
+
+        if not hasCandidates:
+            yield from _iterItems(spillPath)
+            return
+
+        partPaths = _partitionCandidates(
+            spillPath,
+            indexPath,
+            candidates,
+            partitionCount,
+            workDir,
+            stats,
+        )
+        resultPaths = [
+            _processPartition(
+                path,
+                rawKey,
+                policy,
+                defaultDefiFormat,
+                stats,
+            )
+            for path in partPaths
+        ]
+        log.debug(
+            'dedupe: %s entries, %s candidates' % (
+                stats.entries,
+                stats.candidates,
+            )
+        )
+        results = merge(*[_iterItems(path) for path in resultPaths])
+        nextIndex, nextEntry = next(results, (None, None))
+        for index, rawEntry in enumerate(_iterItems(spillPath)):
+            if index != nextIndex:
+                yield rawEntry
+                continue
+            if nextEntry is not None:
+                yield nextEntry
+            nextIndex, nextEntry = next(results, (None, None))
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+def _dropDuplicates(rawEntries, rawKey, capacity, errorRate, tmpDir, stats):
+    """
+        yields the first entry of each key as soon as it is read,
+        keys are compared by their 16-byte hash (see _keyHash)
+    """
+    seen = BloomFilter(capacity, errorRate)
+    workDir = tempfile.mkdtemp(prefix='pyglossary-dedupe-', dir=tmpDir)
+    keyHashes = _KeyHashSet(workDir, 'keys')
+    duplicateKeyHashes = _KeyHashSet(workDir, 'duplicates')
+    try:
+        for rawEntry in rawEntries:
+            stats.entries += 1
+            keyHash = _keyHash(rawKey(rawEntry))
+            if seen.add(keyHash):
+                stats.candidates += 1
+                if keyHash in keyHashes:
+                    stats.duplicates += 1
+                    if keyHash not in duplicateKeyHashes:
+                        stats.groups += 1
+                        duplicateKeyHashes.add(keyHash)
+                    continue
+            keyHashes.add(keyHash)
+            yield rawEntry
+    finally:
+        keyHashes.close()
+        duplicateKeyHashes.close()
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+def _iterIndex(indexPath):
+    """
+        yields (keyHash, offset) records of index file
+    """
+    recordSize = _indexRecord.size
+    unpackRecords = _indexRecord.iter_unpack
+    with open(indexPath, 'rb') as fp:
+        while True:
+            chunk = fp.read(recordSize * 4096)
+            if not chunk:
+                break
+            yield from unpackRecords(chunk)
+
+
+def _partitionCandidates(
+    spillPath,
+    indexPath,
+    candidates,
+    partitionCount,
+    workDir,
+    stats,
+):
+    """
+        writes (index, rawEntry) of candidate entries into partition files
+        by hash of key, returns the list of partition file paths
+    """
+    paths = [
+        os.path.join(workDir, 'part-%d' % i)
+        for i in range(partitionCount)
+    ]
+    files = [
+        open(path, 'wb', buffering=64*1024)
+        for path in paths
+    ]
+    try:
+        dumps = [_dumpItems(fp) for fp in files]
+        with open(spillPath, 'rb') as spillFp:
+            for index, (keyHash, offset) in enumerate(_iterIndex(indexPath)):
+                if keyHash not in candidates:
+                    continue
+                stats.candidates += 1
+                spillFp.seek(offset)
+                rawEntry = pickle.load(spillFp)
+                dumps[keyHash[0] % partitionCount]((index, rawEntry))
+    finally:
+        for fp in files:
+            fp.close()
+    return paths
+
+
+def _processPartition(path, rawKey, policy, defaultDefiFormat, stats):
+    """
+        groups entries of a partition by key, and writes the results
+        (index, rawEntry or None) sorted by index into a new file
+        returns the path of the new file
+    """
+    groups = {}  # key => list of (index, rawEntry)
+    for index, rawEntry in _iterItems(path):
+        entryKey = rawKey(rawEntry)
+        try:
+            groups[entryKey].append((index, rawEntry))
+        except KeyError:
+            groups[entryKey] = [(index, rawEntry)]
+    os.remove(path)
+    results = []
+    for items in groups.values():
+        if len(items) == 1:
+            # a false positive of Bloom filter
+            continue
+        stats.groups += 1
+        stats.duplicates += len(items) - 1
+        if policy == 'drop':
+            firstEntry = items[0][1]
+        else:
+            firstEntry = consolidateGroup(
+                [rawEntry for _, rawEntry in items],
+                policy=policy,
+                defaultDefiFormat=defaultDefiFormat,
+            )
+        results.append((items[0][0], firstEntry))
+        for index, _ in items[1:]:
+            results.append((index, None))
+    del groups
+    results.sort(key=lambda item: item[0])
+    resultPath = path + '.result'
+    with open(resultPath, 'wb') as fp:
+        dump = _dumpItems(fp)
+        for item in results:
+            dump(item)
+    return resultPath
+
+
+def test_dedupeEntries(count=20000):
+    import random
+    rng = random.Random(0)
+    rawEntries = [
+        (
+            rng.choice(['', ' ']) + rng.choice(['w', 'W']) +
+            str(rng.randrange(count)),
+            'd%d' % i,
+        )
+        for i in range(count)
+    ]
+    for keyName in ('exact', 'normalized'):
+        keyFunc = dedupeKeys[keyName] or (lambda w: w)
+        expected = []
+        seenKeys = set()
+        duplicateKeys = set()
+        for rawEntry in rawEntries:
+            if keyFunc(rawEntry[0]) not in seenKeys:
+                seenKeys.add(keyFunc(rawEntry[0]))
+                expected.append(rawEntry)
+            else:
+                duplicateKeys.add(keyFunc(rawEntry[0]))
+        groupCount = len(duplicateKeys)
+        for capacity in (count, 1000):
+            stats = DedupeStats()
+            result = list(dedupeEntries(
+                iter(rawEntries),
+                key=keyName,
+                capacity=capacity,
+                partitionCount=4,
+                stats=stats,
+            ))
+            assert result == expected, keyName
+            assert stats.duplicates == count - len(expected), stats.toDict()
+            assert stats.groups == groupCount, stats.toDict()
+        print('dedupeEntries: OK, key=%s, %s' % (keyName, stats.toDict()))
+    workDir = tempfile.mkdtemp(prefix='pyglossary-dedupe-')
+    keyHashes = _KeyHashSet(workDir, 'keys', runSize=100)
+    for i in range(0, 5000, 2):
+        keyHashes.add(_keyHash(str(i)))
+    assert len(keyHashes._runs) < 10, len(keyHashes._runs)
+    for i in range(5000):
+        assert (_keyHash(str(i)) in keyHashes) == (i % 2 == 0), i
+    keyHashes.close()
+    shutil.rmtree(workDir)
+    readCount = [0]
+    def countedEntries():
+        for rawEntry in rawEntries:
+            readCount[0] += 1
+            yield rawEntry
+    result = dedupeEntries(countedEntries())
+    assert next(result) == rawEntries[0]
+    assert readCount[0] == 1, readCount
+    result.close()
+    result = list(dedupeEntries(
+        iter([('a', 'a1'), ('b', 'b1'), ('a', 'a2', 'h')]),
+        policy='concat',
+    ))
+    assert result == [('a', 'a1\n<hr>\na2', 'h'), ('b', 'b1')], result
+
+
+if __name__ == '__main__':
+    test_dedupeEntries()
@@ -2,11 +2,34 @@
 
 
 class Entry(object):
+    """
+        word and definition are kept as str, or as a tuple of str
+        (with alternates, at least 2 items), so the common entry with
+        one word and one definition needs no list or tuple at all
+        joined forms of alternates (getWord, getDefi) are cached
+        getWords, getDefis and getDefisBytes return new lists
+        (like before), tuples are only kept inside
+
+        in bytes mode (see Glossary.setBytesMode), definitions can be
+        utf-8 bytes (or a tuple of bytes), which writers get without
+        decoding by getDefiBytes / getDefisBytes, and which are decoded
+        (in place) on first use as str, for example by an entry filter
+    """
+    __slots__ = (
+        '_word',
+        '_defi',
+        '_defiFormat',
+        '_joinedWord',
+        '_joinedDefi',
+    )
+
     sep = '|'
-    join = lambda self, parts: self.sep.join([
-        part.replace(self.sep, '\\'+self.sep)
-        for part in parts
-    ])
+
+    def join(self, parts):
+        return self.sep.join([
+            part.replace(self.sep, '\\'+self.sep)
+            for part in parts
+        ])
 
     @staticmethod
     def getEntrySortKey(key=None):
@@ -27,30 +50,31 @@ class Entry(object):
 
     def __init__(self, word, defi, defiFormat=None):
         """
-            word: string or a list of strings (including alternate words)
-            defi: string or a list of strings (including alternate definitions)
+            word: string or a list (or tuple) of strings
+                (including alternate words)
+            defi: string or a list (or tuple) of strings
+                (including alternate definitions)
+                or utf-8 bytes (or a list or tuple of bytes)
             defiFormat (optional): definition format:
                 'm': plain text
                 'h': html
                 'x': xdxf
         """
+        if not isinstance(word, str):
+            if not isinstance(word, (list, tuple)):
+                raise TypeError('invalid word type %s'%type(word))
+            word = word[0] if len(word) == 1 else tuple(word)
 
-        ## memory optimization:
-        if isinstance(word, list):
-            if len(word) == 1:
-                word = word[0]
-        elif not isinstance(word, str):
-            raise TypeError('invalid word type %s'%type(word))
-
-        if isinstance(defi, list):
-            if len(defi) == 1:
-                defi = defi[0]
-        elif not isinstance(defi, str):
-            raise TypeError('invalid defi type %s'%type(defi))
+        if not isinstance(defi, (str, bytes)):
+            if not isinstance(defi, (list, tuple)):
+                raise TypeError('invalid defi type %s'%type(defi))
+            defi = defi[0] if len(defi) == 1 else tuple(defi)
 
         self._word = word
         self._defi = defi
         self._defiFormat = defiFormat
+        self._joinedWord = None
+        self._joinedDefi = None
 
     def getWord(self):
         """
@@ -58,39 +82,106 @@ class Entry(object):
                 and all the alternate words
                 seperated by '|'
         """
-        if isinstance(self._word, str):
-            return self._word
-        else:
-            return self.join(self._word)
+        word = self._word
+        if isinstance(word, str):
+            return word
+        joined = self._joinedWord
+        if joined is None:
+            joined = self._joinedWord = self.join(word)
+        return joined
 
     def getWords(self):
         """
             returns list of the word and all the alternate words
+            (a new list, changing it does not change the entry)
         """
-        if isinstance(self._word, str):
-            return [self._word]
-        else:
-            return self._word
- 
+        word = self._word
+        if isinstance(word, str):
+            return [word]
+        return list(word)
+
     def getDefi(self):
         """
             returns string of definition,
                 and all the alternate definitions
                 seperated by '|'
         """
-        if isinstance(self._defi, str):
-            return self._defi
-        else:
-            return self.join(self._defi)
+        defi = self._defi
+        if isinstance(defi, str):
+            return defi
+        defi = self._getTextDefi()
+        if isinstance(defi, str):
+            return defi
+        joined = self._joinedDefi
+        if joined is None:
+            joined = self._joinedDefi = self.join(defi)
+        return joined
 
     def getDefis(self):
         """
             returns list of the definition and all the alternate definitions
+            (a new list, changing it does not change the entry)
         """
-        if isinstance(self._defi, str):
-            return [self._defi]
-        else:
-            return self._defi
+        defi = self._defi
+        if isinstance(defi, str):
+            return [defi]
+        defi = self._getTextDefi()
+        if isinstance(defi, str):
+            return [defi]
+        return list(defi)
+
+    def _getTextDefi(self):
+        """
+            decodes bytes definitions in place, returns str or tuple of str
+        """
+        defi = self._defi
+        if isinstance(defi, bytes):
+            defi = self._defi = defi.decode('utf-8')
+        elif defi and isinstance(defi[0], bytes):
+            defi = self._defi = tuple([part.decode('utf-8') for part in defi])
+            self._joinedDefi = None
+        return defi
+
+    def isDefiBytes(self):
+        """
+            returns True if definitions are kept as bytes (not decoded)
+        """
+        defi = self._defi
+        if isinstance(defi, tuple):
+            return bool(defi) and isinstance(defi[0], bytes)
+        return isinstance(defi, bytes)
+
+    def getDefiBytes(self):
+        """
+            returns utf-8 bytes of getDefi(),
+                without decoding bytes definitions
+        """
+        defi = self._defi
+        if isinstance(defi, bytes):
+            return defi
+        if isinstance(defi, str):
+            return defi.encode('utf-8')
+        if defi and isinstance(defi[0], bytes):
+            sep = self.sep.encode('utf-8')
+            return sep.join([
+                part.replace(sep, b'\\'+sep)
+                for part in defi
+            ])
+        return self.getDefi().encode('utf-8')
+
+    def getDefisBytes(self):
+        """
+            returns list of utf-8 bytes of the definition and all the
+                alternate definitions, without decoding bytes definitions
+        """
+        defi = self._defi
+        if isinstance(defi, bytes):
+            return [defi]
+        if isinstance(defi, str):
+            return [defi.encode('utf-8')]
+        if defi and isinstance(defi[0], bytes):
+            return list(defi)
+        return [part.encode('utf-8') for part in defi]
 
     def getDefiFormat(self):
         """
@@ -102,9 +193,12 @@ class Entry(object):
         return self._defiFormat
 
     def addAlt(self, alt):
-        words = self.getWords()
-        words.append(alt)
-        self._word = words
+        word = self._word
+        if isinstance(word, str):
+            self._word = (word, alt)
+        else:
+            self._word = word + (alt,)
+        self._joinedWord = None
 
     def editFuncWord(self, func):
         """
@@ -112,12 +206,12 @@ class Entry(object):
             `func` must accept only one string as argument
             and return the modified string
         """
-        if isinstance(self._word, str):
-            self._word = func(self._word)
+        word = self._word
+        if isinstance(word, str):
+            self._word = func(word)
         else:
-            self._word = tuple(
-                func(st) for st in self._word
-            )
+            self._word = tuple([func(st) for st in word])
+            self._joinedWord = None
 
     def editFuncDefi(self, func):
         """
@@ -125,12 +219,14 @@ class Entry(object):
             `func` must accept only one string as argument
             and return the modified string
         """
-        if isinstance(self._defi, str):
-            self._defi = func(self._defi)
+        defi = self._defi
+        if not isinstance(defi, str):
+            defi = self._getTextDefi()
+        if isinstance(defi, str):
+            self._defi = func(defi)
         else:
-            self._defi = tuple(
-                func(st) for st in self._defi
-            )
+            self._defi = tuple([func(st) for st in defi])
+            self._joinedDefi = None
 
     def strip(self):
         """
@@ -143,23 +239,25 @@ class Entry(object):
         """
             replace string `source` with `target` in all words
         """
-        if isinstance(self._word, str):
-            self._word = self._word.replace(source, target)
+        word = self._word
+        if isinstance(word, str):
+            self._word = word.replace(source, target)
         else:
-            self._word = tuple(
-                st.replace(source, target) for st in self._word
-            )
+            self._word = tuple([st.replace(source, target) for st in word])
+            self._joinedWord = None
 
     def replaceInDefi(self, source, target):
         """
             replace string `source` with `target` in all definitions
         """
-        if isinstance(self._defi, str):
-            self._defi = self._defi.replace(source, target)
+        defi = self._defi
+        if not isinstance(defi, str):
+            defi = self._getTextDefi()
+        if isinstance(defi, str):
+            self._defi = defi.replace(source, target)
         else:
-            self._defi = tuple(
-                st.replace(source, target) for st in self._defi
-            )
+            self._defi = tuple([st.replace(source, target) for st in defi])
+            self._joinedDefi = None
 
     def replace(self, source, target):
         """
@@ -171,7 +269,8 @@ class Entry(object):
     def getRaw(self):
         """
             returns a tuple (word, defi) or (word, defi, defiFormat)
-            where both word and defi might be string or list of strings
+            where both word and defi might be string or tuple of strings
+            (and defi might be bytes or tuple of bytes, see getDefiBytes)
         """
         if self._defiFormat:
             return (
@@ -189,26 +288,14 @@ class Entry(object):
     def fromRaw(cls, rawEntry, defaultDefiFormat=None):
         """
             rawEntry can be (word, defi) or (word, defi, defiFormat)
-            where both word and defi can be string or list of strings
+            where both word and defi can be string or list (or tuple)
+            of strings
             if defiFormat is missing, defaultDefiFormat will be used
 
             creates and return an Entry object from `rawEntry` tuple
         """
-        word = rawEntry[0]
-        defi = rawEntry[1]
         try:
             defiFormat = rawEntry[2]
         except IndexError:
             defiFormat = defaultDefiFormat
-
-        if isinstance(word, tuple):
-            word = list(word)
-        if isinstance(defi, tuple):
-            defi = list(defi)
-
-        return cls(
-            word,
-            defi,
-            defiFormat = defiFormat,
-        )
-
+        return cls(rawEntry[0], rawEntry[1], defiFormat)
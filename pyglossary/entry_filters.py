@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import re
+from time import perf_counter
+from collections import OrderedDict as odict
 
 from .text_utils import (
     fixUtf8,
 )
+from .entry import Entry
 
 class EntryFilter(object):
     name = ''
@@ -19,6 +22,33 @@ class EntryFilter(object):
                 or return a new Entry object
         """
         return entry
+    def getStrFuncs(self):
+        """
+            returns (wordFunc, defiFunc) if this filter only edits every
+            word and every definition independently, where each one is
+            a function that takes and returns a string, or None (no edit)
+            returns None otherwise (then `run` is used by EntryFilterChain)
+        """
+        return None
+    def getDefiBytesCheck(self):
+        """
+            returns a function that takes a utf-8 encoded definition
+            (bytes) and returns True only if defiFunc of getStrFuncs
+            would not change it, or None
+            used in bytes mode (see Glossary.setBytesMode) to skip
+            decoding of definitions that don't need the edit
+        """
+        return None
+
+
+def _stripStr(st):
+    return st.strip().replace('\r', '')
+
+## str.strip also strips '\x1c' to '\x1f', bytes.strip does not
+stripBytesPattern = re.compile(rb'\A[\s\x1c-\x1f]|[\s\x1c-\x1f]\Z|\r')
+
+def _isStrippedBytes(defi):
+    return defi.isascii() and not stripBytesPattern.search(defi)
 
 class StripEntryFilter(EntryFilter):
     name = 'strip'
@@ -27,6 +57,10 @@ class StripEntryFilter(EntryFilter):
         entry.strip()
         entry.replace('\r', '')
         return entry
+    def getStrFuncs(self):
+        return _stripStr, _stripStr
+    def getDefiBytesCheck(self):
+        return _isStrippedBytes
 
 
 class NonEmptyWordFilter(EntryFilter):
@@ -51,6 +85,14 @@ class NonEmptyDefiFilter(EntryFilter):
             return
         return entry
 
+def _fixUtf8Fast(st):
+    if st.isascii():
+        return st.replace('\x00', '')
+    return fixUtf8(st)
+
+def _isFixedUtf8Bytes(defi):
+    return defi.isascii() and b'\x00' not in defi
+
 class FixUnicodeFilter(EntryFilter):
     name = 'fix_unicode'
     desc = 'Fix Unicode'
@@ -58,6 +100,10 @@ class FixUnicodeFilter(EntryFilter):
         entry.editFuncWord(fixUtf8)
         entry.editFuncDefi(fixUtf8)
         return entry
+    def getStrFuncs(self):
+        return _fixUtf8Fast, _fixUtf8Fast
+    def getDefiBytesCheck(self):
+        return _isFixedUtf8Bytes
 
 class LowerWordFilter(EntryFilter):
     name = 'lower_word'
@@ -65,6 +111,8 @@ class LowerWordFilter(EntryFilter):
     def run(self, entry):
         entry.editFuncWord(str.lower)
         return entry
+    def getStrFuncs(self):
+        return str.lower, None
 
 
 class LangEntryFilter(EntryFilter):
@@ -77,21 +125,42 @@ class LangEntryFilter(EntryFilter):
         #RLM = '\xe2\x80\x8f'
         ## defi = '\n'.join([RLM+line for line in defi.split('\n')]) ## for GoldenDict
         return entry
-    def run(self, entry):
+    def isPersian(self):
         langs = (self.glos.getInfo('sourceLang') + self.glos.getInfo('targetLang')).lower()
-        if 'persian' in langs or 'farsi' in langs:
+        return 'persian' in langs or 'farsi' in langs
+    def run(self, entry):
+        if self.isPersian():
             entry = self.run_fa(entry)
 
         return entry
+    def getStrFuncs(self):
+        ## languages are glossary-constant, so decide once
+        if self.isPersian():
+            from pyglossary.persian_utils import faEditStr
+            return faEditStr, faEditStr
+        return None, None
 
 
+## same as re.sub('[\r\n]+', '\n', st) followed by re.sub(' *\n *', '\n', st)
+cleanNewlinesPattern = re.compile(' *[\r\n]+ *')
+cleanDiamondsPattern = re.compile('♦\n+♦')
+## matches if cleanDefi may change an ascii definition
+cleanBytesPattern = re.compile(
+    rb'\r| \n|\n\n|\n |<p\Z|,\Z|\A[\s\x1c-\x1f]|[\s\x1c-\x1f]\Z'
+)
+
+def _isCleanBytes(defi):
+    return defi.isascii() and not cleanBytesPattern.search(defi)
+
 class CleanEntryFilter(EntryFilter):## FIXME
     name = 'clean'
     desc = 'Clean'
     def cleanDefi(self, st):
-        st = st.replace('♦  ', '♦ ')
-        st = re.sub('[\r\n]+', '\n', st)
-        st = re.sub(' *\n *', '\n', st)
+        hasDiamond = '♦' in st
+        if hasDiamond:
+            st = st.replace('♦  ', '♦ ')
+        if '\n' in st or '\r' in st:
+            st = cleanNewlinesPattern.sub('\n', st)
 
         """
         This code may correct snippets like:
@@ -108,7 +177,8 @@ class CleanEntryFilter(EntryFilter):## FIXME
                 st = replacePostSpaceChar(st, ch)
         """
 
-        st = re.sub('♦\n+♦', '♦', st)
+        if hasDiamond:
+            st = cleanDiamondsPattern.sub('♦', st)
         if st.endswith('<p'):
             st = st[:-2]
         st = st.strip()
@@ -120,4 +190,397 @@ class CleanEntryFilter(EntryFilter):## FIXME
     def run(self, entry):
         entry.editFuncDefi(self.cleanDefi)
         return entry
+    def getStrFuncs(self):
+        return None, self.cleanDefi
+    def getDefiBytesCheck(self):
+        return _isCleanBytes
+
+
+def composeStrFuncs(funcs):
+    """
+        returns a function that runs all functions of `funcs` in order
+        on a string, or None if there is no function
+    """
+    funcs = [func for func in funcs if func]
+    if not funcs:
+        return None
+    if len(funcs) == 1:
+        return funcs[0]
+    funcs = tuple(funcs)
+    def func(st):
+        for f in funcs:
+            st = f(st)
+        return st
+    return func
+
+
+def composeBytesChecks(checks):
+    """
+        returns a function that returns True if all functions of `checks`
+        return True for a bytes definition, or None if some is None
+    """
+    if None in checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+    def check(defi):
+        for c in checks:
+            if not c(defi):
+                return False
+        return True
+    return check
+
+
+class FilterStats(object):
+    """
+        counters of one filter in EntryFilterChain
+        changed and seconds are only counted with stats=True
+    """
+    def __init__(self, name, desc):
+        self.name = name
+        self.desc = desc
+        self.dropped = 0
+        self.changed = 0
+        self.seconds = 0.0
+
+    def toDict(self):
+        return odict([
+            ('name', self.name),
+            ('desc', self.desc),
+            ('dropped', self.dropped),
+            ('changed', self.changed),
+            ('seconds', self.seconds),
+        ])
+
+
+def _editDefi(entry, defiFunc, bytesCheck):
+    if not defiFunc:
+        return
+    if bytesCheck and entry.isDefiBytes():
+        for defi in entry.getDefisBytes():
+            if not bytesCheck(defi):
+                break
+        else:
+            return
+    entry.editFuncDefi(defiFunc)
+
+def _hasDefi(entry):
+    if entry.isDefiBytes():
+        return bool(entry.getDefiBytes())
+    return bool(entry.getDefi())
+
+
+class EntryFilterChain(object):
+    """
+        compiles a list of entry filters into a few steps:
+            - consecutive filters that only edit strings (see getStrFuncs)
+              are fused into one function for words and one for
+              definitions, so every entry is edited once per field
+            - NonEmptyWordFilter and NonEmptyDefiFilter become checks
+            - other filters are run with `filter.run(entry)`
+        glossary-constant decisions (like languages) are made once,
+        so the chain must be created after reading glossary info
+
+        stats=True: run filters one by one (not fused) and also count
+            changed entries and time of every filter
+        bytesMode=True: bytes definitions are only decoded to be edited
+            if some filter may change them (see getDefiBytesCheck),
+            and NonEmptyDefiFilter does not decode them
+        `run` gives the same result as running filters one by one
+    """
+    EDIT, CHECK_WORD, CHECK_DEFI, RUN, CHECK_DEFI_BYTES = range(5)
+
+    def __init__(self, filters, stats=False, bytesMode=False):
+        self.filters = list(filters)
+        self._bytesMode = bytesMode
+        self.stats = [
+            FilterStats(f.name, f.desc)
+            for f in self.filters
+        ]
+        self._statsMode = stats
+        self._filterSteps = [
+            self._compileFilter(entryFilter)
+            for entryFilter in self.filters
+        ]
+        if stats:
+            self._steps = None
+        else:
+            self._steps = self._fuseSteps(self._filterSteps)
+
+    def _compileFilter(self, entryFilter):
+        if isinstance(entryFilter, NonEmptyWordFilter):
+            return (self.CHECK_WORD, None, None)
+        if isinstance(entryFilter, NonEmptyDefiFilter):
+            if self._bytesMode:
+                return (self.CHECK_DEFI_BYTES, None, None)
+            return (self.CHECK_DEFI, None, None)
+        strFuncs = entryFilter.getStrFuncs()
+        if strFuncs is None:
+            return (self.RUN, entryFilter, None)
+        wordFunc, defiFunc = strFuncs
+        bytesCheck = None
+        if self._bytesMode and defiFunc:
+            bytesCheck = entryFilter.getDefiBytesCheck()
+        return (self.EDIT, wordFunc, (defiFunc, bytesCheck))
+
+    def _fuseSteps(self, filterSteps):
+        """
+            returns a list of (kind, arg1, arg2, filterIndex)
+        """
+        steps = []
+        wordFuncs = []
+        defiFuncs = []
+        bytesChecks = []
+        def flushEdits():
+            wordFunc = composeStrFuncs(wordFuncs)
+            defiFunc = composeStrFuncs(defiFuncs)
+            bytesCheck = composeBytesChecks(bytesChecks)
+            if wordFunc or defiFunc:
+                steps.append((
+                    self.EDIT,
+                    wordFunc,
+                    (defiFunc, bytesCheck),
+                    None,
+                ))
+            del wordFuncs[:]
+            del defiFuncs[:]
+            del bytesChecks[:]
+        for index, (kind, arg1, arg2) in enumerate(filterSteps):
+            if kind == self.EDIT:
+                wordFuncs.append(arg1)
+                defiFunc, bytesCheck = arg2
+                if defiFunc:
+                    defiFuncs.append(defiFunc)
+                    bytesChecks.append(bytesCheck)
+                continue
+            flushEdits()
+            steps.append((kind, arg1, arg2, index))
+        flushEdits()
+        return steps
+
+    def run(self, entry):
+        """
+            returns the filtered Entry object, or None to skip
+        """
+        if self._statsMode:
+            return self._runWithStats(entry)
+        for kind, arg1, arg2, index in self._steps:
+            if kind == self.EDIT:
+                if arg1:
+                    entry.editFuncWord(arg1)
+                _editDefi(entry, *arg2)
+            elif kind == self.CHECK_WORD:
+                if not entry.getWord():
+                    self.stats[index].dropped += 1
+                    return
+            elif kind == self.CHECK_DEFI:
+                if not entry.getDefi():
+                    self.stats[index].dropped += 1
+                    return
+            elif kind == self.CHECK_DEFI_BYTES:
+                if not _hasDefi(entry):
+                    self.stats[index].dropped += 1
+                    return
+            else:
+                entry = arg1.run(entry)
+                if not entry:
+                    self.stats[index].dropped += 1
+                    return
+        return entry
+
+    def _runWithStats(self, entry):
+        for index, (kind, arg1, arg2) in enumerate(self._filterSteps):
+            stats = self.stats[index]
+            t0 = perf_counter()
+            before = entry.getRaw()
+            if kind == self.EDIT:
+                if arg1:
+                    entry.editFuncWord(arg1)
+                _editDefi(entry, *arg2)
+            elif kind == self.CHECK_WORD:
+                if not entry.getWord():
+                    entry = None
+            elif kind == self.CHECK_DEFI:
+                if not entry.getDefi():
+                    entry = None
+            elif kind == self.CHECK_DEFI_BYTES:
+                if not _hasDefi(entry):
+                    entry = None
+            else:
+                entry = arg1.run(entry)
+            if not entry:
+                stats.dropped += 1
+            elif entry.getRaw() != before:
+                stats.changed += 1
+            stats.seconds += perf_counter() - t0
+            if not entry:
+                return
+        return entry
+
+    def getStats(self):
+        """
+            returns a list of dicts (one per filter, in order) with keys:
+            name, desc, dropped, changed, seconds
+        """
+        return [stats.toDict() for stats in self.stats]
+
+    def takeCounts(self):
+        """
+            returns counters of filters as a list of
+            (dropped, changed, seconds) tuples, and resets them
+            used to send counters of worker processes to the parent
+        """
+        counts = []
+        for stats in self.stats:
+            counts.append((stats.dropped, stats.changed, stats.seconds))
+            stats.dropped = 0
+            stats.changed = 0
+            stats.seconds = 0.0
+        return counts
+
+    def addCounts(self, counts):
+        """
+            adds counters returned by `takeCounts` (of another chain
+            with the same filters) to counters of this chain
+        """
+        for stats, (dropped, changed, seconds) in zip(self.stats, counts):
+            stats.dropped += dropped
+            stats.changed += changed
+            stats.seconds += seconds
+
+    def formatStats(self):
+        lines = ['%-16s %10s %10s %9s' % (
+            'filter',
+            'dropped',
+            'changed',
+            'seconds',
+        )]
+        for stats in self.stats:
+            lines.append('%-16s %10d %10s %9s' % (
+                stats.name,
+                stats.dropped,
+                stats.changed if self._statsMode else '-',
+                '%.3f' % stats.seconds if self._statsMode else '-',
+            ))
+        return '\n'.join(lines)
+
+
+class FilterGlossaryInfo(object):
+    """
+        a picklable stand-in for Glossary, used by entry filters
+        in worker processes, only provides info and preferences
+    """
+    def __init__(self, info, pref, infoKeysAliasDict):
+        self._info = odict(info)
+        self.pref = dict(pref)
+        self.infoKeysAliasDict = infoKeysAliasDict
+
+    def getInfo(self, key):
+        key = str(key)
+        try:
+            key = self.infoKeysAliasDict[key.lower()]
+        except KeyError:
+            pass
+        return self._info.get(key, '')
+
+    def getPref(self, name, default):
+        return self.pref.get(name, default)
+
+
+_workerChain = None
+
+def initFilterWorker(filterClasses, glosInfo, bytesMode=False, stats=False):
+    """
+        initializer of worker processes of the parallel filter stage
+        filterClasses: list of EntryFilter subclasses, in order
+        glosInfo: a FilterGlossaryInfo instance
+        bytesMode, stats: see EntryFilterChain
+    """
+    global _workerChain
+    _workerChain = EntryFilterChain(
+        [
+            cls(glosInfo)
+            for cls in filterClasses
+        ],
+        stats=stats,
+        bytesMode=bytesMode,
+    )
+
+def runFiltersOnRawBatch(rawEntries, defaultDefiFormat):
+    """
+        runs filters of the worker process on a list of raw entries
+        returns (rawEntries, counts): a list of raw entries (skipped
+        entries are left out) and counters of filters for this batch
+        (see EntryFilterChain.takeCounts)
+    """
+    result = []
+    run = _workerChain.run
+    for rawEntry in rawEntries:
+        entry = run(Entry.fromRaw(
+            rawEntry,
+            defaultDefiFormat=defaultDefiFormat,
+        ))
+        if entry:
+            result.append(entry.getRaw())
+    return result, _workerChain.takeCounts()
+
+
+def test_bytesMode():
+    glosInfo = FilterGlossaryInfo({}, {}, {})
+    filterClasses = [
+        StripEntryFilter,
+        NonEmptyWordFilter,
+        FixUnicodeFilter,
+        LowerWordFilter,
+        LangEntryFilter,
+        CleanEntryFilter,
+        NonEmptyWordFilter,
+        NonEmptyDefiFilter,
+    ]
+    defis = [
+        '  red fruit \n',
+        'red fruit\r\n',
+        '\r\nline 1 \r\n\r\n line 2\r',
+        'line 1\nline 2',
+        'a\x00b',
+        'ends with,',
+        'ends with <p',
+        '\x1cred\x1f',
+        '\xa0red fruit　',
+        '♦  red\n\n♦ fruit',
+        ' ',
+        'red fruit',
+    ]
+    for stats in (False, True):
+        chains = [
+            EntryFilterChain(
+                [cls(glosInfo) for cls in filterClasses],
+                stats=stats,
+                bytesMode=bytesMode,
+            )
+            for bytesMode in (False, True)
+        ]
+        for defi in defis + [defis[:2], defis[-2:]]:
+            if isinstance(defi, list):
+                defiBytes = [d.encode('utf-8') for d in defi]
+            else:
+                defiBytes = defi.encode('utf-8')
+            expected = chains[0].run(Entry('Word', defi))
+            result = chains[1].run(Entry('Word', defiBytes))
+            if expected is None:
+                assert result is None, (defi, result.getRaw())
+                continue
+            assert result.getWord() == expected.getWord(), defi
+            assert result.getDefiBytes() == expected.getDefiBytes(), (
+                defi,
+                result.getDefiBytes(),
+                expected.getDefiBytes(),
+            )
+    entry = chains[1].run(Entry('word', b'red fruit'))
+    assert entry.isDefiBytes(), entry.getRaw()
+    print('EntryFilterChain bytesMode: OK')
+
 
+if __name__ == '__main__':
+    test_bytesMode()
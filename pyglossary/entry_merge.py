@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+merging of sorted entry streams (from multiple input glossaries),
+with consolidation of entries that have the same headword
+
+works on raw entries (see Entry.getRaw), and keeps only one group of
+entries (with the same sort key) in memory at a time
+"""
+
+from heapq import merge
+from collections import OrderedDict as odict
+from html import escape as htmlEscape
+
+from .entry import Entry
+from .text_utils import toStr
+
+import logging
+log = logging.getLogger('root')
+
+
+mergePolicies = (
+    'concat',  # concatenate definitions, separated by `sep`
+    'alternates',  # keep definitions as alternate definitions
+    'first',  # keep the definition of the first input only
+)
+
+defaultMergeSep = {
+    'h': '\n<hr>\n',
+    'm': '\n\n',
+    'x': '\n\n',
+}
+
+
+def mergeSortedStreams(streams, key=None):
+    """
+        k-way merge of streams of raw entries, each sorted by `key`
+        of main word (key takes a word, like Glossary.sortWords)
+        the merge is stable: for equal keys, entries of the first
+        stream come first
+    """
+    return merge(*streams, key=Entry.getRawEntrySortKey(key))
+
+
+def _defiList(defi):
+    if isinstance(defi, (str, bytes)):
+        return [toStr(defi)]
+    return [toStr(part) for part in defi]
+
+
+def _plainToHtml(defi):
+    return htmlEscape(defi, quote=False).replace('\n', '<br>\n')
+
+
+def consolidateGroup(rawEntries, policy='concat', sep=None, defaultDefiFormat='m'):
+    """
+        rawEntries: list of raw entries with the same main word
+        returns one raw entry:
+            words: main word, and the union of alternate words
+            definitions: by `policy` (see mergePolicies)
+    """
+    if len(rawEntries) == 1:
+        return rawEntries[0]
+    words = []
+    wordSet = set()
+    defiFormats = []
+    defisList = []  # list of (defiFormat, list of defis)
+    for rawEntry in rawEntries:
+        word = rawEntry[0]
+        for w in ((word,) if isinstance(word, str) else word):
+            if w not in wordSet:
+                wordSet.add(w)
+                words.append(w)
+        defiFormat = rawEntry[2] if len(rawEntry) > 2 else None
+        defiFormat = defiFormat or defaultDefiFormat
+        defiFormats.append(defiFormat)
+        defisList.append((defiFormat, _defiList(rawEntry[1])))
+
+    if policy == 'first':
+        defiFormat, defis = defisList[0]
+    else:
+        if len(set(defiFormats)) == 1:
+            defiFormat = defiFormats[0]
+        elif 'h' in defiFormats:
+            defiFormat = 'h'
+        else:
+            defiFormat = defaultDefiFormat
+        defis = []
+        defiSet = set()
+        for itemFormat, itemDefis in defisList:
+            for defi in itemDefis:
+                if itemFormat != defiFormat and defiFormat == 'h':
+                    defi = _plainToHtml(defi)
+                if defi in defiSet:
+                    continue
+                defiSet.add(defi)
+                defis.append(defi)
+        if policy == 'concat':
+            if sep is None:
+                sep = defaultMergeSep.get(defiFormat, '\n\n')
+            defis = [sep.join(defis)]
+
+    word = words[0] if len(words) == 1 else words
+    defi = defis[0] if len(defis) == 1 else defis
+    return (word, defi, defiFormat)
+
+
+def consolidateEntries(
+    rawEntries,
+    key=None,
+    policy='concat',
+    sep=None,
+    defaultDefiFormat='m',
+    stats=None,
+):
+    """
+        rawEntries: iterable of raw entries sorted by `key` of main word
+        yields raw entries, consolidating those with the same main word
+        (see consolidateGroup)
+        entries with equal keys but different main words (for example
+        'Apple' and 'apple' with a case-insensitive key) are not merged
+        stats: a dict, 'merged' is set to the number of entries that were
+            merged into another entry
+    """
+    if policy not in mergePolicies:
+        raise ValueError('invalid merge policy %r' % policy)
+    rawKey = Entry.getRawEntrySortKey(key)
+    mainWordOf = Entry.getRawEntrySortKey(None)
+    mergedCount = 0
+    groupKey = None
+    group = odict()  # main word => list of raw entries
+    for rawEntry in rawEntries:
+        entryKey = rawKey(rawEntry)
+        if group and entryKey != groupKey:
+            for items in group.values():
+                mergedCount += len(items) - 1
+                yield consolidateGroup(
+                    items,
+                    policy=policy,
+                    sep=sep,
+                    defaultDefiFormat=defaultDefiFormat,
+                )
+            group = odict()
+        groupKey = entryKey
+        mainWord = mainWordOf(rawEntry)
+        try:
+            group[mainWord].append(rawEntry)
+        except KeyError:
+            group[mainWord] = [rawEntry]
+    for items in group.values():
+        mergedCount += len(items) - 1
+        yield consolidateGroup(
+            items,
+            policy=policy,
+            sep=sep,
+            defaultDefiFormat=defaultDefiFormat,
+        )
+    if stats is not None:
+        stats['merged'] = mergedCount
+
+
+def test_consolidateEntries():
+    streams = [
+        [('a', 'a1'), (['b', 'bb'], 'b1'), ('c', 'c1')],
+        [('b', 'b2', 'h'), ('c', 'c1')],
+        [('a', 'a3'), ('d', 'd3')],
+    ]
+    stats = {}
+    result = list(consolidateEntries(
+        mergeSortedStreams(streams),
+        stats=stats,
+    ))
+    assert result == [
+        ('a', 'a1\n\na3', 'm'),
+        (['b', 'bb'], 'b1\n<hr>\nb2', 'h'),
+        ('c', 'c1', 'm'),
+        ('d', 'd3'),
+    ], result
+    assert stats['merged'] == 3, stats
+    result = list(consolidateEntries(
+        mergeSortedStreams(streams),
+        policy='alternates',
+    ))
+    assert result[0] == ('a', ['a1', 'a3'], 'm'), result
+    result = list(consolidateEntries(
+        mergeSortedStreams(streams),
+        policy='first',
+    ))
+    assert result[1] == (['b', 'bb'], 'b1', 'm'), result
+    print('consolidateEntries: OK')
+
+
+if __name__ == '__main__':
+    test_consolidateEntries()
@@ -6,8 +6,9 @@ from itertools import (
 toBytes = lambda s: bytes(s, 'utf8') if isinstance(s, str) else bytes(s)
 
 def fileCountLines(filename, newline='\n'):
+    from .compression import compressionOpen
     newline = toBytes(newline)## required? FIXME
-    f = open(filename, 'rb')## or 'r'
+    f = compressionOpen(filename, 'rb')## or 'r'
     bufgen = takewhile(
         lambda x: x, (f.read(1024*1024) for _ in repeat(None))
     )
@@ -33,15 +33,20 @@ from os.path import (
     dirname,
     basename,
     abspath,
+    realpath,
 )
 
 from time import time as now
 import subprocess
+import shutil
 import re
 
 import pkgutil
 from collections import Counter
 from collections import OrderedDict as odict
+from collections import deque
+from itertools import islice
+from contextlib import nullcontext
 
 import io
 
@@ -50,10 +55,42 @@ from . import core
 from .core import userPluginsDir
 from .entry import Entry
 from .entry_filters import *
-from .sort_stream import hsortStreamList
+from .sort_stream import extSortStream
+from .sort_stream import defaultMemLimit as defaultSortMemLimit
+from .compact_data import CompactEntryList
+from .entry_merge import (
+    mergePolicies,
+    mergeSortedStreams,
+    consolidateEntries,
+)
+from .checkpoint import openResumable
+from .dedupe import (
+    dedupeKeys,
+    dedupePolicies,
+    dedupeEntries,
+    DedupeStats,
+)
+from .dedupe import defaultCapacity as defaultDedupeCapacity
+from .search_index import DefiSearchIndex
+from .pipeline import callInConsumer
+from .lookup import LRUCache
+from .lookup import defaultCacheSize as defaultLookupCacheSize
+from .plugin_manifest import (
+    getPluginMtime,
+    loadPluginsManifest,
+    savePluginsManifest,
+)
+from .compression import (
+    splitCompressionExt,
+    extractToTemp,
+    compressionOpen,
+    compressFile,
+    archiveFiles,
+)
 
 from .text_utils import (
     fixUtf8,
+    toStr,
 )
 from .os_utils import indir
 
@@ -61,6 +98,11 @@ from .os_utils import indir
 homePage = 'https://github.com/ilius/pyglossary'
 log = logging.getLogger('root')
 
+pluginsDir = join(dirname(__file__), 'plugins')
+
+# minimum time between two progress updates, in seconds
+progressMinInterval = 0.2
+
 file = io.BufferedReader
 
 
@@ -68,6 +110,34 @@ def get_ext(path):
     return splitext(path)[1].lower()
 
 
+def iterBuckets(iterable, size):
+    """
+    iterate over buckets (lists) of items of `iterable`, with size `size`
+    the last bucket may be shorter, or empty
+    """
+    bucket = []
+    for item in iterable:
+        if len(bucket) >= size:
+            yield bucket
+            bucket = []
+        bucket.append(item)
+    yield bucket
+
+
+class LazyPluginDict(dict):
+    """
+    dict of format => plugin module (or an attribute of plugin module)
+    the plugin module is imported on first access by `d[format]`
+    (`in`, `get` and iteration only see the imported plugins)
+    """
+    def __missing__(self, format):
+        if format in Glossary.pluginsInfo:
+            Glossary.importPlugin(format)
+            if format in self:
+                return dict.__getitem__(self, format)
+        raise KeyError(format)
+
+
 class Glossary(object):
     """
     Direct access to glos.data is droped
@@ -96,12 +166,14 @@ class Glossary(object):
         ##
         'license': 'copyright',
     }
-    plugins = {}  # format => pluginModule
+    plugins = LazyPluginDict()  # format => pluginModule
+    pluginsInfo = {}  # format => plugin metadata (dict)
     readFormats = []
     writeFormats = []
-    readFunctions = {}
-    readerClasses = {}
-    writeFunctions = {}
+    readFunctions = LazyPluginDict()
+    readerClasses = LazyPluginDict()
+    writeFunctions = LazyPluginDict()
+    lookupClasses = LazyPluginDict()
     formatsDesc = {}
     formatsExt = {}
     formatsReadOptions = {}
@@ -113,32 +185,105 @@ class Glossary(object):
     descFormat = {}
     descExt = {}
     extFormat = {}
+    pluginsLoadTime = 0.0  # seconds spent in loadPlugins
 
     @classmethod
     def loadPlugins(cls, directory):
         """
         executed on startup.  as name implies, loads plugins from directory
+
+        metadata of plugins is taken from the cached manifest if it's
+        up-to-date (see plugin_manifest), and plugin modules are imported
+        on first use (see importPlugin), otherwise all plugins are imported
+        and the manifest is updated
         """
         log.debug('loading plugins from directory: %r' % directory)
         if not isdir(directory):
             log.error('invalid plugin directory: %r' % directory)
             return
 
-        sys.path.append(directory)
-        for _, pluginName, _ in pkgutil.iter_modules([directory]):
-            cls.loadPlugin(pluginName)
-        sys.path.pop()
+        tm0 = now()
+        try:
+            cls._loadPlugins(directory)
+        finally:
+            cls.pluginsLoadTime += now() - tm0
 
     @classmethod
-    def loadPlugin(cls, pluginName):
+    def _loadPlugins(cls, directory):
+        mtimes = odict([
+            (pluginName, getPluginMtime(directory, pluginName))
+            for _, pluginName, _ in pkgutil.iter_modules([directory])
+        ])
+        pluginsInfo = loadPluginsManifest(directory, mtimes)
+        if pluginsInfo is not None:
+            for info in pluginsInfo:
+                if info.get('failed'):
+                    # import failed last time, try again
+                    cls.loadPlugin(info['module'], directory=directory)
+                else:
+                    cls.registerPlugin(info)
+            return
+
+        pluginsInfo = []
+        for pluginName in mtimes:
+            plugin = cls.loadPlugin(pluginName, directory=directory)
+            if plugin is None:
+                if pluginName not in sys.modules:
+                    pluginsInfo.append({
+                        'module': pluginName,
+                        'failed': True,
+                    })
+                continue
+            pluginsInfo.append(cls.pluginsInfo[plugin.format])
+        savePluginsManifest(directory, mtimes, pluginsInfo)
+
+    @staticmethod
+    def _importPluginModule(pluginName, directory=None):
+        """
+        imports plugin module from `directory` (or from sys.path)
+        plugins directory is also added to sys.path while importing,
+        so that plugins of other directories can import formats_common
+        """
+        if directory is None:
+            return __import__(pluginName)
+        paths = [directory]
+        if directory != pluginsDir:
+            paths.append(pluginsDir)
+        sys.path += paths
         try:
-            plugin = __import__(pluginName)
+            return __import__(pluginName)
+        finally:
+            del sys.path[-len(paths):]
+
+    @classmethod
+    def loadPlugin(cls, pluginName, directory=None):
+        """
+        imports and registers plugin module `pluginName`
+        directory: the plugin directory, or None if it is in sys.path
+        returns the module, or None if it's not an enabled plugin
+        """
+        try:
+            plugin = cls._importPluginModule(pluginName, directory)
         except Exception as e:
             log.exception('error while importing plugin %s' % pluginName)
             return
 
+        info = cls.getPluginInfo(plugin, directory=directory)
+        if not info:
+            return
+
+        cls.registerPlugin(info)
+        cls.setPluginModule(info, plugin)
+        return plugin
+
+    @classmethod
+    def getPluginInfo(cls, plugin, directory=None):
+        """
+        returns metadata of plugin module as a dict (JSON-serializable),
+        or None if plugin is disabled or not a plugin
+        """
         if (not hasattr(plugin, 'enable')) or (not plugin.enable):
-            log.debug('plugin disabled or not a plugin: %s' % pluginName)
+            log.debug('plugin disabled or not a plugin: %s' % plugin.__name__)
             return
 
         format = plugin.format
@@ -155,15 +300,7 @@ class Glossary(object):
         else:
             desc = '%s (%s)' % (format, extentions[0])
 
-        cls.plugins[format] = plugin
-        cls.descFormat[desc] = format
-        cls.descExt[desc] = extentions[0]
-        for ext in extentions:
-            cls.extFormat[ext] = format
-        cls.formatsExt[format] = extentions
-        cls.formatsDesc[format] = desc
-
-        hasReadSupport = False
+        hasReader = False
         try:
             Reader = plugin.Reader
         except AttributeError:
@@ -183,39 +320,120 @@ class Glossary(object):
                     )
                     break
             else:
-                cls.readerClasses[format] = Reader
-                hasReadSupport = True
+                hasReader = True
 
+        hasLookup = False
         try:
-            cls.readFunctions[format] = plugin.read
+            Lookup = plugin.Lookup
         except AttributeError:
             pass
         else:
-            hasReadSupport = True
+            for attr in (
+                '__init__',
+                'open',
+                'close',
+                'lookup',
+                'lookupPrefix',
+            ):
+                if not hasattr(Lookup, attr):
+                    log.error(
+                        'invalid Lookup class in "%s" plugin' % format +
+                        ', no "%s" method' % attr
+                    )
+                    break
+            else:
+                hasLookup = True
+
+        if directory is None:
+            if hasattr(plugin, '__path__'):  # package
+                directory = dirname(plugin.__path__[0])
+            else:
+                directory = dirname(plugin.__file__)
+
+        return {
+            'module': plugin.__name__,
+            'directory': directory,
+            'format': format,
+            'extentions': list(extentions),
+            'description': desc,
+            'hasReader': hasReader,
+            'hasRead': hasattr(plugin, 'read'),
+            'hasWrite': hasattr(plugin, 'write'),
+            'hasLookup': hasLookup,
+            'readOptions': list(getattr(plugin, 'readOptions', [])),
+            'writeOptions': list(getattr(plugin, 'writeOptions', [])),
+        }
 
-        if hasReadSupport:
+    @classmethod
+    def registerPlugin(cls, info):
+        """
+        registers a plugin by its metadata (see getPluginInfo)
+        without importing the plugin module
+        """
+        format = info['format']
+        extentions = tuple(info['extentions'])
+        desc = info['description']
+
+        cls.pluginsInfo[format] = info
+        cls.descFormat[desc] = format
+        cls.descExt[desc] = extentions[0]
+        for ext in extentions:
+            cls.extFormat[ext] = format
+        cls.formatsExt[format] = extentions
+        cls.formatsDesc[format] = desc
+
+        if info['hasReader'] or info['hasRead']:
             cls.readFormats.append(format)
             cls.readExt.append(extentions)
             cls.readDesc.append(desc)
-            cls.formatsReadOptions[format] = getattr(plugin, 'readOptions', [])
+            cls.formatsReadOptions[format] = info['readOptions']
 
-        if hasattr(plugin, 'write'):
-            cls.writeFunctions[format] = plugin.write
+        if info['hasWrite']:
             cls.writeFormats.append(format)
             cls.writeExt.append(extentions)
             cls.writeDesc.append(desc)
-            cls.formatsWriteOptions[format] = getattr(
-                plugin,
-                'writeOptions',
-                []
-            )
+            cls.formatsWriteOptions[format] = info['writeOptions']
 
+    @classmethod
+    def setPluginModule(cls, info, plugin):
+        format = info['format']
+        cls.plugins[format] = plugin
+        if info['hasReader']:
+            cls.readerClasses[format] = plugin.Reader
+        if info['hasRead']:
+            cls.readFunctions[format] = plugin.read
+        if info['hasWrite']:
+            cls.writeFunctions[format] = plugin.write
+        if info.get('hasLookup'):
+            cls.lookupClasses[format] = plugin.Lookup
+
+    @classmethod
+    def importPlugin(cls, format):
+        """
+        imports the plugin module of `format` if it's not imported yet
+        returns the module, or None if importing failed
+        """
+        if format in cls.plugins:
+            return cls.plugins[format]
+        info = cls.pluginsInfo[format]
+        log.debug('importing plugin %s' % info['module'])
+        try:
+            plugin = cls._importPluginModule(
+                info['module'],
+                info['directory'],
+            )
+        except Exception:
+            log.exception('error while importing plugin %s' % info['module'])
+            return
+        cls.setPluginModule(info, plugin)
         return plugin
 
     def clear(self):
         self._info = odict()
 
         self._data = []
+        self._compactData = False
+        self._searchIndex = None
 
         try:
             readers = self._readers
@@ -229,15 +447,46 @@ class Glossary(object):
                     log.exception('')
         self._readers = []
 
+        # temp directories of decompressed input files used by readers
+        for tmpDir in getattr(self, '_tmpDirs', []):
+            shutil.rmtree(tmpDir, ignore_errors=True)
+        self._tmpDirs = []
+
+        # stops the producer thread of pipeline (if any) now,
+        # if the writer has not iterated over all entries
+        if getattr(self, '_iter', None) is not None:
+            try:
+                self._iter.close()
+            except Exception:
+                log.exception('')
         self._iter = None
         self._entryFilters = []
         self._sortKey = None
-        self._sortCacheSize = 1000
+        self._sortCacheSize = None
+        self._sortMemLimit = None
+        self._mergePolicy = None
+        self._mergeSep = None
+        self._dedupeKey = None
+        self._dedupePolicy = 'drop'
+        self._writerCheckpointFunc = None
+        self._readerPos = [0, 0]  # reader index, number of entries read
 
         self._filename = ''
         self.resPath = ''
         self._defaultDefiFormat = 'm'
         self._progressbar = True
+        self._progressStartTime = 0
+        self._progressLastTime = 0
+
+        self._filterWorkers = 0
+        self._filterBatchSize = 1000
+        self._pipelineQueueSize = 0  # 0 means no pipeline
+        self._pipelineBatchSize = None
+        self._bytesMode = False
+
+        self.closeLookup()
+        self._lookupArgs = None
+        self._lookupCache = LRUCache(defaultLookupCacheSize)
 
     def __init__(self, info=None, ui=None):
         """
@@ -246,6 +495,20 @@ class Glossary(object):
               we will not reference to it
         """
         self.clear()
+        self._iterEntryCount = 0
+        self._filterChain = None
+        self._filterStats = False
+        self._profiler = None
+        self._memProfiler = None
+        self._mergeStats = {}
+        self._dedupeStats = None
+        self._checkpointer = None
+        self._resume = None
+        self._resumeSeek = False
+        self._incremental = None
+        self._incrementalStats = None
+        self._pipelineStats = None
+        self._outputFiles = []
         if info:
             if not isinstance(info, (dict, odict)):
                 raise TypeError(
@@ -314,39 +577,335 @@ class Glossary(object):
         if progressbar:
             self.progressEnd()
 
+    def _readerProgressFunc(self, reader):
+        """
+        returns a function that takes the index of current entry
+        and updates progress of reading from `reader`, or None
+
+        if reader has `byteProgress` method, progress is based on
+        the number of input bytes consumed, otherwise on `len(reader)`
+        """
+        if not (self.ui and self._progressbar):
+            return None
+        if hasattr(reader, 'byteProgress'):
+            return lambda index: self.progressBytes(
+                index,
+                *(reader.byteProgress() or (0, 0))
+            )
+        try:
+            wordCount = len(reader)
+        except Exception:
+            log.exception('')
+            return None
+        if not wordCount:
+            return None
+        return lambda index: self.progress(index, wordCount)
+
     def _readersEntryGen(self):
-        for reader in self._readers:
-            wordCount = 0
-            progressbar = False
-            if self.ui and self._progressbar:
-                try:
-                    wordCount = len(reader)
-                except Exception:
-                    log.exception('')
-                if wordCount:
-                    progressbar = True
-            if progressbar:
-                self.progressInit('Converting')
-            try:
-                for index, entry in enumerate(reader):
-                    yield entry
-                    if progressbar:
-                        self.progress(index, wordCount)
-            finally:
+        startIndex, skip, token = 0, 0, None
+        if self._resumeSeek:
+            startIndex, skip, token = self._resume['reader']
+        for readerIndex, reader in enumerate(self._readers):
+            if readerIndex < startIndex:
                 reader.close()
-            if progressbar:
-                self.progressEnd()
+                continue
+            self._readerPos = [readerIndex, 0]
+            if readerIndex == startIndex and skip:
+                yield from self._readerEntryGen(reader, skip, token)
+            else:
+                yield from self._readerEntryGen(reader)
+
+    def _readerEntryGen(self, reader, skip=0, token=None):
+        """
+        skip: number of entries to skip (when resuming from checkpoint)
+        token: position token of reader (from `reader.getPosToken`)
+            after `skip` entries, to seek instead of skipping, or None
+        """
+        progressFunc = self._readerProgressFunc(reader)
+        if progressFunc:
+            self.progressInit('Converting')
+        tm0 = now()
+        index = -1
+        readerPos = self._readerPos
+        try:
+            it = iter(self._profileIter(
+                reader,
+                'read iteration',
+                type(reader).__module__.split('.')[0],
+            ))
+            if skip:
+                if token is not None and hasattr(reader, 'setPosToken'):
+                    reader.setPosToken(token)
+                else:
+                    log.info('Skipping %s entries of input' % skip)
+                    for _ in islice(it, skip):
+                        pass
+            index = skip - 1
+            for index, entry in enumerate(it, skip):
+                readerPos[1] = index + 1
+                yield entry
+                if progressFunc:
+                    progressFunc(index)
+            self._logReadSpeed(reader, index + 1, now() - tm0)
+        finally:
+            reader.close()
+        if progressFunc:
+            self.progressEnd()
 
-    def _applyEntryFiltersGen(self, gen):
+    def _logReadSpeed(self, reader, count, seconds):
+        seconds = max(seconds, 0.001)
+        msg = 'Read %s entries in %.1f seconds (%d entries/s' % (
+            count,
+            seconds,
+            count / seconds,
+        )
+        try:
+            progress = reader.byteProgress()
+        except AttributeError:
+            progress = None
+        if progress:
+            msg += ', %.2f MB/s' % (progress[1] / seconds / 1024**2)
+        log.info(msg + ')')
+
+    def setCompactData(self, compact=True, compressDefi=False):
+        """
+        compact (bool): keep entries of indirect mode in a CompactEntryList
+            (utf-8 bytes packed into large buffers) instead of a list
+            of tuples, which uses a lot less memory
+        compressDefi (bool): keep definitions zlib-compressed per block,
+            which uses even less memory, but iterating is slower
+        """
+        if compact:
+            data = CompactEntryList(compressDefi=compressDefi)
+        else:
+            data = []
+        for rawEntry in self._data:
+            data.append(rawEntry)
+        self._data = data
+        self._compactData = compact
+        self._searchIndex = None
+
+    def setFilterWorkers(self, workers, batchSize=None):
+        """
+        workers (int): number of worker processes to run entry filters in,
+            0 or 1 to run filters in the main process (default)
+        batchSize (int or None): number of entries sent to a worker at once
+        must be called before `read`
+        """
+        self._filterWorkers = workers or 0
+        if batchSize:
+            self._filterBatchSize = batchSize
+
+    def setPipeline(self, queueSize=None, batchSize=None):
+        """
+        enables the threaded pipeline: reading, entry filters (and sort,
+        dedupe, ...) run in a producer thread, and the writer takes entries
+        from a bounded queue (see pipeline.py)
+        queueSize (int or None): maximum number of batches in the queue,
+            None for default, 0 to disable the pipeline
+        batchSize (int or None): number of entries in each batch
+        progress of reading is updated in the writer thread, when it
+            takes a batch of entries or waits for one (see callInConsumer)
+        must be called before `write` (or iterating)
+        """
+        from .pipeline import defaultQueueSize, defaultBatchSize
+        if queueSize is None:
+            queueSize = defaultQueueSize
+        self._pipelineQueueSize = max(0, queueSize)
+        self._pipelineBatchSize = batchSize or defaultBatchSize
+
+    def getPipelineStats(self):
+        """
+        returns dict of pipeline statistics of the last iteration, or None
+        including queue depth (average and max), and the time that the
+        producer was blocked by a full queue, or the consumer (writer)
+        waited for entries
+        """
+        if self._pipelineStats is None:
+            return None
+        return self._pipelineStats.toDict()
+
+    def _pipelineEntriesGen(self, gen):
+        from .pipeline import pipelineIter, PipelineStats
+        stats = self._pipelineStats = PipelineStats(
+            self._pipelineQueueSize,
+            self._pipelineBatchSize,
+        )
+        yield from pipelineIter(
+            gen,
+            queueSize=stats.queueSize,
+            batchSize=stats.batchSize,
+            stats=stats,
+        )
+        log.info('Pipeline: ' + stats.format())
+
+    def setBytesMode(self, bytesMode=True):
+        """
+        bytesMode (bool): readers that support it (like StarDict, DictOrg,
+            OctopusMdict and Sdict) give definitions as utf-8 bytes,
+            entry filters only decode definitions they may change
+            (see EntryFilter.getDefiBytesCheck), and writers that support
+            it (like StarDict and DictOrg) write them without decoding
+            and encoding again, so the output is the same as without it
+            other filters and writers get str definitions, decoded on
+            first use (see Entry.getDefiBytes)
+        must be called before `read`
+        """
+        self._bytesMode = bytesMode
+
+    def getBytesMode(self):
+        return self._bytesMode
+
+    def setFilterStats(self, stats=True):
+        """
+        stats (bool): count changed entries and time of every entry filter
+            (filters are run one by one, which is a little slower)
+            number of dropped entries is always counted
+            not supported with filter workers (see setFilterWorkers)
+        """
+        self._filterStats = stats
+
+    def getFilterStats(self):
+        """
+        returns stats of entry filters of the last iteration
+        (see EntryFilterChain.getStats), or None
+        """
+        if self._filterChain is None:
+            return None
+        return self._filterChain.getStats()
+
+    def setProfiler(self, profiler):
+        """
+        profiler: a ConvertProfiler instance (see profiler.py), or None
+        """
+        self._profiler = profiler
+
+    def _profileStage(self, name, plugin=None):
+        if self._profiler is None:
+            return nullcontext()
+        return self._profiler.stage(name, plugin)
+
+    def _profileIter(self, iterable, name, plugin=None):
+        if self._profiler is None:
+            return iterable
+        return self._profiler.timedIter(iterable, name, plugin)
+
+    def setMemoryProfiler(self, memProfiler):
+        """
+        memProfiler: a MemoryProfiler instance (see profiler.py), or None
+        """
+        self._memProfiler = memProfiler
+
+    def _memoryPhase(self, name):
+        if self._memProfiler is None:
+            return nullcontext()
+        return self._memProfiler.phase(name)
+
+    def _memoryPhaseIter(self, iterable, name):
+        if self._memProfiler is None:
+            return iterable
+        return self._memProfiler.phaseIter(iterable, name)
+
+    def _pluginModuleName(self, format):
+        return self.pluginsInfo[format]['module']
+
+    def _newFilterChain(self):
+        # created on first iteration, after reader has set info
+        chain = self._filterChain = EntryFilterChain(
+            self._entryFilters,
+            stats=self._filterStats,
+            bytesMode=self._bytesMode,
+        )
+        return chain
+
+    def _applyEntryFiltersGen(self, gen, chain=None):
+        """
+        chain: EntryFilterChain to use, to share one chain (and its stats)
+            between inputs in merge mode, then stats are not logged here
+        """
+        if self._filterWorkers > 1 and self._entryFilters:
+            yield from self._applyEntryFiltersPoolGen(gen, chain)
+            return
+        ownChain = chain is None
+        if ownChain:
+            chain = self._newFilterChain()
+        run = chain.run
         for entry in gen:
             if not entry:
                 continue
-            for entryFilter in self._entryFilters:
-                entry = entryFilter.run(entry)
-                if not entry:
-                    break
-            else:
+            entry = run(entry)
+            if entry:
                 yield entry
+        if ownChain:
+            self._logFilterStats(chain)
+
+    def _logFilterStats(self, chain):
+        if self._filterStats:
+            log.info('Entry filters:\n' + chain.formatStats())
+        else:
+            log.debug('Entry filters:\n' + chain.formatStats())
+
+    def _applyEntryFiltersPoolGen(self, gen, chain=None):
+        """
+        runs entry filters on batches of entries in a process pool
+        and yields the results in the original order
+        the output is the same as _applyEntryFiltersGen in serial mode
+        counters of filters in worker processes are added to `chain`
+        (or self._filterChain), which does not run any entry itself
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        ownChain = chain is None
+        if ownChain:
+            chain = self._newFilterChain()
+        workers = self._filterWorkers
+        defaultDefiFormat = self._defaultDefiFormat
+        glosInfo = FilterGlossaryInfo(
+            self._info,
+            getattr(self.ui, 'pref', {}),
+            self.infoKeysAliasDict,
+        )
+        log.info(
+            'running entry filters in %s processes' % workers +
+            ', batch size: %s' % self._filterBatchSize
+        )
+        pending = deque()
+        # keep a bounded number of batches in flight, for back-pressure
+        maxPending = workers * 2
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=initFilterWorker,
+            initargs=(
+                [type(f) for f in self._entryFilters],
+                glosInfo,
+                self._bytesMode,
+                self._filterStats,
+            ),
+        ) as pool:
+            for bucket in iterBuckets(gen, self._filterBatchSize):
+                rawEntries = [
+                    entry.getRaw()
+                    for entry in bucket
+                    if entry
+                ]
+                if not rawEntries:
+                    continue
+                pending.append(pool.submit(
+                    runFiltersOnRawBatch,
+                    rawEntries,
+                    defaultDefiFormat,
+                ))
+                while len(pending) >= maxPending:
+                    yield from self._takeFilterBatch(pending.popleft(), chain)
+            while pending:
+                yield from self._takeFilterBatch(pending.popleft(), chain)
+        if ownChain:
+            self._logFilterStats(chain)
+
+    def _takeFilterBatch(self, future, chain):
+        rawEntries, counts = future.result()
+        chain.addCounts(counts)
+        for rawEntry in rawEntries:
+            yield Entry.fromRaw(rawEntry)
 
     def __iter__(self):
         if self._iter is None:
@@ -367,13 +926,7 @@ class Glossary(object):
                     print(entry.getWord())
                 print('-----------------')
         """
-        bucket = []
-        for entry in self:
-            if len(bucket) >= size:
-                yield bucket
-                bucket = []
-            bucket.append(entry)
-        yield bucket
+        return iterBuckets(self, size)
 
     def setDefaultDefiFormat(self, defiFormat):
         self._defaultDefiFormat = defiFormat
@@ -470,6 +1023,23 @@ class Glossary(object):
                       or '' to detect from file extention
         direct (bool): enable direct mode
         """
+        with self._memoryPhase('read'):
+            return self._read(
+                filename,
+                format=format,
+                direct=direct,
+                progressbar=progressbar,
+                **options
+            )
+
+    def _read(
+        self,
+        filename,
+        format='',
+        direct=False,
+        progressbar=True,
+        **options
+    ):
         filename = abspath(filename)
 
         # don't allow direct=False when there are readers
@@ -482,68 +1052,23 @@ class Glossary(object):
 
         self.updateEntryFilters()
         ###
-        delFile = False
+        inputFilename = filename
+        filename, compressionExt = splitCompressionExt(filename)
         ext = get_ext(filename)
-        if ext in ('.gz', '.bz2', '.zip'):
-            if ext == '.bz2':
-                output, error = subprocess.Popen(
-                    ['bzip2', '-dk', filename],
-                    stdout=subprocess.PIPE,
-                ).communicate()
-                # -k ==> keep original bz2 file
-                # bunzip2 ~= bzip2 -d
-                if error:
-                    log.error(
-                        error + '\n' +
-                        'failed to decompress file "%s"' % filename
-                    )
-                    return False
-                else:
-                    filename = filename[:-4]
-                    ext = get_ext(filename)
-                    delFile = True
-            elif ext == '.gz':
-                output, error = subprocess.Popen(
-                    ['gzip', '-dc', filename],
-                    stdout=subprocess.PIPE,
-                ).communicate()
-                # -c ==> write to stdout (we want to keep original gz file)
-                # gunzip ~= gzip -d
-                if error:
-                    log.error(
-                        error + '\n' +
-                        'failed to decompress file "%s"' % filename
-                    )
-                    return False
-                else:
-                    filename = filename[:-3]
-                    open(filename, 'w').write(output)
-                    ext = get_ext(filename)
-                    delFile = True
-            elif ext == '.zip':
-                output, error = subprocess.Popen(
-                    ['unzip', filename, '-d', dirname(filename)],
-                    stdout=subprocess.PIPE,
-                ).communicate()
-                if error:
-                    log.error(
-                        error + '\n' +
-                        'failed to decompress file "%s"' % filename
-                    )
-                    return False
-                else:
-                    filename = filename[:-4]
-                    ext = get_ext(filename)
-                    delFile = True
         if not format:
             for key in Glossary.formatsExt.keys():
                 if ext in Glossary.formatsExt[key]:
                     format = key
             if not format:
-                # if delFile:
-                #    os.remove(filename)
                 log.error('Unknown extension "%s" for read support!' % ext)
                 return False
+        if self._profiler:
+            self._profiler.info['inputFormat'] = format
+        with self._profileStage('plugin load'):
+            plugin = self.importPlugin(format)
+        if plugin is None:
+            log.error('failed to load plugin of %s format' % format)
+            return False
         validOptionKeys = self.formatsReadOptions[format]
         for key in list(options.keys()):
             if key not in validOptionKeys:
@@ -562,6 +1087,22 @@ class Glossary(object):
             self.setInfo('name', split(filename)[1])
         self._progressbar = progressbar
 
+        tmpDir = ''
+        if compressionExt:
+            if getattr(plugin, 'readCompressed', False):
+                # plugin decompresses on the fly, using compressionOpen
+                filename = inputFilename
+            else:
+                try:
+                    with self._profileStage('decompress'):
+                        filename, tmpDir = extractToTemp(inputFilename)
+                except Exception:
+                    log.exception(
+                        'failed to decompress file "%s"' % inputFilename
+                    )
+                    return False
+                log.debug('decompressed into temp file "%s"' % filename)
+
         try:
             Reader = self.readerClasses[format]
         except KeyError:
@@ -570,26 +1111,42 @@ class Glossary(object):
                     'no `Reader` class found in %s plugin' % format +
                     ', falling back to indirect mode'
                 )
-            result = self.readFunctions[format].__call__(
-                self,
-                filename,
-                **options
-            )
-            # if not result:## FIXME
-            #    return False
-            if delFile:
-                os.remove(filename)
+            try:
+                with self._profileStage(
+                    'read iteration',
+                    self._pluginModuleName(format),
+                ):
+                    result = self.readFunctions[format].__call__(
+                        self,
+                        filename,
+                        **options
+                    )
+                # if not result:## FIXME
+                #    return False
+            finally:
+                if tmpDir:
+                    shutil.rmtree(tmpDir, ignore_errors=True)
         else:
             reader = Reader(self)
-            reader.open(filename, **options)
+            with self._profileStage(
+                'reader open',
+                self._pluginModuleName(format),
+            ):
+                reader.open(filename, **options)
             if direct:
                 self._readers.append(reader)
+                if tmpDir:
+                    self._tmpDirs.append(tmpDir)
                 log.info(
                     'using Reader class from %s plugin' % format +
                     ' for direct conversion without loading into memory'
                 )
             else:
-                self.loadReader(reader)
+                try:
+                    self.loadReader(reader)
+                finally:
+                    if tmpDir:
+                        shutil.rmtree(tmpDir, ignore_errors=True)
 
         self._updateIter()
 
@@ -600,26 +1157,25 @@ class Glossary(object):
         iterates over `reader` object and loads the whole data into self._data
         must call `reader.open(filename)` before calling this function
         """
-        wordCount = 0
-        progressbar = False
-        if self.ui and self._progressbar:
-            try:
-                wordCount = len(reader)
-            except Exception:
-                log.exception('')
-            if wordCount:
-                progressbar = True
-        if progressbar:
+        progressFunc = self._readerProgressFunc(reader)
+        if progressFunc:
             self.progressInit('Reading')
+        tm0 = now()
+        index = -1
         try:
-            for index, entry in enumerate(reader):
+            for index, entry in enumerate(self._profileIter(
+                reader,
+                'read iteration',
+                type(reader).__module__.split('.')[0],
+            )):
                 if entry:
                     self.addEntryObj(entry)
-                if progressbar:
-                    self.progress(index, wordCount)
+                if progressFunc:
+                    progressFunc(index)
+            self._logReadSpeed(reader, index + 1, now() - tm0)
         finally:
             reader.close()
-        if progressbar:
+        if progressFunc:
             self.progressEnd()
 
         return True
@@ -630,8 +1186,9 @@ class Glossary(object):
         closes readers
         and sets self._readers to []
         """
-        for reader in self._readers:
-            self.loadReader(reader)
+        with self._memoryPhase('direct mode inactivation'):
+            for reader in self._readers:
+                self.loadReader(reader)
         self._readers = []
 
     def _updateIter(self, sort=False):
@@ -641,36 +1198,442 @@ class Glossary(object):
             1- Wheather or not direct mode is On (self._readers not empty)
                 or Off (self._readers empty)
             2- Wheather sort is True, and if it is,
-                checks for self._sortKey and self._sortCacheSize
+                checks for self._sortKey, self._sortCacheSize
+                and self._sortMemLimit
+        """
+        if self._readers:  # direct mode
+            if self._mergePolicy:
+                gen = self._mergedReadersEntryGen()
+            elif sort:
+                gen = self._sortedReadersEntryGen()
+            else:
+                gen = self._readersEntryGen()
+        else:
+            gen = self._profileIter(self._loadedEntryGen(), 'data iteration')
+
+        if not (self._readers and self._mergePolicy):
+            # in merge mode, entry filters run on inputs before merging
+            gen = self._profileIter(
+                self._applyEntryFiltersGen(gen),
+                'filter chain',
+            )
+        if self._dedupeKey:
+            gen = self._profileIter(self._dedupeEntriesGen(gen), 'dedupe')
+        if self._incremental:
+            gen = self._profileIter(
+                self._incrementalEntriesGen(gen),
+                'incremental',
+            )
+        if self._pipelineQueueSize:
+            gen = self._profileIter(
+                self._pipelineEntriesGen(gen),
+                'pipeline wait',
+            )
+
+        # can resume by seeking (or skipping) in readers, otherwise
+        # the entries (after sort, dedupe, ...) are skipped
+        # incremental mode needs to see the skipped entries too
+        seekable = bool(self._readers) and not (
+            sort or
+            self._mergePolicy or
+            self._dedupeKey or
+            self._incremental or
+            self._pipelineQueueSize or
+            self._filterWorkers > 1
+        )
+        self._resumeSeek = bool(
+            seekable and
+            self._resume and
+            self._resume['reader']
+        )
+        self._iterEntryCount = 0
+        if self._resumeSeek:
+            self._iterEntryCount = self._resume['entryCount']
+        gen = self._countEntriesGen(gen)
+        if self._checkpointer:
+            gen = self._checkpointEntriesGen(gen, seekable)
+        self._iter = gen
+
+    def _countEntriesGen(self, gen):
+        for entry in gen:
+            self._iterEntryCount += 1
+            yield entry
+
+    def setCheckpointer(self, checkpointer, resume=None):
+        """
+        checkpointer: a Checkpointer instance (see checkpoint.py), or None
+        resume: data of the checkpoint to resume from, or None
+        must be called before `write`
+        """
+        self._checkpointer = checkpointer
+        self._resume = resume
+
+    def setWriterCheckpoint(self, func):
+        """
+        for writer plugins that support checkpoints
+        func: takes no arguments, and returns (state, files)
+            state: JSON-serializable state of the writer, after writing
+                all the entries it has got so far
+            files: list of open output files, that are flushed and
+                fsync'd, and their sizes are kept in checkpoint
+        """
+        self._writerCheckpointFunc = func
+
+    def getWriterResume(self):
+        """
+        for writer plugins that support checkpoints
+        returns None if not resuming from a checkpoint, otherwise a dict:
+            'state': state of the writer at checkpoint
+            'sizes': dict of absolute file path => file size at checkpoint
+        open output files with checkpoint.openResumable
+        """
+        if self._resume is None:
+            return None
+        return self._resume['writer']
+
+    def addOutputFile(self, path):
+        """
+        for writer plugins that write other files (or directories) than
+        the `filename` given to their `write` function, like StarDict's
+        .idx, .dict.dz and .syn files and res directory
+        those files are put in the same archive with the output file
+        (for .gz, .bz2, .xz and .zip output), and in result cache
+        """
+        path = realpath(path)
+        if path not in self._outputFiles:
+            self._outputFiles.append(path)
+
+    def getOutputFiles(self):
+        """
+        returns the list of files (or directories) written by the last
+        `write`: its output file and those added with `addOutputFile`
+        (only those that exist, and not those inside another one)
+        """
+        paths = []
+        for path in self._outputFiles:
+            if not os.path.exists(path):
+                continue
+            if any(
+                path.startswith(other + os.sep)
+                for other in self._outputFiles
+            ):
+                continue
+            paths.append(path)
+        return paths
+
+    def _saveCheckpoint(self, seekable):
+        """
+        returns False if the writer does not support checkpoints
+        """
+        if self._writerCheckpointFunc is None:
+            return False
+        state, files = self._writerCheckpointFunc()
+        sizes = {}
+        for fp in files:
+            fp.flush()
+            os.fsync(fp.fileno())
+            sizes[abspath(fp.name)] = fp.tell()
+        reader = None
+        if seekable:
+            readerIndex, entryIndex = self._readerPos
+            token = None
+            try:
+                getPosToken = self._readers[readerIndex].getPosToken
+            except (IndexError, AttributeError):
+                pass
+            else:
+                token = getPosToken()
+            reader = [readerIndex, entryIndex, token]
+        self._checkpointer.save(
+            self._iterEntryCount,
+            reader,
+            {
+                'state': state,
+                'sizes': sizes,
+            },
+        )
+        log.debug('checkpoint saved at entry %s' % self._iterEntryCount)
+        return True
+
+    def _checkpointEntriesGen(self, gen, seekable):
+        """
+        saves checkpoints between entries, when the writer has written
+        all entries it has got so far
+        """
+        checkpointer = self._checkpointer
+        resume = self._resume
+        it = iter(gen)
+        if resume:
+            log.info(
+                'Resuming from checkpoint at entry %s' % resume['entryCount']
+            )
+            if not self._resumeSeek:
+                for _ in islice(it, resume['entryCount']):
+                    pass
+        while True:
+            if checkpointer and checkpointer.due():
+                if not self._saveCheckpoint(seekable):
+                    log.warning('writer does not support checkpoints')
+                    checkpointer = None
+            try:
+                entry = next(it)
+            except StopIteration:
+                return
+            yield entry
+
+    def setIncremental(self, state):
+        """
+        state: an IncrementalState instance (see incremental.py), or None
+        must be called before `write`
+        """
+        self._incremental = state
+
+    def getWorkCache(self, name, options=None):
+        """
+        for writer plugins, to reuse work of unchanged entries from the
+        previous run in incremental mode
+        returns None if not in incremental mode, otherwise a WorkCache:
+            key = cache.getKey(entry)
+            value = cache.get(key)  # None if not cached
+            cache.put(key, value)
+        name: name of the cache, usually the plugin name
+        options: JSON-serializable options of the writer that affect
+            the cached values
+        """
+        if self._incremental is None:
+            return None
+        return self._incremental.getWorkCache(name, options)
+
+    def getIncrementalStats(self):
+        """
+        returns dict of the last incremental conversion, or None
+        'unchanged', 'changed', 'added', 'deleted': number of entries
+        """
+        if self._incrementalStats is None:
+            return None
+        return self._incrementalStats.toDict()
+
+    def _incrementalEntriesGen(self, gen):
+        check = self._incremental.check
+        for entry in gen:
+            check(entry)
+            yield entry
+
+    def getIterEntryCount(self):
+        """
+        returns the number of entries yielded by iterating over glossary
+        (after entry filters), for example number of entries written
+        by the last `write`
+        """
+        return self._iterEntryCount
+
+    def _sortedReadersEntryGen(self):
+        """
+        sorts entries of `self._readers` using external merge sort
+        memory usage is bounded by self._sortMemLimit (in megabytes),
+        and sorted runs are spilled into temporary files
+        """
+        log.info(
+            'stream sorting enabled, memory limit: %s MB' % (
+                self._sortMemLimit or defaultSortMemLimit
+            ) + (
+                ', cache size: %s' % self._sortCacheSize
+                if self._sortCacheSize else ''
+            )
+        )
+        defaultDefiFormat = self._defaultDefiFormat
+        # only sort by main word, or list of words + alternates? FIXME
+        for rawEntry in self._profileIter(self._memoryPhaseIter(extSortStream(
+            (
+                entry.getRaw()
+                for entry in self._readersEntryGen()
+                if entry
+            ),
+            key=Entry.getRawEntrySortKey(self._sortKey),
+            memLimit=self._sortMemLimit,
+            maxRunLen=self._sortCacheSize,
+        ), 'sort'), 'sort'):
+            yield Entry.fromRaw(
+                rawEntry,
+                defaultDefiFormat=defaultDefiFormat,
+            )
+
+    def setMerge(self, policy='concat', sep=None):
+        """
+        enables merging of readers (inputs) in direct mode: entries of all
+        inputs are sorted by the sort key (see sortWords), k-way merged,
+        and entries with the same headword are consolidated into one
+        entry, with the union of alternate words
+        entry filters (strip, lower, ...) run on every input before it's
+        sorted, so headwords are compared as they are written
+        policy (str or None): what to do with definitions, one of:
+            'concat': concatenate them, separated by `sep`
+            'alternates': keep them as alternate definitions
+            'first': keep only the definition of first input
+            None: disable merging
+        sep (str or None): separator of concatenated definitions,
+            None for a horizontal line (html) or an empty line (plain text)
+        """
+        if policy and policy not in mergePolicies:
+            raise ValueError('invalid merge policy %r' % policy)
+        self._mergePolicy = policy
+        self._mergeSep = sep
+
+    def getMergeStats(self):
+        """
+        returns dict of merge statistics of the last iteration in
+        merge mode, 'inputs': number of inputs, and 'merged': number of
+        entries that were merged into another entry
+        """
+        return self._mergeStats
+
+    def _mergedReadersEntryGen(self):
+        """
+        every reader is sorted separately by external merge sort, with
+        a share of the sort memory limit, then sorted streams are merged
+        so only one run per reader, and one group of entries with
+        the same key are kept in memory
+        entry filters run on every input before sorting, so headwords
+        are merged as they are written (after strip, lower, ...)
+        """
+        readerCount = len(self._readers)
+        memLimit = (self._sortMemLimit or defaultSortMemLimit) / readerCount
+        log.info(
+            'merging %s inputs, policy: %s' % (readerCount, self._mergePolicy)
+        )
+        rawKey = Entry.getRawEntrySortKey(self._sortKey)
+        chain = self._newFilterChain()
+        streams = [
+            extSortStream(
+                (
+                    entry.getRaw()
+                    for entry in self._profileIter(
+                        self._applyEntryFiltersGen(
+                            self._readerEntryGen(reader),
+                            chain,
+                        ),
+                        'filter chain',
+                    )
+                ),
+                key=rawKey,
+                memLimit=memLimit,
+                maxRunLen=self._sortCacheSize,
+            )
+            for reader in self._readers
+        ]
+        defaultDefiFormat = self._defaultDefiFormat
+        self._mergeStats = {'inputs': readerCount}
+        for rawEntry in consolidateEntries(
+            self._profileIter(self._memoryPhaseIter(
+                mergeSortedStreams(streams, key=self._sortKey),
+                'sort',
+            ), 'sort'),
+            key=self._sortKey,
+            policy=self._mergePolicy,
+            sep=self._mergeSep,
+            defaultDefiFormat=defaultDefiFormat,
+            stats=self._mergeStats,
+        ):
+            yield Entry.fromRaw(
+                rawEntry,
+                defaultDefiFormat=defaultDefiFormat,
+            )
+        self._logFilterStats(chain)
+        log.info(
+            'merged %s entries into entries with the same headword' % (
+                self._mergeStats.get('merged', 0),
+            )
+        )
+
+    def setDedupe(self, key='exact', policy='drop'):
+        """
+        enables the dedupe stage (after entry filters), which removes
+        entries with duplicate headwords without loading them into memory
+        (see dedupe.py), and keeps the order of entries
+        key (str or None): 'exact' to compare main words as they are,
+            'normalized' to compare them case-folded and unicode-normalized
+            None: disable dedupe
+        policy (str): what to do with duplicates:
+            'drop': keep the first entry, drop the others
+            'concat', 'alternates', 'first': merge them into the first
+                entry, like `setMerge`
+        must be called before `write` (or iterating)
+        """
+        if key and key not in dedupeKeys:
+            raise ValueError('invalid dedupe key %r' % key)
+        if policy not in dedupePolicies:
+            raise ValueError('invalid dedupe policy %r' % policy)
+        self._dedupeKey = key
+        self._dedupePolicy = policy
+
+    def getDedupeStats(self):
         """
-        if self._readers:  # direct mode
-            if sort:
-                sortKey = self._sortKey
-                cacheSize = self._sortCacheSize
-                log.info('stream sorting enabled, cache size: %s' % cacheSize)
-                # only sort by main word, or list of words + alternates? FIXME
-                gen = hsortStreamList(
-                    self._readers,
-                    cacheSize,
-                    key=Entry.getEntrySortKey(sortKey),
-                )
-            else:
-                gen = self._readersEntryGen()
-        else:
-            gen = self._loadedEntryGen()
+        returns dict of dedupe statistics of the last iteration, or None
+        'entries': number of entries before dedupe,
+        'candidates': entries whose key was (maybe) seen before,
+        'groups': number of keys with duplicates,
+        'duplicates': number of entries that were dropped or merged
+        """
+        if self._dedupeStats is None:
+            return None
+        return self._dedupeStats.toDict()
 
-        self._iter = self._applyEntryFiltersGen(gen)
+    def _dedupeEntriesGen(self, gen):
+        if self._readers:
+            # len(reader) may read the whole input file (like Tabfile),
+            # and Bloom filters of dedupe grow if there are more entries
+            capacity = defaultDedupeCapacity
+        else:
+            capacity = len(self._data)
+        stats = self._dedupeStats = DedupeStats()
+        defaultDefiFormat = self._defaultDefiFormat
+        for rawEntry in dedupeEntries(
+            (entry.getRaw() for entry in gen),
+            key=self._dedupeKey,
+            policy=self._dedupePolicy,
+            capacity=capacity or defaultDedupeCapacity,
+            defaultDefiFormat=defaultDefiFormat,
+            stats=stats,
+        ):
+            yield Entry.fromRaw(
+                rawEntry,
+                defaultDefiFormat=defaultDefiFormat,
+            )
+        log.info(
+            'Dedupe (%s key, %s): %s duplicate entries in %s headwords' % (
+                self._dedupeKey,
+                self._dedupePolicy,
+                stats.duplicates,
+                stats.groups,
+            )
+        )
 
-    def sortWords(self, key=None, cacheSize=None):
+    def sortWords(self, key=None, cacheSize=None, memLimit=None):
+        """
+        key: key function for sorting, takes a word (str) as argument
+        cacheSize: maximum number of entries in each sorted run (written
+            to a temporary file) while sorting in direct mode, or None for
+            no limit other than `memLimit`
+            small values make many temporary files and merge passes
+        memLimit: memory budget for sorting in direct mode, in megabytes
+        """
         # only sort by main word, or list of words + alternates? FIXME
         if self._readers:
             self._sortKey = key
             if cacheSize:
-                self._sortCacheSize = cacheSize  # FIXME
+                self._sortCacheSize = cacheSize
+            if memLimit:
+                self._sortMemLimit = memLimit
+        elif self._compactData:
+            with self._profileStage('sort'), self._memoryPhase('sort'):
+                self._data.sortByWord(key=key)
+            self._searchIndex = None
         else:
-            self._data.sort(
-                key=Entry.getRawEntrySortKey(key),
-            )
+            with self._profileStage('sort'), self._memoryPhase('sort'):
+                self._data.sort(
+                    key=Entry.getRawEntrySortKey(key),
+                )
+            self._searchIndex = None
         self._updateIter(sort=True)
 
     def write(
@@ -679,7 +1642,8 @@ class Glossary(object):
         format='',
         sort=None,
         sortKey=None,
-        sortCacheSize=1000,
+        sortCacheSize=None,
+        sortMemLimit=None,
         **options
     ):
         """
@@ -690,7 +1654,35 @@ class Glossary(object):
         sortKey (callable or None):
             key function for sorting
             takes a word as argument, which is str or list (with alternates)
+        sortCacheSize (int or None):
+            maximum number of entries in each sorted run (written to a
+            temporary file) while sorting in direct mode, None for no limit
+            other than `sortMemLimit`
+        sortMemLimit (int or None):
+            memory budget (in megabytes) for sorting in direct mode,
+            sorted runs are written to temporary files beyond that
         """
+        with self._memoryPhase('write'):
+            return self._write(
+                filename=filename,
+                format=format,
+                sort=sort,
+                sortKey=sortKey,
+                sortCacheSize=sortCacheSize,
+                sortMemLimit=sortMemLimit,
+                **options
+            )
+
+    def _write(
+        self,
+        filename='',
+        format='',
+        sort=None,
+        sortKey=None,
+        sortCacheSize=None,
+        sortMemLimit=None,
+        **options
+    ):
         if not filename:
             filename = self._filename
         if not filename:
@@ -699,7 +1691,7 @@ class Glossary(object):
         ext = ''
         filenameNoExt, fext = splitext(filename)
         fext = fext.lower()
-        if fext in ('.gz', '.bz2', '.zip'):
+        if fext in ('.gz', '.bz2', '.xz', '.zip'):
             archiveType = fext[1:]
             filename = filenameNoExt
             fext = get_ext(filename)
@@ -750,6 +1742,13 @@ class Glossary(object):
         if isdir(filename):
             # write to directory, use filename (not filepath) of input file.
             filename = join(filename, basename(self._filename)+ext)
+        if self._profiler:
+            self._profiler.info['outputFormat'] = format
+        with self._profileStage('plugin load'):
+            plugin = self.importPlugin(format)
+        if plugin is None:
+            log.error('failed to load plugin of %s format' % format)
+            return False
         validOptionKeys = self.formatsWriteOptions[format]
         for key in list(options.keys()):
             if key not in validOptionKeys:
@@ -759,7 +1758,6 @@ class Glossary(object):
                 )
                 del options[key]
 
-        plugin = self.plugins[format]
         sortOnWrite = plugin.sortOnWrite
         if sortOnWrite == ALWAYS:
             if sort is False:
@@ -768,12 +1766,10 @@ class Glossary(object):
                     ', ignoring user sort=False option'
                 )
             if self._readers:
-                log.warning(
+                log.info(
                     'writing to %s format requires full sort' % format +
-                    ', falling back to indirect mode'
+                    ', using external sort'
                 )
-                self._inactivateDirectMode()
-                log.info('loaded %s entries' % len(self._data))
             sort = True
         elif sortOnWrite == DEFAULT_YES:
             if sort is None:
@@ -811,15 +1807,30 @@ class Glossary(object):
                     )
             self.sortWords(
                 key=sortKey,
-                cacheSize=sortCacheSize
+                cacheSize=sortCacheSize,
+                memLimit=sortMemLimit,
             )
         else:
             self._updateIter(sort=False)
 
         filename = abspath(filename)
-        log.info('Writing to file "%s"' % filename)
+        writeFilename = filename
+        if archiveType and getattr(plugin, 'writeCompressed', False):
+            # plugin compresses on the fly, using compressionOpen
+            writeFilename = '%s.%s' % (filename, archiveType)
+            archiveType = ''
+        log.info('Writing to file "%s"' % writeFilename)
+        self._outputFiles = [realpath(writeFilename)]
+        outDirStat = None
+        if archiveType:
+            outDirStat = self._statOutputDir(filename)
         try:
-            self.writeFunctions[format].__call__(self, filename, **options)
+            with self._profileStage('writer', self._pluginModuleName(format)):
+                self.writeFunctions[format].__call__(
+                    self,
+                    writeFilename,
+                    **options
+                )
         except Exception:
             log.exception('exception while calling plugin\'s write function')
             return False
@@ -827,45 +1838,111 @@ class Glossary(object):
             self.clear()
 
         if archiveType:
-            self.archiveOutDir(filename, archiveType)
+            unreported = self._getUnreportedOutputs(filename, outDirStat)
+            if unreported:
+                log.error(
+                    '%s writer wrote files that it does not report' % format +
+                    ' (see Glossary.addOutputFile): %s' % ', '.join(
+                        basename(path) for path in unreported
+                    ) + ', not compressing the output'
+                )
+                return False
+            with self._profileStage('archive'):
+                if not self.archiveOutDir(
+                    filename,
+                    archiveType,
+                    paths=self.getOutputFiles(),
+                ):
+                    return False
 
         return True
 
-    def archiveOutDir(self, filename, archiveType):
+    def _statOutputDir(self, filename):
+        """
+        returns dict of name => (mtime_ns, size) of files (and directories)
+        in the directory of output file `filename`
+        """
+        outDir = dirname(filename)
+        result = {}
+        if not isdir(outDir):
+            return result
+        for name in os.listdir(outDir):
+            try:
+                st = os.stat(join(outDir, name))
+            except OSError:
+                continue
+            result[name] = (st.st_mtime_ns, st.st_size)
+        return result
+
+    def _getUnreportedOutputs(self, filename, outDirStat):
+        """
+        returns paths of files (and directories) in the directory of
+        output file `filename` that are created or modified since
+        `outDirStat` (see _statOutputDir), other than the files
+        the writer reported (see getOutputFiles) and sidecar files
+        of checkpoint and incremental mode
+        """
+        reported = self.getOutputFiles()
+        ignored = set(reported + [
+            realpath(filename + '.checkpoint'),
+            realpath(filename + '.incremental'),
+        ])
+        paths = []
+        outDir = dirname(filename)
+        for name, stat in sorted(self._statOutputDir(filename).items()):
+            if outDirStat.get(name) == stat:
+                continue
+            path = realpath(join(outDir, name))
+            if path in ignored:
+                continue
+            if any(other.startswith(path + os.sep) for other in reported):
+                continue
+            paths.append(path)
+        return paths
+
+    def archiveOutDir(self, filename, archiveType, paths=None):
         """
-        filename is the existing file path
-        archiveType is the archive extention (without dot): 'gz', 'bz2', 'zip'
+        filename is the existing file (or directory) path
+        archiveType is the archive extention (without dot):
+            'gz', 'bz2', 'xz', 'zip'
+        paths (list or None): all files (and directories) to put in the
+            archive, like StarDict's .ifo, .idx, .dict.dz and .syn files
+            (see getOutputFiles), default is [filename]
+
+        a single file is compressed into filename.archiveType
+        multiple files are put into filename.zip, or a compressed tar file
+        named filenameNoExt.tar.archiveType (like mydic.tar.gz)
+        compression runs in-process, .gz and .bz2 use multiple threads,
+        with the level of 'compressLevel' preference (None for default)
+        writers that write multiple files (like StarDict) are compressed
+        in this second pass over the written files, only writers with
+        `writeCompressed` compress while writing
         """
+        if not paths:
+            paths = [filename]
+        level = self.getPref('compressLevel', None)
         try:
-            os.remove('%s.%s' % (filename, archiveType))
-        except OSError:
-            pass
-        if archiveType == 'gz':
-            output, error = subprocess.Popen(
-                ['gzip', filename],
-                stdout=subprocess.PIPE,
-            ).communicate()
-            if error:
-                log.error('%s\nfail to compress file "%s"' % (error, filename))
-        elif archiveType == 'bz2':
-            output, error = subprocess.Popen(
-                ['bzip2', filename],
-                stdout=subprocess.PIPE,
-            ).communicate()
-            if error:
-                log.error('%s\nfail to compress file "%s"' % (error, filename))
-        elif archiveType == 'zip':
-            dirn, name = split(filename)
-            with indir(dirn):
-                output, error = subprocess.Popen(
-                    ['zip', filename+'.zip', name, '-m'],
-                    stdout=subprocess.PIPE,
-                ).communicate()
-                if error:
-                    log.error(
-                        error + '\n' +
-                        'failed to compress file "%s"' % filename
+            if len(paths) == 1 and not isdir(paths[0]):
+                if realpath(paths[0]) != realpath(filename):
+                    filename = paths[0]
+                archivePath = '%s.%s' % (filename, archiveType)
+                compressFile(filename, archiveType, level=level)
+            else:
+                if archiveType == 'zip':
+                    archivePath = filename + '.zip'
+                else:
+                    archivePath = '%s.tar.%s' % (
+                        splitext(filename)[0],
+                        archiveType,
                     )
+                archiveFiles(archivePath, paths, archiveType, level=level)
+        except Exception:
+            log.exception('failed to compress file "%s"' % filename)
+            return False
+        log.info('Compressed into "%s"' % archivePath)
+        # the archive replaces the files that are put in it
+        self._outputFiles = [realpath(archivePath)]
+        return True
 
     def convert(
         self,
@@ -877,18 +1954,252 @@ class Glossary(object):
         outputFormat='',
         sort=None,
         sortKey=None,
-        sortCacheSize=1000,
+        sortCacheSize=None,
+        sortMemLimit=None,
+        readOptions=None,
+        writeOptions=None,
+        workers=0,
+        batchSize=None,
+        compactData=False,
+        compressData=False,
+        profile='',
+        profilePlugins=False,
+        profileMemory=False,
+        mergeInputs=None,
+        mergePolicy='concat',
+        mergeSep=None,
+        dedupe=None,
+        dedupePolicy='drop',
+        checkpoint=False,
+        checkpointInterval=None,
+        resume=False,
+        incremental=False,
+        cache=None,
+        pipeline=False,
+        pipelineQueueSize=None,
+        bytesMode=False,
+    ):
+        """
+        workers (int): number of processes to run entry filters in,
+            0 or 1 to disable the parallel filter stage
+        batchSize (int or None): number of entries sent to each worker at once
+        compactData (bool): use compact storage in indirect mode,
+            see `setCompactData`
+        compressData (bool): also keep definitions zlib-compressed
+        profile (str): path of a JSON file to write the profiling report to,
+            with wall time and CPU time of every stage of conversion
+        profilePlugins (bool): also put cProfile stats of plugins
+            (readers and writers) in the profiling report
+        profileMemory (bool): record peak and retained memory of every
+            phase of conversion (read, sort, write), and the top allocation
+            sites at peak, using tracemalloc (which makes conversion slower)
+            the result is logged, and put in the profiling report if
+            `profile` is given
+        mergeInputs (list or None): names of more input files to merge
+            with `inputFilename` (in direct mode), see `setMerge`
+        mergePolicy (str): what to do with definitions of entries with
+            the same headword, see `setMerge`
+        mergeSep (str or None): separator of concatenated definitions
+        dedupe (str or None): remove entries with duplicate headwords,
+            'exact' or 'normalized', see `setDedupe`
+        dedupePolicy (str): 'drop' or a merge policy, see `setDedupe`
+        checkpoint (bool): save checkpoints periodically while writing,
+            into OUTPUT_FILE.checkpoint, which is removed on success
+            (only for writers that support it, see `setWriterCheckpoint`)
+        checkpointInterval (int or None): seconds between checkpoints
+        resume (bool): resume from the checkpoint of the same conversion
+            if there is one, implies checkpoint=True
+        incremental (bool): compare entries with those of the previous
+            (incremental) conversion to the same output file, using the
+            content hashes in OUTPUT_FILE.incremental, and let writers
+            reuse their work for unchanged entries (see `getWorkCache`)
+        cache (bool or None): use the cache of conversion results
+            (see result_cache.py), so an identical conversion (same
+            input files, formats, options and plugins) gives the output
+            files from cache, without converting again
+            None: get from 'resultCache' preference (disabled by default)
+        pipeline (bool): read (and run entry filters) in a producer thread,
+            while writing in this thread, see `setPipeline`
+        pipelineQueueSize (int or None): maximum number of batches of
+            entries in the queue between producer and writer
+        bytesMode (bool): pass definitions through as bytes, from reader
+            to writer without decoding, see `setBytesMode`
+        """
+        profiler = None
+        memProfiler = None
+        if profile:
+            from .profiler import ConvertProfiler
+            profiler = ConvertProfiler(pluginsProfile=profilePlugins)
+            profiler.info.update([
+                ('version', VERSION),
+                ('inputFilename', inputFilename),
+                ('outputFilename', outputFilename),
+                ('inputFormat', inputFormat),
+                ('outputFormat', outputFormat),
+                ('direct', direct),
+                ('sort', sort),
+                ('workers', workers),
+                ('compactData', compactData),
+                ('bytesMode', bytesMode),
+                ('startupPluginsLoadTime', self.pluginsLoadTime),
+            ])
+            self.setProfiler(profiler)
+        if profileMemory:
+            from .profiler import MemoryProfiler
+            memProfiler = MemoryProfiler()
+            self.setMemoryProfiler(memProfiler)
+            memProfiler.start()
+        if profiler:
+            profiler.start()
+        try:
+            succeed = self._convert(
+                inputFilename,
+                inputFormat=inputFormat,
+                direct=direct,
+                progressbar=progressbar,
+                outputFilename=outputFilename,
+                outputFormat=outputFormat,
+                sort=sort,
+                sortKey=sortKey,
+                sortCacheSize=sortCacheSize,
+                sortMemLimit=sortMemLimit,
+                readOptions=readOptions,
+                writeOptions=writeOptions,
+                workers=workers,
+                batchSize=batchSize,
+                compactData=compactData,
+                compressData=compressData,
+                mergeInputs=mergeInputs,
+                mergePolicy=mergePolicy,
+                mergeSep=mergeSep,
+                dedupe=dedupe,
+                dedupePolicy=dedupePolicy,
+                checkpoint=checkpoint,
+                checkpointInterval=checkpointInterval,
+                resume=resume,
+                incremental=incremental,
+                cache=cache,
+                pipeline=pipeline,
+                pipelineQueueSize=pipelineQueueSize,
+                bytesMode=bytesMode,
+            )
+        finally:
+            if profiler:
+                profiler.stop()
+                self.setProfiler(None)
+            if memProfiler:
+                memProfiler.stop()
+                self.setMemoryProfiler(None)
+
+        if memProfiler:
+            log.info('Memory profile:\n' + memProfiler.formatReport())
+        if profiler:
+            profiler.info['succeed'] = succeed
+            profiler.info['entryCount'] = self.getIterEntryCount()
+            profiler.info['filters'] = self.getFilterStats()
+            profiler.info['dedupe'] = self.getDedupeStats()
+            profiler.info['incremental'] = self.getIncrementalStats()
+            profiler.info['pipeline'] = self.getPipelineStats()
+            if memProfiler:
+                profiler.memory = memProfiler.getReport()
+            log.info('Profile:\n' + profiler.formatReport())
+            try:
+                profiler.saveReport(profile)
+            except Exception:
+                log.exception('failed to save profile report')
+            else:
+                log.info('Profile report saved to "%s"' % profile)
+        return succeed
+
+    def _convert(
+        self,
+        inputFilename,
+        inputFormat='',
+        direct=None,
+        progressbar=True,
+        outputFilename='',
+        outputFormat='',
+        sort=None,
+        sortKey=None,
+        sortCacheSize=None,
+        sortMemLimit=None,
         readOptions=None,
         writeOptions=None,
+        workers=0,
+        batchSize=None,
+        compactData=False,
+        compressData=False,
+        mergeInputs=None,
+        mergePolicy='concat',
+        mergeSep=None,
+        dedupe=None,
+        dedupePolicy='drop',
+        checkpoint=False,
+        checkpointInterval=None,
+        resume=False,
+        incremental=False,
+        cache=None,
+        pipeline=False,
+        pipelineQueueSize=None,
+        bytesMode=False,
     ):
         if not readOptions:
             readOptions = {}
         if not writeOptions:
             writeOptions = {}
 
+        resultCache = None
+        cacheKey = None
+        if cache is None:
+            cache = self.getPref('resultCache', False)
+        if cache:
+            from .result_cache import ResultCache
+            resultCache = ResultCache(
+                maxSize=self.getPref('resultCacheMaxSize', 1024),
+            )
+            cacheKey = self._getResultCacheKey(
+                [inputFilename] + list(mergeInputs or []),
+                inputFormat,
+                outputFilename,
+                outputFormat,
+                sortKey,
+                {
+                    'direct': direct,
+                    'sort': sort,
+                    'readOptions': readOptions,
+                    'writeOptions': writeOptions,
+                    'mergePolicy': mergePolicy if mergeInputs else None,
+                    'mergeSep': mergeSep,
+                    'dedupe': dedupe,
+                    'dedupePolicy': dedupePolicy,
+                    'bytesMode': bytesMode,
+                },
+            )
+        if cacheKey:
+            result = resultCache.get(cacheKey, outputFilename)
+            if result is not None:
+                paths, self._iterEntryCount = result
+                log.info(
+                    'Output of identical conversion found in cache: %s' % (
+                        ', '.join(basename(path) for path in paths),
+                    )
+                )
+                return True
+
+        self.setFilterWorkers(workers, batchSize)
+        if pipeline:
+            self.setPipeline(pipelineQueueSize)
+        if compactData:
+            self.setCompactData(compressDefi=compressData)
+        if bytesMode:
+            self.setBytesMode()
+
         if direct is None:
-            if sort is not True:
-                direct = True  # FIXME
+            # sorting in direct mode is done by external merge sort
+            direct = True
+        if mergeInputs and not direct:
+            log.warning('merging inputs requires direct mode, ignoring direct=False')
+            direct = True
 
         tm0 = now()
         if not self.read(
@@ -899,22 +2210,248 @@ class Glossary(object):
             **readOptions
         ):
             return False
+        if mergeInputs:
+            if not self._readers:
+                log.error('no `Reader` class found for input, can not merge')
+                return False
+            for mergeFilename in mergeInputs:
+                readerCount = len(self._readers)
+                if not self.read(
+                    mergeFilename,
+                    direct=True,
+                    progressbar=progressbar,
+                ):
+                    return False
+                if len(self._readers) == readerCount:
+                    log.error(
+                        'no `Reader` class found for "%s"' % mergeFilename +
+                        ', can not merge'
+                    )
+                    return False
+            self.setMerge(mergePolicy, mergeSep)
+        if dedupe:
+            self.setDedupe(dedupe, dedupePolicy)
         log.info('')
 
-        if not self.write(
-            filename=outputFilename,
-            format=outputFormat,
-            sort=sort,
-            sortKey=sortKey,
-            sortCacheSize=sortCacheSize,
-            **writeOptions
-        ):
+        checkpointer = None
+        if checkpoint or resume:
+            checkpointer = self._initCheckpointer(
+                [inputFilename] + list(mergeInputs or []),
+                outputFilename,
+                {
+                    'inputFormat': inputFormat,
+                    'outputFormat': outputFormat,
+                    'direct': direct,
+                    'sort': sort,
+                    'readOptions': readOptions,
+                    'writeOptions': writeOptions,
+                    'mergePolicy': mergePolicy if mergeInputs else None,
+                    'mergeSep': mergeSep,
+                    'dedupe': dedupe,
+                    'dedupePolicy': dedupePolicy,
+                    'bytesMode': bytesMode,
+                    'entryFilters': [
+                        type(entryFilter).__name__
+                        for entryFilter in self._entryFilters
+                    ],
+                },
+                checkpointInterval,
+                resume,
+            )
+
+        incrementalState = None
+        if incremental:
+            incrementalState = self._initIncremental(outputFilename)
+
+        if cacheKey and self.resPath and isdir(self.resPath) and \
+                os.listdir(self.resPath):
+            log.info('glossary has resource files, not caching the result')
+            cacheKey = None
+
+        succeed = False
+        try:
+            succeed = self.write(
+                filename=outputFilename,
+                format=outputFormat,
+                sort=sort,
+                sortKey=sortKey,
+                sortCacheSize=sortCacheSize,
+                sortMemLimit=sortMemLimit,
+                **writeOptions
+            )
+        finally:
+            self.setCheckpointer(None)
+            self.setIncremental(None)
+            if incrementalState:
+                self._finishIncremental(incrementalState, succeed)
+        if not succeed:
             return False
+        if checkpointer:
+            checkpointer.remove()
+        if cacheKey:
+            self._saveResult(
+                resultCache,
+                cacheKey,
+                outputFilename,
+            )
         log.info('')
         log.info('Running time of convert: %.1f seconds' % (now() - tm0))
 
         return True
 
+    def _initCheckpointer(
+        self,
+        inputFilenames,
+        outputFilename,
+        options,
+        interval,
+        resume,
+    ):
+        """
+        creates the Checkpointer of conversion, and loads the checkpoint
+        if `resume` is True, returns the Checkpointer or None
+        """
+        from .checkpoint import (
+            Checkpointer,
+            getCheckpointPath,
+            getJobInfo,
+            defaultInterval,
+        )
+        if not outputFilename:
+            log.warning('no output file name given, checkpoints disabled')
+            return None
+        checkpointer = Checkpointer(
+            getCheckpointPath(outputFilename),
+            getJobInfo(inputFilenames, outputFilename, options),
+            interval=interval or defaultInterval,
+        )
+        resumeData = None
+        if resume:
+            resumeData = checkpointer.load()
+            if resumeData is None:
+                log.warning(
+                    'no valid checkpoint found' +
+                    ', converting from the beginning'
+                )
+            else:
+                log.info(
+                    'Resuming from checkpoint "%s" (%s entries written)' % (
+                        checkpointer.path,
+                        resumeData['entryCount'],
+                    )
+                )
+        self.setCheckpointer(checkpointer, resumeData)
+        return checkpointer
+
+    def _getResultCacheKey(
+        self,
+        inputFilenames,
+        inputFormat,
+        outputFilename,
+        outputFormat,
+        sortKey,
+        options,
+    ):
+        """
+        returns the key of conversion in result cache,
+        or None if it can not be cached
+        """
+        from .result_cache import (
+            ResultCache,
+            getPathDigest,
+            getPluginDigest,
+            ignoredPrefKeys,
+        )
+        if not outputFilename:
+            return None
+        if sortKey is not None:
+            log.info('custom sort key function, not using result cache')
+            return None
+        inputs = []
+        formats = []
+        for index, filename in enumerate(inputFilenames):
+            format = inputFormat if index == 0 else ''
+            if not format:
+                format = self.extFormat.get(
+                    get_ext(splitCompressionExt(filename)[0])
+                )
+            inputs.append(getPathDigest(filename))
+            formats.append(format)
+        if not outputFormat:
+            outputFormat = self.extFormat.get(
+                get_ext(splitCompressionExt(outputFilename)[0])
+            )
+        formats.append(outputFormat)
+        if None in formats:
+            return None
+        pref = getattr(self.ui, 'pref', {})
+        return ResultCache.getKey({
+            'version': VERSION,
+            'inputs': inputs,
+            'formats': formats,
+            'plugins': {
+                format: getPluginDigest(self.pluginsInfo[format])
+                for format in formats
+            },
+            'output': basename(outputFilename),
+            'options': options,
+            # all preferences are given to plugins (glos.getPref)
+            'pref': {
+                key: value
+                for key, value in pref.items()
+                if key not in ignoredPrefKeys
+            },
+        })
+
+    def _saveResult(self, resultCache, cacheKey, outputFilename):
+        # files written by the writer (see getOutputFiles)
+        paths = self.getOutputFiles()
+        outDir = dirname(realpath(outputFilename))
+        if any(dirname(path) != outDir for path in paths):
+            log.info(
+                'output files are not in the same directory'
+                ', not caching the result'
+            )
+            return
+        try:
+            if paths and resultCache.put(
+                cacheKey,
+                paths,
+                entryCount=self._iterEntryCount,
+            ):
+                log.info('Saved result of conversion in cache')
+        except Exception:
+            log.exception('failed to save result in cache')
+
+    def _initIncremental(self, outputFilename):
+        from .incremental import IncrementalState, getIncrementalDir
+        if not outputFilename:
+            log.warning('no output file name given, incremental mode disabled')
+            return None
+        state = IncrementalState(getIncrementalDir(outputFilename))
+        log.info(
+            'Incremental mode: %s entries in previous run' % len(state.old)
+        )
+        self.setIncremental(state)
+        return state
+
+    def _finishIncremental(self, state, succeed):
+        """
+        saves hashes of this conversion if it's succeeded, otherwise
+        keeps those of the previous conversion
+        """
+        if not succeed:
+            state.abort()
+            return
+        stats = self._incrementalStats = state.finish()
+        log.info(
+            'Incremental: %s unchanged, %s changed, %s added' % (
+                stats.unchanged,
+                stats.changed,
+                stats.added,
+            ) + ', %s deleted entries' % stats.deleted
+        )
+
     # ________________________________________________________________________#
 
     def writeTxt(
@@ -937,9 +2474,17 @@ class Glossary(object):
         if not outInfoKeysAliasDict:
             outInfoKeysAliasDict = {}
 
-        fp = open(filename, 'w', encoding=encoding)
-        fp.write(head)
-        if writeInfo:
+        resume = self.getWriterResume()
+        if splitCompressionExt(filename)[1]:
+            if resume is not None:
+                raise ValueError('can not resume writing a compressed file')
+            fp = compressionOpen(filename, 'wt', encoding=encoding)
+        else:
+            fp = openResumable(filename, 'wt', resume, encoding=encoding)
+            self.setWriterCheckpoint(lambda: ({}, [fp]))
+        if resume is None:
+            fp.write(head)
+        if writeInfo and resume is None:
             for key, desc in self._info.items():
                 try:
                     key = outInfoKeysAliasDict[key]
@@ -1086,46 +2631,327 @@ class Glossary(object):
     # ________________________________________________________________________#
 
     def progressInit(self, *args):
+        self._progressStartTime = now()
+        self._progressLastTime = 0
         if self.ui:
-            self.ui.progressInit(*args)
+            # in pipeline mode, ui is updated in the writer thread
+            callInConsumer(self.ui.progressInit, *args)
+
+    def _progressThrottle(self):
+        """
+        returns the seconds passed since progressInit,
+        or None if the ui was updated less than progressMinInterval ago
+        """
+        tm = now()
+        if tm - self._progressLastTime < progressMinInterval:
+            return None
+        self._progressLastTime = tm
+        return tm - self._progressStartTime
 
     def progress(self, wordI, wordCount):
-        if self.ui and wordI % (wordCount//500 + 1) == 0:
-            self.ui.progress(
-                min(wordI + 1, wordCount) / wordCount,
-                '%d / %d completed' % (wordI, wordCount),
-            )
+        if not self.ui or self._progressThrottle() is None:
+            return
+        callInConsumer(
+            self.ui.progress,
+            min(wordI + 1, wordCount) / wordCount,
+            '%d / %d completed' % (wordI, wordCount),
+        )
+
+    def progressBytes(self, wordI, pos, total):
+        """
+        wordI: index of current entry
+        pos: number of input bytes consumed
+        total: total number of input bytes
+        """
+        if not self.ui or not total:
+            return
+        seconds = self._progressThrottle()
+        if seconds is None:
+            return
+        seconds = max(seconds, 0.001)
+        callInConsumer(
+            self.ui.progress,
+            min(pos / total, 1.0),
+            '%d entries, %d entries/s, %.2f MB/s' % (
+                wordI + 1,
+                (wordI + 1) / seconds,
+                pos / seconds / 1024**2,
+            ),
+        )
 
     def progressEnd(self):
         if self.ui:
-            self.ui.progressEnd()
+            callInConsumer(self.ui.progressEnd)
 
     # ________________________________________________________________________#
 
-    def searchWordInDef(
+    def setLookup(
+        self,
+        filename,
+        format='',
+        cacheSize=defaultLookupCacheSize,
+        index=None,
+        **options
+    ):
+        """
+        sets the glossary file of `lookup` and `lookupPrefix`
+        the file is opened on first lookup by the `Lookup` class of its
+        plugin, which uses the index of the format (like .idx and .syn
+        of StarDict), without reading all entries (see pyglossary.lookup)
+        cacheSize: number of looked up words whose entries are kept (LRU)
+        index (bool or None): use a lookup index file (FILENAME.lookup,
+            see buildLookupIndex) instead of `Lookup` class of plugin,
+            None means only if the format has no `Lookup` class
+            (or the file is compressed)
+        options: read options of format (like `encoding`)
+        returns False if the format does not support lookups
+        """
+        self.closeLookup()
+        self._lookupArgs = None
+        format = format or self._detectLookupFormat(filename)
+        if not format:
+            return False
+        info = self.pluginsInfo.get(format)
+        if not info:
+            log.error('Invalid format "%s"' % format)
+            return False
+        hasLookup = info.get('hasLookup') and \
+            not splitCompressionExt(filename)[1]
+        if index is None:
+            index = not hasLookup
+        if index:
+            if not (info['hasReader'] or info['hasRead']):
+                log.error('%s format does not support reading' % format)
+                return False
+        elif not hasLookup:
+            log.error(
+                '%s format does not support lookups' % format +
+                ' without lookup index file'
+            )
+            return False
+        elif self.importPlugin(format) is None:
+            log.error('failed to load plugin of %s format' % format)
+            return False
+        self._lookupArgs = (filename, format, options, index)
+        self._lookupCache = LRUCache(cacheSize)
+        return True
+
+    def _detectLookupFormat(self, filename):
+        ext = get_ext(splitCompressionExt(filename)[0])
+        format = self.extFormat.get(ext, '')
+        if not format:
+            log.error('Unknown extension "%s" for lookup support!' % ext)
+        return format
+
+    def buildLookupIndex(self, filename, format='', **options):
+        """
+        reads all entries of `filename` once (in direct mode if the
+        format has a `Reader`), and writes its lookup index file
+        (see pyglossary.lookup_index), without running entry filters
+        options: read options of format
+        returns the path of index file, or None if reading failed
+        """
+        from .lookup_index import (
+            getLookupIndexPath,
+            getSourceInfo,
+            writeLookupIndex,
+        )
+        format = format or self._detectLookupFormat(filename)
+        if not format:
+            return None
+        path = getLookupIndexPath(filename)
+        sourceInfo = getSourceInfo(filename, format, options)
+        log.info('Building lookup index "%s"' % path)
+        t0 = now()
+        source = Glossary(ui=self.ui)
+        try:
+            if not source.read(
+                filename,
+                format=format,
+                direct=True,
+                progressbar=self._progressbar,
+                **options
+            ):
+                return None
+            if source._readers:
+                entries = source._readersEntryGen()
+            else:
+                entries = source._loadedEntryGen()
+            entryCount = writeLookupIndex(path, entries, sourceInfo)
+        finally:
+            source.clear()
+        log.info(
+            'Lookup index: %s entries, took %.2f seconds' % (
+                entryCount,
+                now() - t0,
+            )
+        )
+        return path
+
+    def _openLookupIndex(self, filename, format, options):
+        from .lookup_index import (
+            LookupIndex,
+            getLookupIndexPath,
+            getSourceInfo,
+        )
+        path = getLookupIndexPath(filename)
+        sourceInfo = getSourceInfo(filename, format, options)
+        lookup = LookupIndex(self)
+        if lookup.open(path, sourceInfo):
+            return lookup
+        if not self.buildLookupIndex(filename, format, **options):
+            raise OSError('failed to build lookup index of "%s"' % filename)
+        if not lookup.open(path, sourceInfo):
+            raise OSError('invalid lookup index file "%s"' % path)
+        return lookup
+
+    def _getLookup(self):
+        if self._lookup is not None:
+            return self._lookup
+        if self._lookupArgs is None:
+            raise ValueError('no lookup file, call setLookup first')
+        filename, format, options, index = self._lookupArgs
+        t0 = now()
+        if index:
+            lookup = self._openLookupIndex(filename, format, options)
+        else:
+            lookup = self.lookupClasses[format](self)
+            lookup.open(filename, **options)
+        log.info(
+            'Opened "%s" for lookup, took %.2f seconds' % (
+                filename,
+                now() - t0,
+            )
+        )
+        self._lookup = lookup
+        return lookup
+
+    def lookup(self, word):
+        """
+        returns the list of entries (Entry objects) of `word`, as
+        headword or alternate, in the file given to `setLookup`
+        """
+        rawEntries = self._lookupCache.get(word)
+        if rawEntries is None:
+            rawEntries = [
+                entry.getRaw()
+                for entry in self._getLookup().lookup(word)
+            ]
+            self._lookupCache.put(word, rawEntries)
+        return [
+            Entry.fromRaw(rawEntry, defaultDefiFormat=self._defaultDefiFormat)
+            for rawEntry in rawEntries
+        ]
+
+    def lookupPrefix(self, prefix, limit=10):
+        """
+        returns a list of (at most `limit`) words that start with
+        `prefix`, in the file given to `setLookup`
+        """
+        return self._getLookup().lookupPrefix(prefix, limit)
+
+    def closeLookup(self):
+        """
+        closes the file of `lookup`, it's opened again on next lookup
+        """
+        lookup = getattr(self, '_lookup', None)
+        self._lookup = None
+        if getattr(self, '_lookupCache', None) is not None:
+            self._lookupCache.clear()
+        if lookup is None:
+            return
+        try:
+            lookup.close()
+        except Exception:
+            log.exception('error while closing lookup file')
+
+    def writeCompletionIndex(self, filename, **options):
+        """
+        writes the prefix index of all words (headwords and alternates)
+        of glossary into `filename`, for autocomplete
+        (see pyglossary.autocomplete.CompletionIndex)
+        in direct mode, this reads the input file(s) through
+        options: keysPerBlock
+        returns the number of words
+        """
+        from .autocomplete import writeCompletionIndex
+        log.info('Writing completion index "%s"' % filename)
+        t0 = now()
+        self._updateIter()
+        wordCount = writeCompletionIndex(
+            filename,
+            (word for entry in self for word in entry.getWords()),
+            **options
+        )
+        log.info(
+            'Completion index: %s words, took %.2f seconds' % (
+                wordCount,
+                now() - t0,
+            )
+        )
+        return wordCount
+
+    def getSearchIndex(self, sepChars='.,،', minWordLen=3):
+        """
+        returns the inverted index of words in definitions (DefiSearchIndex)
+        for indirect mode, builds it if there is no up-to-date index
+        """
+        index = self._searchIndex
+        if index is not None and \
+                index.sepChars == sepChars and \
+                index.minWordLen == minWordLen and \
+                index.entryCount == len(self._data):
+            return index
+        log.info('Building search index of definitions')
+        t0 = now()
+        index = DefiSearchIndex(sepChars=sepChars, minWordLen=minWordLen)
+        index.build(self._data)
+        log.info(
+            'Search index: %s words, %s entries, took %.2f seconds' % (
+                len(index),
+                index.entryCount,
+                now() - t0,
+            )
+        )
+        self._searchIndex = index
+        return index
+
+    def _searchWordInDefIndexGen(self, st, index, minRel):
+        data = self._data
+        for entryId, rel in index.getPostings(st):
+            if rel <= minRel:
+                continue
+            words, defi = data[entryId][:2]
+            if isinstance(words, str):
+                words = [words]
+            if isinstance(defi, bytes):
+                defi = toStr(defi)
+            elif not isinstance(defi, str):
+                defi = '\n'.join([toStr(part) for part in defi])
+            for word in words:
+                yield word, rel, defi
+
+    def _searchWordInDefScanGen(
         self,
         st,
-        matchWord=True,
-        sepChars='.,،',
-        maxNum=100,
-        minRel=0.0,
-        minWordLen=3,
-        includeDefs=False,
-        showRel='Percent',
+        matchWord,
+        sepChars,
+        minRel,
+        minWordLen,
     ):
-        # searches word 'st' in definitions of the glossary
         splitPattern = re.compile(
             '|'.join([re.escape(x) for x in sepChars]),
             re.U,
         )
         wordPattern = re.compile('[\w]{%d,}' % minWordLen, re.U)
-        outRel = []
         for item in self._data:
             words, defi = item[:2]
             if isinstance(words, str):
                 words = [words]
-            if isinstance(defi, list):
-                defi = '\n'.join(defi)
+            if isinstance(defi, bytes):
+                defi = toStr(defi)
+            elif not isinstance(defi, str):
+                defi = '\n'.join([toStr(part) for part in defi])
             if st not in defi:
                 continue
             for word in words:
@@ -1151,10 +2977,52 @@ class Glossary(object):
                         )
                 if rel <= minRel:
                     continue
-                if includeDefs:
-                    outRel.append((word, rel, defi))
-                else:
-                    outRel.append((word, rel))
+                yield word, rel, defi
+
+    def searchWordInDef(
+        self,
+        st,
+        matchWord=True,
+        sepChars='.,،',
+        maxNum=100,
+        minRel=0.0,
+        minWordLen=3,
+        includeDefs=False,
+        showRel='Percent',
+        useIndex=False,
+    ):
+        """
+        searches word 'st' in definitions of the glossary
+
+        useIndex (bool): use (and build if needed) the inverted index
+            of words in definitions, instead of scanning all entries
+            that's much faster for many searches (like `reverse`)
+            only used with matchWord=True and minRel >= 0
+        """
+        if useIndex and matchWord and minRel >= 0:
+            results = self._searchWordInDefIndexGen(
+                st,
+                self.getSearchIndex(
+                    sepChars=sepChars,
+                    minWordLen=minWordLen,
+                ),
+                minRel,
+            )
+        else:
+            results = self._searchWordInDefScanGen(
+                st,
+                matchWord,
+                sepChars,
+                minRel,
+                minWordLen,
+            )
+        if includeDefs:
+            outRel = list(results)
+        else:
+            outRel = [
+                (word, rel)
+                for word, rel, defi in results
+            ]
         outRel.sort(
             key=lambda x: x[1],
             reverse=True,
@@ -1218,6 +3086,9 @@ class Glossary(object):
         Inside the `for` loop, you can pause by waiting (for input or a flag)
             or stop by breaking
 
+        Searches are done using the inverted index of words in
+            definitions (see getSearchIndex), unless useIndex=False is given
+
         Potential keyword arguments:
             words = None ## None, or list
             reportStep = 300
@@ -1231,6 +3102,7 @@ class Glossary(object):
             includeDefs = False
             showRel = 'None'
                 allowed values: 'None', 'Percent', 'Percent At First'
+            useIndex = True
         """
         if not savePath:
             savePath = self.getInfo('name') + '.txt'
@@ -1250,6 +3122,12 @@ class Glossary(object):
             'Reversing to file "%s"' % savePath +
             ', number of words: %s' % wordCount
         )
+        kwargs.setdefault('useIndex', True)
+        if kwargs['useIndex']:
+            self.getSearchIndex(
+                sepChars=kwargs.get('sepChars', '.,،'),
+                minWordLen=kwargs.get('minWordLen', 3),
+            )
         self.progressInit('Reversing')
         with open(savePath, 'w') as saveFile:
             for wordI in range(wordCount):
@@ -1280,5 +3158,5 @@ class Glossary(object):
         yield wordCount
 
 
-Glossary.loadPlugins(join(dirname(__file__), 'plugins'))
+Glossary.loadPlugins(pluginsDir)
 Glossary.loadPlugins(userPluginsDir)
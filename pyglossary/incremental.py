@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+"""
+incremental re-conversion, see Glossary.convert(incremental=True)
+
+keeps a sidecar directory next to the output file (OUTPUT_FILE.incremental)
+with the content hashes of entries written by the previous run:
+    hashes: sorted records of (hash of main word, hash of entry content)
+    cache-NAME.db: work caches of writer plugins (see WorkCache)
+
+while writing, every entry (after entry filters, sort and dedupe) is
+looked up in the hashes of the previous run, in the same streaming pass:
+    unchanged: the same main word with the same content
+    changed: the same main word with another content
+    added: a new main word
+and main words of the previous run that are not seen are deleted
+
+writer plugins reuse the unchanged work through glos.getWorkCache,
+a persistent cache keyed by the content hash of the entry, for example
+AppleDict keeps the cleaned HTML of entries
+"""
+
+import os
+from os.path import abspath, join, isfile
+import sys
+import json
+import pickle
+import struct
+import sqlite3
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+
+from . import VERSION
+
+import logging
+log = logging.getLogger('root')
+
+
+hashesMagic = b'PGHASHES1\n'
+_record = struct.Struct('<QQ')
+_bucketCount = 256
+
+
+def getIncrementalDir(outputFilename):
+    return abspath(outputFilename) + '.incremental'
+
+
+def wordHash(word):
+    return int.from_bytes(
+        blake2b(word.encode('utf-8'), digest_size=8).digest(),
+        'little',
+    )
+
+
+def entryDigest(entry):
+    """
+        returns 8-byte hash of words, definitions and definition format
+    """
+    h = blake2b(digest_size=8)
+    h.update('\x00'.join(entry.getWords()).encode('utf-8'))
+    h.update(b'\x01')
+    # bytes of definitions, so bytes definitions are not decoded
+    h.update(b'\x00'.join(entry.getDefisBytes()))
+    h.update(b'\x01')
+    h.update((entry.getDefiFormat() or '').encode('ascii'))
+    return h.digest()
+
+
+def _newArray(data=b''):
+    arr = array('Q')
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+class EntryHashes(object):
+    """
+        (wordHash, contentHash) records of a previous run, sorted,
+        kept in two arrays (16 bytes per entry)
+    """
+    def __init__(self, keys=None, contents=None):
+        self.keys = keys if keys is not None else array('Q')
+        self.contents = contents if contents is not None else array('Q')
+        # which records are seen in this run
+        self.matched = bytearray(len(self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def load(cls, path):
+        """
+            returns None if there is no valid hashes file
+        """
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return None
+        if not data.startswith(hashesMagic) or \
+                (len(data) - len(hashesMagic)) % _record.size:
+            log.warning('invalid hashes file "%s", ignoring it' % path)
+            return None
+        arr = _newArray(data[len(hashesMagic):])
+        del data
+        return cls(arr[0::2], arr[1::2])
+
+    def match(self, key, content):
+        """
+            returns 'unchanged', 'changed' or 'added'
+            and marks the matching record of previous run as seen
+        """
+        keys = self.keys
+        matched = self.matched
+        first = bisect_left(keys, key)
+        end = first
+        count = len(keys)
+        while end < count and keys[end] == key:
+            end += 1
+        if first == end:
+            return 'added'
+        for index in range(first, end):
+            if not matched[index] and self.contents[index] == content:
+                matched[index] = 1
+                return 'unchanged'
+        for index in range(first, end):
+            if not matched[index]:
+                matched[index] = 1
+                break
+        return 'changed'
+
+    def unmatchedCount(self):
+        return self.matched.count(0)
+
+
+class EntryHashesBuilder(object):
+    """
+        collects (wordHash, contentHash) records of this run,
+        hash-partitioned into buckets by the top byte of wordHash,
+        so only one bucket is unpacked into Python objects while sorting
+    """
+    def __init__(self):
+        self._buckets = [bytearray() for _ in range(_bucketCount)]
+        self.count = 0
+
+    def add(self, key, content):
+        self._buckets[key >> 56] += _record.pack(key, content)
+        self.count += 1
+
+    def save(self, path):
+        tmpPath = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmpPath, 'wb') as fp:
+            fp.write(hashesMagic)
+            for index, bucket in enumerate(self._buckets):
+                arr = _newArray(bytes(bucket))
+                self._buckets[index] = None
+                out = array('Q')
+                for key, content in sorted(zip(arr[0::2], arr[1::2])):
+                    out.append(key)
+                    out.append(content)
+                if sys.byteorder == 'big':
+                    out.byteswap()
+                fp.write(out.tobytes())
+        os.replace(tmpPath, path)
+
+
+class WorkCache(object):
+    """
+        persistent cache of a writer plugin, keyed by content of entries
+        values are kept in a new database, that replaces the old one when
+        conversion is finished, so only values of the last run are kept
+        options: JSON-serializable options that affect the values,
+            the old database is not used if they are changed
+    """
+    def __init__(self, path, options=None):
+        self.path = path
+        self.options = json.dumps(
+            [VERSION, options],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        self.hits = 0
+        self.misses = 0
+        self._old = self._openOld()
+        self._tmpPath = path + '.tmp'
+        if isfile(self._tmpPath):
+            os.remove(self._tmpPath)
+        self._new = sqlite3.connect(self._tmpPath)
+        self._new.execute('PRAGMA journal_mode=OFF')
+        self._new.execute('PRAGMA synchronous=OFF')
+        self._new.execute(
+            'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)'
+        )
+        self._new.execute(
+            'CREATE TABLE cache (hash BLOB PRIMARY KEY, value BLOB)'
+        )
+        self._new.execute(
+            'INSERT INTO meta VALUES (?, ?)',
+            ('options', self.options),
+        )
+
+    def _openOld(self):
+        if not isfile(self.path):
+            return None
+        try:
+            con = sqlite3.connect(self.path)
+            row = con.execute(
+                'SELECT value FROM meta WHERE key = ?',
+                ('options',),
+            ).fetchone()
+        except sqlite3.Error as e:
+            log.warning('invalid cache file "%s": %s' % (self.path, e))
+            return None
+        if not row or row[0] != self.options:
+            log.info('options are changed, not using "%s"' % self.path)
+            con.close()
+            return None
+        return con
+
+    def getKey(self, entry):
+        return entryDigest(entry)
+
+    def get(self, key):
+        """
+            returns the cached value, or None
+        """
+        value = None
+        if self._old is not None:
+            row = self._old.execute(
+                'SELECT value FROM cache WHERE hash = ?',
+                (key,),
+            ).fetchone()
+            if row:
+                self._new.execute(
+                    'INSERT OR REPLACE INTO cache VALUES (?, ?)',
+                    (key, row[0]),
+                )
+                value = pickle.loads(row[0])
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._new.execute(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+        )
+
+    def close(self, save=True):
+        if self._old is not None:
+            self._old.close()
+            self._old = None
+        if self._new is None:
+            return
+        if save:
+            self._new.commit()
+        self._new.close()
+        self._new = None
+        if save:
+            os.replace(self._tmpPath, self.path)
+        else:
+            os.remove(self._tmpPath)
+
+
+class IncrementalStats(object):
+    def __init__(self):
+        self.unchanged = 0
+        self.changed = 0
+        self.added = 0
+        self.deleted = 0
+
+    def toDict(self):
+        return {
+            'unchanged': self.unchanged,
+            'changed': self.changed,
+            'added': self.added,
+            'deleted': self.deleted,
+        }
+
+
+class IncrementalState(object):
+    """
+        state of an incremental conversion, in directory `path`
+        (see getIncrementalDir)
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.hashesPath = join(path, 'hashes')
+        self.old = EntryHashes.load(self.hashesPath)
+        if self.old is None:
+            log.info('no hashes of previous run, all entries are new')
+            self.old = EntryHashes()
+        self.new = EntryHashesBuilder()
+        self.stats = IncrementalStats()
+        self._caches = {}
+
+    def check(self, entry):
+        """
+            returns 'unchanged', 'changed' or 'added', and records the entry
+        """
+        key = wordHash(entry.getWords()[0])
+        content = int.from_bytes(entryDigest(entry), 'little')
+        self.new.add(key, content)
+        status = self.old.match(key, content)
+        if status == 'unchanged':
+            self.stats.unchanged += 1
+        elif status == 'changed':
+            self.stats.changed += 1
+        else:
+            self.stats.added += 1
+        return status
+
+    def getWorkCache(self, name, options=None):
+        cache = self._caches.get(name)
+        if cache is None:
+            cache = self._caches[name] = WorkCache(
+                join(self.path, 'cache-%s.db' % name),
+                options,
+            )
+        return cache
+
+    def finish(self):
+        """
+            saves hashes and caches of this run, returns stats
+        """
+        self.stats.deleted = self.old.unmatchedCount()
+        for name, cache in self._caches.items():
+            log.info(
+                'Work cache "%s": %s hits, %s misses' % (
+                    name,
+                    cache.hits,
+                    cache.misses,
+                )
+            )
+            cache.close()
+        self.new.save(self.hashesPath)
+        return self.stats
+
+    def abort(self):
+        """
+            keeps hashes and caches of the previous run
+        """
+        for cache in self._caches.values():
+            cache.close(save=False)
+        self._caches = {}
+
+
+def test_entryHashes(count=20000):
+    import random
+    import tempfile
+    import shutil
+    from .entry import Entry
+    rng = random.Random(0)
+    entries = [
+        Entry('w%d' % i, 'd%d' % rng.randrange(1000))
+        for i in range(count)
+    ]
+    tmpDir = tempfile.mkdtemp(prefix='pyglossary-incremental-')
+    try:
+        state = IncrementalState(tmpDir)
+        for entry in entries:
+            assert state.check(entry) == 'added'
+        state.finish()
+        entries[5] = Entry('w5', 'changed')
+        del entries[10]
+        entries.append(Entry('new', 'new'))
+        state = IncrementalState(tmpDir)
+        for entry in entries:
+            state.check(entry)
+        stats = state.finish().toDict()
+        assert stats == {
+            'unchanged': count - 2,
+            'changed': 1,
+            'added': 1,
+            'deleted': 1,
+        }, stats
+        print('IncrementalState: OK, %s' % stats)
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_entryHashes()
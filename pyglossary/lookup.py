@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""
+random access to glossary files, see Glossary.setLookup
+
+a plugin supports lookups with a `Lookup` class, that uses the index of
+its format (like StarDict's .idx and .syn) instead of reading all entries:
+    Lookup(glos)
+    open(filename, **options)
+    lookup(word): returns a list of Entry objects with headword `word`
+    lookupPrefix(prefix, limit): returns a list of (at most `limit`)
+        headwords that start with `prefix`, in the order of index
+    close()
+
+this module has the parts that are shared by plugins: binary search on
+an index that is accessed by position, a sorted index of words for
+formats whose index is not sorted in a known order, random access to
+dictzip (.dict.dz) files, and an LRU cache
+"""
+
+import os
+import zlib
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict as odict
+
+import logging
+log = logging.getLogger('root')
+
+
+defaultCacheSize = 256  # words
+
+
+def bisectLeft(key, getKey, lo, hi):
+    """
+        like bisect.bisect_left, on positions lo..hi of an index,
+        where getKey(pos) returns the key at `pos`
+    """
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if getKey(mid) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class WordIndex(object):
+    """
+        sorted words, with a position (int) for each word
+        for formats whose index is not sorted, or sorted by an order
+        that can not be reproduced
+        items: iterable of (word, position)
+    """
+    def __init__(self, items):
+        items = sorted(items)
+        self.words = [word for word, _ in items]
+        self.positions = array('Q', [pos for _, pos in items])
+
+    def __len__(self):
+        return len(self.words)
+
+    def find(self, word):
+        """
+            returns the list of positions of `word`
+        """
+        words = self.words
+        start = bisect_left(words, word)
+        end = bisect_right(words, word, start)
+        return list(self.positions[start:end])
+
+    def prefix(self, prefix, limit):
+        """
+            returns the list of (at most `limit`) words that start
+            with `prefix`, without duplicates
+        """
+        words = self.words
+        result = []
+        for index in range(bisect_left(words, prefix), len(words)):
+            word = words[index]
+            if not word.startswith(prefix):
+                break
+            if result and result[-1] == word:
+                continue
+            result.append(word)
+            if len(result) >= limit:
+                break
+        return result
+
+
+class LRUCache(object):
+    def __init__(self, size=defaultCacheSize):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = odict()
+
+    def get(self, key):
+        """
+            returns the cached value, or None
+        """
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        self._data.pop(key, None)
+        if len(self._data) >= self.size:
+            self._data.popitem(last=False)
+        self._data[key] = value
+
+    def clear(self):
+        self._data.clear()
+
+
+class PlainFile(object):
+    """
+        random access to an uncompressed file, like DictzipFile
+    """
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+
+    def read(self, offset, size):
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def close(self):
+        self._file.close()
+
+
+class DictzipFile(object):
+    """
+        random access to a dictzip file (gzip file with a table of
+        chunks in the extra field, see dictzip(1)), only the chunks
+        that contain the requested data are decompressed
+        if the file has no table of chunks (a plain gzip file),
+        reading is done with gzip module (slow)
+    """
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._gzip = None
+        self._chunkLen = 0
+        self._chunkOffsets = None  # offsets of compressed chunks in file
+        self._cacheIndex = -1
+        self._cacheData = b''
+        if not self._readHeader():
+            import gzip
+            log.warning(
+                '"%s" is not a dictzip file' % filename +
+                ', random access is slow'
+            )
+            self._gzip = gzip.open(filename)
+
+    def _readHeader(self):
+        fp = self._file
+        header = fp.read(10)
+        if len(header) < 10 or header[:3] != b'\x1f\x8b\x08':
+            return False
+        flags = header[3]
+        if not flags & 0x04:  # FEXTRA
+            return False
+        extraLen, = struct.unpack('<H', fp.read(2))
+        extra = fp.read(extraLen)
+        pos = 0
+        chunkSizes = None
+        while pos + 4 <= len(extra):
+            subId = extra[pos:pos+2]
+            subLen, = struct.unpack('<H', extra[pos+2:pos+4])
+            data = extra[pos+4:pos+4+subLen]
+            pos += 4 + subLen
+            if subId != b'RA':
+                continue
+            version, chunkLen, chunkCount = struct.unpack('<HHH', data[:6])
+            if version != 1:
+                return False
+            self._chunkLen = chunkLen
+            chunkSizes = struct.unpack(
+                '<%dH' % chunkCount,
+                data[6:6 + 2 * chunkCount],
+            )
+        if chunkSizes is None:
+            return False
+        if flags & 0x08:  # FNAME
+            while fp.read(1) not in (b'\x00', b''):
+                pass
+        if flags & 0x10:  # FCOMMENT
+            while fp.read(1) not in (b'\x00', b''):
+                pass
+        if flags & 0x02:  # FHCRC
+            fp.read(2)
+        offsets = array('Q', [fp.tell()])
+        for size in chunkSizes:
+            offsets.append(offsets[-1] + size)
+        self._chunkOffsets = offsets
+        return True
+
+    def _readChunk(self, index):
+        if index == self._cacheIndex:
+            return self._cacheData
+        start = self._chunkOffsets[index]
+        self._file.seek(start)
+        data = zlib.decompressobj(-zlib.MAX_WBITS).decompress(
+            self._file.read(self._chunkOffsets[index + 1] - start)
+        )
+        self._cacheIndex = index
+        self._cacheData = data
+        return data
+
+    def read(self, offset, size):
+        if self._gzip is not None:
+            self._gzip.seek(offset)
+            return self._gzip.read(size)
+        chunkLen = self._chunkLen
+        lastChunk = len(self._chunkOffsets) - 2
+        parts = []
+        end = offset + size
+        while offset < end:
+            index = offset // chunkLen
+            if index > lastChunk:
+                break
+            chunkStart = index * chunkLen
+            parts.append(self._readChunk(index)[
+                offset - chunkStart:
+                min(end, chunkStart + chunkLen) - chunkStart
+            ])
+            offset = chunkStart + chunkLen
+        return b''.join(parts)
+
+    def close(self):
+        self._file.close()
+        if self._gzip is not None:
+            self._gzip.close()
+
+
+def openDictData(filenameNoExt):
+    """
+        returns a PlainFile or DictzipFile for FILENAME.dict.dz
+        or FILENAME.dict (StarDict and DictOrg)
+    """
+    if os.path.isfile(filenameNoExt + '.dict.dz'):
+        return DictzipFile(filenameNoExt + '.dict.dz')
+    return PlainFile(filenameNoExt + '.dict')
+
+
+def writeDictzip(data, filename, chunkLen=58315):
+    """
+        writes bytes `data` into a dictzip file, with chunks of
+        `chunkLen` bytes, for testing
+    """
+    chunks = []
+    for start in range(0, len(data), chunkLen):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        chunks.append(
+            compressor.compress(data[start:start + chunkLen]) +
+            compressor.flush(zlib.Z_FULL_FLUSH)
+        )
+    extraData = struct.pack('<HHH', 1, chunkLen, len(chunks)) + \
+        struct.pack('<%dH' % len(chunks), *[len(c) for c in chunks])
+    extra = b'RA' + struct.pack('<H', len(extraData)) + extraData
+    with open(filename, 'wb') as fp:
+        fp.write(b'\x1f\x8b\x08\x04' + b'\x00' * 4 + b'\x02\x03')
+        fp.write(struct.pack('<H', len(extra)) + extra)
+        for chunk in chunks:
+            fp.write(chunk)
+        fp.write(zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS).flush())
+        fp.write(struct.pack(
+            '<II',
+            zlib.crc32(data) & 0xffffffff,
+            len(data) & 0xffffffff,
+        ))
+
+
+def test_lookup():
+    import random
+    import tempfile
+    import shutil
+    rng = random.Random(0)
+    words = ['w%d' % rng.randrange(1000) for _ in range(2000)]
+    index = WordIndex((word, pos) for pos, word in enumerate(words))
+    assert index.find('w5') == [
+        pos for pos, word in enumerate(words) if word == 'w5'
+    ]
+    assert index.prefix('w99', 100) == sorted(set(
+        word for word in words if word.startswith('w99')
+    ))
+    keys = sorted(words)
+    for key in ('w0', 'w500', 'x'):
+        assert bisectLeft(key, keys.__getitem__, 0, len(keys)) == \
+            bisect_left(keys, key)
+
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1
+
+    data = bytes(rng.randrange(256) for _ in range(300000))
+    tmpDir = tempfile.mkdtemp(prefix='pyglossary-lookup-')
+    try:
+        path = os.path.join(tmpDir, 'test.dict.dz')
+        writeDictzip(data, path, chunkLen=10000)
+        import gzip
+        with gzip.open(path) as fp:
+            assert fp.read() == data
+        dz = DictzipFile(path)
+        for _ in range(200):
+            offset = rng.randrange(len(data))
+            size = rng.randrange(30000)
+            assert dz.read(offset, size) == data[offset:offset + size]
+        dz.close()
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    print('lookup: OK')
+
+
+if __name__ == '__main__':
+    test_lookup()
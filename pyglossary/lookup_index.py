@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+"""
+lookup index file, for random access to glossary files of any readable
+format, see Glossary.setLookup(index=True) and Glossary.buildLookupIndex
+
+the index is built by reading all entries once (streaming), and written
+into a sidecar file next to the glossary file (FILENAME.lookup), that is
+memory-mapped by lookups, so opening it takes almost no time
+it's built again if the glossary file (or read options) is changed
+
+file layout (little-endian):
+    magic
+    table of sections: (offset, size) of every section, uint64
+    metadata: uint32 size, and JSON
+    sections (8-byte aligned):
+        keys: sorted key records, every record is the normalized word
+            (see normalizeKey), b'\\x00' and the word, in utf-8
+        keyOffsets: uint64 offsets of key records (keyCount + 1)
+        keyEntries: uint32 entry number of every key record
+        jump: uint32 number of key records before every 2-byte prefix
+            (65536 + 1), so binary search is done inside one prefix
+        bloom: Bloom filter of normalized words, so lookups of missing
+            words don't touch the keys
+        blocks: zlib-compressed blocks of entries, one JSON per line
+        blockOffsets: uint64 offsets of blocks (blockCount + 1)
+        blockEntries: uint32 number of first entry of every block
+"""
+
+import os
+from os.path import abspath
+import sys
+import json
+import mmap
+import shutil
+import struct
+import zlib
+import unicodedata
+from array import array
+from bisect import bisect_right
+from hashlib import blake2b
+
+from . import VERSION
+from .entry import Entry
+from .lookup import bisectLeft
+
+import logging
+log = logging.getLogger('root')
+
+
+indexMagic = b'PGLOOKUP1\n'
+sectionNames = (
+    'keys',
+    'keyOffsets',
+    'keyEntries',
+    'jump',
+    'bloom',
+    'blocks',
+    'blockOffsets',
+    'blockEntries',
+)
+_sectionTable = struct.Struct('<%dQ' % (2 * len(sectionNames)))
+_jumpSize = 65536 + 1
+defaultBlockSize = 32 * 1024  # bytes of entries (before compression)
+bloomBitsPerKey = 10
+bloomHashCount = 7  # about 1% false positives with 10 bits per key
+
+
+def getLookupIndexPath(filename):
+    return abspath(filename) + '.lookup'
+
+
+def getSourceInfo(filename, format, options):
+    """
+        returns what identifies the source of an index (JSON-serializable)
+        the index is built again if any of them is changed
+    """
+    st = os.stat(filename)
+    return {
+        'version': VERSION,
+        'format': format,
+        'options': options,
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+    }
+
+
+def normalizeKey(word):
+    """
+        case-folded and decomposed (NFD) word, so normalized words of
+        words that start with `prefix` start with normalizeKey(prefix)
+    """
+    return unicodedata.normalize('NFD', word.casefold()).replace('\x00', '')
+
+
+def _keyRecord(word):
+    return normalizeKey(word).encode('utf-8') + b'\x00' + word.encode('utf-8')
+
+
+def _prefixRange(key):
+    """
+        returns (start, end) indexes in jump table of records
+        that start with bytes `key`
+    """
+    if len(key) >= 2:
+        prefix = (key[0] << 8) | key[1]
+        return prefix, prefix + 1
+    if len(key) == 1:
+        return key[0] << 8, (key[0] + 1) << 8
+    return 0, _jumpSize - 1
+
+
+def _bloomPositions(key, bitCount):
+    digest = blake2b(key, digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % bitCount for i in range(bloomHashCount)]
+
+
+def _arrayBytes(arr):
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def writeLookupIndex(path, entries, sourceInfo, blockSize=defaultBlockSize):
+    """
+        writes the lookup index of Entry objects `entries` into `path`
+        definitions are kept in compressed blocks in a temp file while
+        reading, only the keys are kept in memory (to be sorted)
+        returns the number of entries
+    """
+    tmpPath = '%s.%s.tmp' % (path, os.getpid())
+    blocksPath = tmpPath + '.blocks'
+    keys = []  # list of (keyRecord, entryNumber)
+    blockOffsets = array('Q', [0])
+    blockEntries = array('I')
+    block = []
+    blockBytes = 0
+    entryCount = 0
+    try:
+        with open(blocksPath, 'wb') as blocksFile:
+            def flush():
+                data = zlib.compress(b'\n'.join(block))
+                blocksFile.write(data)
+                blockOffsets.append(blockOffsets[-1] + len(data))
+            for entry in entries:
+                words = entry.getWords()
+                for word in words:
+                    keys.append((_keyRecord(word), entryCount))
+                defis = entry.getDefis()
+                if not block:
+                    blockEntries.append(entryCount)
+                item = json.dumps(
+                    [words, defis, entry.getDefiFormat()],
+                    ensure_ascii=False,
+                ).encode('utf-8')
+                block.append(item)
+                blockBytes += len(item)
+                entryCount += 1
+                if blockBytes >= blockSize:
+                    flush()
+                    block = []
+                    blockBytes = 0
+            if block:
+                flush()
+        keys.sort()
+        _writeIndexFile(
+            tmpPath,
+            blocksPath,
+            keys,
+            blockOffsets,
+            blockEntries,
+            {
+                'source': sourceInfo,
+                'keyCount': len(keys),
+                'entryCount': entryCount,
+                'blockCount': len(blockEntries),
+            },
+        )
+        os.replace(tmpPath, path)
+    finally:
+        for tmp in (blocksPath, tmpPath):
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+    return entryCount
+
+
+def _writeIndexFile(path, blocksPath, keys, blockOffsets, blockEntries, meta):
+    keyOffsets = array('Q', [0])
+    keyEntries = array('I')
+    jump = array('I', bytes(4 * _jumpSize))
+    normKeys = set()
+    for record, entryNumber in keys:
+        keyOffsets.append(keyOffsets[-1] + len(record))
+        keyEntries.append(entryNumber)
+        jump[_prefixRange(record)[0] + 1] += 1
+        normKeys.add(record[:record.index(b'\x00')])
+    for index in range(1, _jumpSize):
+        jump[index] += jump[index - 1]
+
+    bloomBits = max(64, bloomBitsPerKey * len(normKeys))
+    bloomBits += -bloomBits % 8
+    bloom = bytearray(bloomBits // 8)
+    for key in normKeys:
+        for pos in _bloomPositions(key, bloomBits):
+            bloom[pos >> 3] |= 1 << (pos & 7)
+    meta['bloomBits'] = bloomBits
+    del normKeys
+
+    sections = [
+        b''.join([record for record, _ in keys]),
+        _arrayBytes(keyOffsets),
+        _arrayBytes(keyEntries),
+        _arrayBytes(jump),
+        bytes(bloom),
+        None,  # blocks, copied from blocksPath
+        _arrayBytes(blockOffsets),
+        _arrayBytes(blockEntries),
+    ]
+    sizes = [
+        blockOffsets[-1] if data is None else len(data)
+        for data in sections
+    ]
+    metaBytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    offset = len(indexMagic) + _sectionTable.size + 4 + len(metaBytes)
+    table = []
+    for size in sizes:
+        offset += -offset % 8
+        table += [offset, size]
+        offset += size
+    with open(path, 'wb') as fp:
+        fp.write(indexMagic)
+        fp.write(_sectionTable.pack(*table))
+        fp.write(struct.pack('<I', len(metaBytes)) + metaBytes)
+        for index, data in enumerate(sections):
+            fp.write(bytes(table[2 * index] - fp.tell()))
+            if data is None:
+                with open(blocksPath, 'rb') as blocksFile:
+                    shutil.copyfileobj(blocksFile, fp)
+            else:
+                fp.write(data)
+
+
+class LookupIndex(object):
+    """
+        lookups in a lookup index file, like `Lookup` classes of plugins
+        (see pyglossary.lookup)
+    """
+    def __init__(self, glos):
+        self._glos = glos
+        self._file = None
+        self._mmap = None
+        self._views = []
+        self._blockCache = (-1, None)
+        self.meta = None
+
+    def open(self, path, sourceInfo=None):
+        """
+            returns False if there is no valid index file in `path`,
+            or it's not built from the same source (see getSourceInfo)
+        """
+        try:
+            self._file = open(path, 'rb')
+        except FileNotFoundError:
+            return False
+        try:
+            self._mmap = mmap.mmap(
+                self._file.fileno(),
+                0,
+                access=mmap.ACCESS_READ,
+            )
+        except ValueError:  # empty file
+            self.close()
+            return False
+        mm = self._mmap
+        headerSize = len(indexMagic) + _sectionTable.size + 4
+        if len(mm) < headerSize or mm[:len(indexMagic)] != indexMagic:
+            log.warning('invalid lookup index file "%s"' % path)
+            self.close()
+            return False
+        table = _sectionTable.unpack_from(mm, len(indexMagic))
+        metaSize, = struct.unpack_from('<I', mm, headerSize - 4)
+        self.meta = json.loads(mm[headerSize:headerSize + metaSize].decode('utf-8'))
+        if sourceInfo is not None and json.dumps(
+            self.meta['source'],
+            sort_keys=True,
+        ) != json.dumps(sourceInfo, sort_keys=True):
+            log.info('lookup index "%s" is out of date' % path)
+            self.close()
+            return False
+        sections = {}
+        for index, name in enumerate(sectionNames):
+            offset, size = table[2 * index], table[2 * index + 1]
+            sections[name] = self._view(offset, size)
+        self._keys = sections['keys']
+        self._keyOffsets = self._cast(sections['keyOffsets'], 'Q')
+        self._keyEntries = self._cast(sections['keyEntries'], 'I')
+        self._jump = self._cast(sections['jump'], 'I')
+        self._bloom = sections['bloom']
+        self._blocks = sections['blocks']
+        self._blockOffsets = self._cast(sections['blockOffsets'], 'Q')
+        self._blockEntries = self._cast(sections['blockEntries'], 'I')
+        self._keyCount = self.meta['keyCount']
+        self._bloomBits = self.meta['bloomBits']
+        return True
+
+    def _view(self, offset, size):
+        view = memoryview(self._mmap)[offset:offset + size]
+        self._views.append(view)
+        return view
+
+    def _cast(self, view, typecode):
+        if sys.byteorder == 'little':
+            view = view.cast(typecode)
+            self._views.append(view)
+            return view
+        arr = array(typecode, bytes(view))
+        arr.byteswap()
+        return arr
+
+    def close(self):
+        # memory views must be released before closing mmap
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._blockCache = (-1, None)
+
+    def __len__(self):
+        return self.meta['entryCount']
+
+    def _record(self, index):
+        return bytes(self._keys[
+            self._keyOffsets[index]:self._keyOffsets[index + 1]
+        ])
+
+    def _findFirst(self, key):
+        """
+            returns index of first key record that is not less than `key`
+        """
+        start, end = _prefixRange(key)
+        return bisectLeft(
+            key,
+            self._record,
+            self._jump[start],
+            self._jump[end],
+        )
+
+    def mayContain(self, word):
+        """
+            returns False if no word is the same as `word` after
+            normalization (see normalizeKey)
+        """
+        bloom = self._bloom
+        for pos in _bloomPositions(
+            normalizeKey(word).encode('utf-8'),
+            self._bloomBits,
+        ):
+            if not bloom[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def _getEntry(self, entryNumber):
+        blockIndex = bisect_right(self._blockEntries, entryNumber) - 1
+        cachedIndex, lines = self._blockCache
+        if cachedIndex != blockIndex:
+            lines = zlib.decompress(self._blocks[
+                self._blockOffsets[blockIndex]:
+                self._blockOffsets[blockIndex + 1]
+            ]).split(b'\n')
+            self._blockCache = (blockIndex, lines)
+        words, defis, defiFormat = json.loads(
+            lines[entryNumber - self._blockEntries[blockIndex]].decode('utf-8')
+        )
+        return Entry(words, defis, defiFormat=defiFormat)
+
+    def lookup(self, word):
+        if not self.mayContain(word):
+            return []
+        record = _keyRecord(word)
+        entryNumbers = []
+        index = self._findFirst(record)
+        while index < self._keyCount and self._record(index) == record:
+            entryNumbers.append(self._keyEntries[index])
+            index += 1
+        return [
+            self._getEntry(entryNumber)
+            for entryNumber in sorted(set(entryNumbers))
+        ]
+
+    def lookupPrefix(self, prefix, limit):
+        """
+            words are in the order of normalized words (ignoring case)
+        """
+        normPrefix = normalizeKey(prefix).encode('utf-8')
+        prefixBytes = prefix.encode('utf-8')
+        words = []
+        index = self._findFirst(normPrefix)
+        while index < self._keyCount and len(words) < limit:
+            record = self._record(index)
+            index += 1
+            if not record.startswith(normPrefix):
+                break
+            word = record[record.index(b'\x00') + 1:]
+            if word.startswith(prefixBytes):
+                word = word.decode('utf-8')
+                if word not in words:
+                    words.append(word)
+        return words
+
+
+def test_lookupIndex(count=5000):
+    import random
+    import tempfile
+    rng = random.Random(0)
+    letters = 'abcABCéÉ́xyz'
+    entries = []
+    for index in range(count):
+        words = [
+            ''.join(rng.choice(letters) for _ in range(rng.randint(1, 6)))
+            for _ in range(rng.randint(1, 3))
+        ]
+        entries.append(Entry(words, 'defi %d' % index))
+    expected = {}
+    for entry in entries:
+        for word in entry.getWords():
+            expected.setdefault(word, []).append(entry.getDefi())
+    tmpDir = tempfile.mkdtemp(prefix='pyglossary-lookup-index-')
+    try:
+        path = os.path.join(tmpDir, 'test.lookup')
+        sourceInfo = {'test': 1}
+        writeLookupIndex(path, iter(entries), sourceInfo, blockSize=1000)
+        index = LookupIndex(None)
+        assert not index.open(path, {'test': 2})
+        assert index.open(path, sourceInfo)
+        assert len(index) == count
+        for word in list(expected)[:500] + ['missing', '']:
+            defis = [entry.getDefi() for entry in index.lookup(word)]
+            assert defis == sorted(
+                set(expected.get(word, [])),
+                key=lambda defi: int(defi.split()[1]),
+            ), word
+        allWords = sorted(expected)
+        for prefix in ('a', 'É', 'ab', 'xé', ''):
+            words = index.lookupPrefix(prefix, 1000000)
+            assert sorted(words) == [
+                word for word in allWords if word.startswith(prefix)
+            ], prefix
+        index.close()
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    print('LookupIndex: OK')
+
+
+if __name__ == '__main__':
+    test_lookupIndex()
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+threaded producer/consumer pipeline, see Glossary.setPipeline
+
+the producer thread iterates over the source (reader, filters, ...),
+and puts batches of items into a bounded queue, and the consumer
+(the writer, in the calling thread) takes them from the queue
+
+so I/O and decompression (which release the GIL) in one thread overlap
+with Python code in the other thread, and the producer is blocked when
+the queue is full (back-pressure)
+
+an exception in the producer is raised in the consumer (with the
+traceback of producer), and if the consumer stops early (or fails),
+the producer is stopped and the source is closed in the producer thread
+
+code that runs in the producer thread can use callInConsumer to run
+functions that are not thread-safe (like updating progress of a GUI)
+in the consumer thread
+"""
+
+import threading
+from collections import deque
+from queue import Queue, Full, Empty
+from time import perf_counter
+
+import logging
+log = logging.getLogger('root')
+
+
+defaultQueueSize = 16  # batches
+defaultBatchSize = 256  # items
+
+# seconds to wait for the producer thread to stop, after the consumer
+# stops early (the producer may be in a long step, like sorting)
+stopTimeout = 1.0
+
+_end = object()
+
+
+class _ProducerError(object):
+    def __init__(self, error):
+        self.error = error
+
+
+class PipelineStats(object):
+    def __init__(self, queueSize, batchSize):
+        self.queueSize = queueSize
+        self.batchSize = batchSize
+        self.items = 0
+        self.batches = 0
+        self.maxDepth = 0  # in batches
+        self._depthSum = 0
+        self.fullCount = 0  # times the producer was blocked (back-pressure)
+        self.fullSeconds = 0.0
+        self.emptyCount = 0  # times the consumer waited for the producer
+        self.emptySeconds = 0.0
+
+    def getAverageDepth(self):
+        if not self.batches:
+            return 0.0
+        return self._depthSum / self.batches
+
+    def toDict(self):
+        return {
+            'queueSize': self.queueSize,
+            'batchSize': self.batchSize,
+            'items': self.items,
+            'batches': self.batches,
+            'maxDepth': self.maxDepth,
+            'averageDepth': self.getAverageDepth(),
+            'producerBlockedCount': self.fullCount,
+            'producerBlockedSeconds': self.fullSeconds,
+            'consumerWaitCount': self.emptyCount,
+            'consumerWaitSeconds': self.emptySeconds,
+        }
+
+    def format(self):
+        return (
+            'queue depth: average %.1f, max %s of %s batches' % (
+                self.getAverageDepth(),
+                self.maxDepth,
+                self.queueSize,
+            ) +
+            ', producer blocked: %.1f seconds' % self.fullSeconds +
+            ', consumer waited: %.1f seconds' % self.emptySeconds
+        )
+
+
+def callInConsumer(func, *args):
+    """
+        runs `func(*args)` in the consumer thread if called in a producer
+        thread of pipelineIter (later, when the consumer takes a batch or
+        waits for one), or right now in any other thread
+    """
+    calls = getattr(threading.current_thread(), 'consumerCalls', None)
+    if calls is None:
+        func(*args)
+        return
+    calls.append((func, args))
+
+
+def _runCalls(calls):
+    while calls:
+        func, args = calls.popleft()
+        func(*args)
+
+
+def _produce(iterable, queue, stopEvent, batchSize, stats):
+    def put(item):
+        try:
+            queue.put_nowait(item)
+            return True
+        except Full:
+            pass
+        stats.fullCount += 1
+        t0 = perf_counter()
+        try:
+            while not stopEvent.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+        finally:
+            stats.fullSeconds += perf_counter() - t0
+
+    it = iter(iterable)
+    isStopped = stopEvent.is_set
+    try:
+        batch = []
+        for item in it:
+            if isStopped():
+                return
+            batch.append(item)
+            if len(batch) >= batchSize:
+                if not put(batch):
+                    return
+                batch = []
+        if batch and not put(batch):
+            return
+        put(_end)
+    except BaseException as e:
+        put(_ProducerError(e))
+    finally:
+        # close the source in this thread, if the consumer stopped early
+        close = getattr(it, 'close', None)
+        if close is not None:
+            close()
+
+
+def pipelineIter(
+    iterable,
+    queueSize=defaultQueueSize,
+    batchSize=defaultBatchSize,
+    stats=None,
+):
+    """
+        yields items of `iterable`, which is iterated in a producer thread
+        queueSize: maximum number of batches in the queue
+        batchSize: number of items put into the queue at once
+        stats: a PipelineStats instance, or None
+    """
+    if stats is None:
+        stats = PipelineStats(queueSize, batchSize)
+    queue = Queue(maxsize=queueSize)
+    stopEvent = threading.Event()
+    thread = threading.Thread(
+        target=_produce,
+        args=(iterable, queue, stopEvent, batchSize, stats),
+        name='PipelineProducer',
+        daemon=True,
+    )
+    calls = thread.consumerCalls = deque()
+    thread.start()
+    try:
+        while True:
+            depth = queue.qsize()
+            try:
+                batch = queue.get_nowait()
+            except Empty:
+                stats.emptyCount += 1
+                t0 = perf_counter()
+                while True:
+                    _runCalls(calls)
+                    try:
+                        batch = queue.get(timeout=0.1)
+                        break
+                    except Empty:
+                        pass
+                stats.emptySeconds += perf_counter() - t0
+            _runCalls(calls)
+            if batch is _end:
+                return
+            if isinstance(batch, _ProducerError):
+                raise batch.error
+            stats.batches += 1
+            stats.items += len(batch)
+            stats._depthSum += depth
+            if depth > stats.maxDepth:
+                stats.maxDepth = depth
+            yield from batch
+    finally:
+        stopEvent.set()
+        thread.join(stopTimeout)
+        if thread.is_alive():
+            log.warning(
+                'pipeline producer is still running, not waiting for it'
+                ' (it stops at its next entry)'
+            )
+
+
+def test_pipelineIter():
+    import time
+    stats = PipelineStats(4, 10)
+    assert list(pipelineIter(range(1000), 4, 10, stats)) == list(range(1000))
+    assert stats.items == 1000 and stats.batches == 100, stats.toDict()
+
+    def failing():
+        yield 1
+        raise ValueError('test')
+    try:
+        list(pipelineIter(failing()))
+    except ValueError as e:
+        assert str(e) == 'test'
+    else:
+        raise AssertionError('exception not propagated')
+
+    closed = []
+
+    def source():
+        try:
+            for i in range(100000):
+                yield i
+        finally:
+            closed.append(threading.current_thread().name)
+    it = pipelineIter(source(), 2, 10)
+    assert next(it) == 0
+    it.close()
+    assert closed == ['PipelineProducer'], closed
+
+    calledIn = []
+
+    def callingSource():
+        for i in range(100):
+            callInConsumer(
+                lambda: calledIn.append(threading.current_thread().name),
+            )
+            yield i
+    assert list(pipelineIter(callingSource(), 2, 10)) == list(range(100))
+    assert calledIn == [threading.current_thread().name] * 100, calledIn
+
+    def slowSource():
+        yield 0
+        time.sleep(stopTimeout * 3)
+        yield 1
+    it = pipelineIter(slowSource(), 2, 1)
+    assert next(it) == 0
+    t0 = perf_counter()
+    it.close()
+    assert perf_counter() - t0 < stopTimeout * 2
+    print('pipelineIter: OK')
+
+
+if __name__ == '__main__':
+    test_pipelineIter()
@@ -22,6 +22,7 @@ log = logging.getLogger('root')
 
 from struct import pack, unpack
 from io import BytesIO
+from bisect import bisect_right
 import re
 import sys
 
@@ -528,15 +529,17 @@ class MDX(MDict):
                 txt_styled = txt_styled + style[0] + p + style[1]
         return txt_styled
 
-    def _decode_record_block(self):
-        f = open(self._fname, 'rb')
-        f.seek(self._record_block_offset)
-
+    def _read_record_block_info(self, f):
+        """
+        Read record block info section from file object `f`,
+        at the beginning of record section
+        Return a list of (compressed_size, decompressed_size)
+        """
         num_record_blocks = self._read_number(f)
         num_entries = self._read_number(f)
         assert(num_entries == self._num_entries)
         record_block_info_size = self._read_number(f)
-        record_block_size = self._read_number(f)
+        self._record_block_size = self._read_number(f)
 
         # record block info section
         record_block_info_list = []
@@ -547,37 +550,64 @@ class MDX(MDict):
             record_block_info_list += [(compressed_size, decompressed_size)]
             size_counter += self._number_width * 2
         assert(size_counter == record_block_info_size)
+        return record_block_info_list
+
+    def _decompress_record_block(self, record_block_compressed, decompressed_size):
+        """
+        Return decompressed record block, or None if its compression
+        is not supported
+        """
+        # 4 bytes indicates block compression type
+        record_block_type = record_block_compressed[:4]
+        # 4 bytes adler checksum of uncompressed content
+        adler32 = unpack('>I', record_block_compressed[4:8])[0]
+        # no compression
+        if record_block_type == b'\x00\x00\x00\x00':
+            record_block = record_block_compressed[8:]
+        # lzo compression
+        elif record_block_type == b'\x01\x00\x00\x00':
+            if lzo is None:
+                print("LZO compression is not supported")
+                return None
+            # decompress
+            header = b'\xf0' + pack('>I', decompressed_size)
+            record_block = lzo.decompress(header + record_block_compressed[8:])
+        # zlib compression
+        elif record_block_type == b'\x02\x00\x00\x00':
+            # decompress
+            record_block = zlib.decompress(record_block_compressed[8:])
+
+        # notice that adler32 return signed value
+        assert(adler32 == zlib.adler32(record_block) & 0xffffffff)
+
+        assert(len(record_block) == decompressed_size)
+        return record_block
+
+    def _decode_record(self, record):
+        # convert to utf-8
+        record = record.decode(self._encoding, errors='ignore').strip(unicode('\x00')).encode('utf-8')
+        # substitute styles
+        if self._substyle and self._stylesheet:
+            record = self._substitute_stylesheet(record)
+        return record
+
+    def _decode_record_block(self):
+        f = open(self._fname, 'rb')
+        f.seek(self._record_block_offset)
+
+        record_block_info_list = self._read_record_block_info(f)
 
         # actual record block data
         offset = 0
         i = 0
         size_counter = 0
         for compressed_size, decompressed_size in record_block_info_list:
-            record_block_compressed = f.read(compressed_size)
-            # 4 bytes indicates block compression type
-            record_block_type = record_block_compressed[:4]
-            # 4 bytes adler checksum of uncompressed content
-            adler32 = unpack('>I', record_block_compressed[4:8])[0]
-            # no compression
-            if record_block_type == b'\x00\x00\x00\x00':
-                record_block = record_block_compressed[8:]
-            # lzo compression
-            elif record_block_type == b'\x01\x00\x00\x00':
-                if lzo is None:
-                    print("LZO compression is not supported")
-                    break
-                # decompress
-                header = b'\xf0' + pack('>I', decompressed_size)
-                record_block = lzo.decompress(header + record_block_compressed[8:])
-            # zlib compression
-            elif record_block_type == b'\x02\x00\x00\x00':
-                # decompress
-                record_block = zlib.decompress(record_block_compressed[8:])
-
-            # notice that adler32 return signed value
-            assert(adler32 == zlib.adler32(record_block) & 0xffffffff)
-
-            assert(len(record_block) == decompressed_size)
+            record_block = self._decompress_record_block(
+                f.read(compressed_size),
+                decompressed_size,
+            )
+            if record_block is None:
+                break
             # split record block according to the offset info from key block
             while i < len(self._key_list):
                 record_start, key_text = self._key_list[i]
@@ -591,19 +621,63 @@ class MDX(MDict):
                     record_end = len(record_block) + offset
                 i += 1
                 record = record_block[record_start-offset:record_end-offset]
-                # convert to utf-8
-                record = record.decode(self._encoding, errors='ignore').strip(unicode('\x00')).encode('utf-8')
-                # substitute styles
-                if self._substyle and self._stylesheet:
-                    record = self._substitute_stylesheet(record)
-
-                yield key_text, record
+                yield key_text, self._decode_record(record)
             offset += len(record_block)
             size_counter += compressed_size
-        assert(size_counter == record_block_size)
+        assert(size_counter == self._record_block_size)
 
         f.close()
 
+    def _read_record_block_index(self):
+        """
+        Read record block info for random access by get_record
+        """
+        with open(self._fname, 'rb') as f:
+            f.seek(self._record_block_offset)
+            record_block_info_list = self._read_record_block_info(f)
+            file_offset = f.tell()
+        # (decompressed offset, file offset, compressed size, decompressed size)
+        self._record_block_index = []
+        offset = 0
+        for compressed_size, decompressed_size in record_block_info_list:
+            self._record_block_index.append(
+                (offset, file_offset, compressed_size, decompressed_size)
+            )
+            offset += decompressed_size
+            file_offset += compressed_size
+        self._record_block_starts = [item[0] for item in self._record_block_index]
+        self._record_block_cache = (-1, None)
+
+    def get_record(self, index):
+        """
+        Return the record (utf-8 encoded) of key `index` of key list
+        only the record block that contains it is read and decompressed
+        Return None if the record block can not be decompressed
+        """
+        if not hasattr(self, '_record_block_index'):
+            self._read_record_block_index()
+        record_start = self._key_list[index][0]
+        block_index = bisect_right(self._record_block_starts, record_start) - 1
+        offset, file_offset, compressed_size, decompressed_size = \
+            self._record_block_index[block_index]
+        cached_index, record_block = self._record_block_cache
+        if cached_index != block_index:
+            with open(self._fname, 'rb') as f:
+                f.seek(file_offset)
+                record_block = self._decompress_record_block(
+                    f.read(compressed_size),
+                    decompressed_size,
+                )
+            if record_block is None:
+                return None
+            self._record_block_cache = (block_index, record_block)
+        if index < len(self._key_list)-1:
+            record_end = self._key_list[index+1][0]
+        else:
+            record_end = len(record_block) + offset
+        return self._decode_record(
+            record_block[record_start-offset:record_end-offset]
+        )
 
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+cached manifest of plugins metadata (format, extentions, options, ...)
+so that plugin modules don't need to be imported on startup
+
+the manifest of a plugin directory is invalidated if any module in that
+directory is added, removed or modified (by modification time), or any
+module that plugins share (see sharedPaths) is modified
+"""
+
+import os
+import sys
+from os.path import join, isfile, isdir, dirname
+import json
+
+from . import VERSION
+from .core import cacheDir
+
+import logging
+log = logging.getLogger('root')
+
+
+manifestFile = join(cacheDir, 'plugins.json')
+
+_pkgDir = dirname(__file__)
+
+# modules imported by plugins of any directory, that may change
+# their metadata
+sharedPaths = (
+    join(_pkgDir, 'plugins', 'formats_common.py'),
+    join(_pkgDir, 'plugins', 'paths.py'),
+    join(_pkgDir, 'plugin_lib'),
+)
+
+
+def getPluginMtime(directory, pluginName):
+    """
+        returns modification time of plugin module,
+        or the latest modification time of files in plugin package
+    """
+    path = join(directory, pluginName + '.py')
+    if isfile(path):
+        return os.stat(path).st_mtime
+    return _getDirMtime(join(directory, pluginName))
+
+
+def getSharedMtimes():
+    """
+        returns dict of path => modification time (the latest one for
+        a directory) of sharedPaths
+    """
+    mtimes = {}
+    for path in sharedPaths:
+        if isfile(path):
+            mtimes[path] = os.stat(path).st_mtime
+        else:
+            mtimes[path] = _getDirMtime(path)
+    return mtimes
+
+
+def _getDirMtime(path):
+    if not isdir(path):
+        return 0
+    mtime = os.stat(path).st_mtime
+    for dirPath, dirNames, fnames in os.walk(path):
+        if '__pycache__' in dirNames:
+            dirNames.remove('__pycache__')
+        for fname in fnames:
+            mtime = max(mtime, os.stat(join(dirPath, fname)).st_mtime)
+    return mtime
+
+
+def _loadManifest():
+    try:
+        with open(manifestFile, encoding='utf-8') as fp:
+            data = json.load(fp)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log.debug('invalid plugins manifest "%s": %s' % (manifestFile, e))
+        return {}
+    if data.get('version') != VERSION or \
+            data.get('python') != list(sys.version_info[:2]):
+        return {}
+    return data.get('dirs', {})
+
+
+def loadPluginsManifest(directory, mtimes):
+    """
+        mtimes: dict of pluginName => modification time,
+            for all modules in `directory`
+        returns the list of cached plugins metadata of `directory`,
+        or None if there is no valid (up-to-date) manifest for it
+    """
+    dirData = _loadManifest().get(directory)
+    if not dirData:
+        return None
+    if dirData.get('mtimes') != mtimes or \
+            dirData.get('sharedMtimes') != getSharedMtimes():
+        log.debug('plugins manifest is outdated for %r' % directory)
+        return None
+    return dirData['plugins']
+
+
+def savePluginsManifest(directory, mtimes, plugins):
+    """
+        saves metadata of plugins of `directory`, see loadPluginsManifest
+        failing to save is not an error, plugins are just imported on
+        next startup again
+    """
+    dirs = _loadManifest()
+    dirs[directory] = {
+        'mtimes': mtimes,
+        'sharedMtimes': getSharedMtimes(),
+        'plugins': plugins,
+    }
+    data = {
+        'version': VERSION,
+        'python': list(sys.version_info[:2]),
+        'dirs': dirs,
+    }
+    tmpFile = '%s.%s.tmp' % (manifestFile, os.getpid())
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        with open(tmpFile, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, ensure_ascii=False, indent='\t')
+        os.replace(tmpFile, manifestFile)
+    except Exception as e:
+        log.debug('failed to save plugins manifest: %s' % e)
+        try:
+            os.remove(tmpFile)
+        except OSError:
+            pass
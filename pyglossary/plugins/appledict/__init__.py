@@ -212,7 +212,11 @@ def write(glos, fpath, cleanHTML="yes", css=None, xsl=None, defaultPrefs=None, p
     res = safe_listdir_set(glos.resPath).union(safe_listdir_set(OtherResources))
     res -= {css, xsl, prefsHTML, frontBackMatter}
 
-    with indir(basename, create=True, clear=True):
+    # when resuming from checkpoint, keep the files written before
+    resume = glos.getWriterResume()
+    # the output is the directory, not fpath
+    glos.addOutputFile(basename)
+    with indir(basename, create=True, clear=resume is None):
         write_plist(glos, dict_name + '.plist', xsl=xsl, defaultPrefs=defaultPrefs, prefsHTML=prefsHTML, frontBackMatter=frontBackMatter)
         write_xml(glos, dict_name + '.xml', cleanHTML=="yes", frontBackMatter=frontBackMatter, indexes=indexes)
         write_css(dict_name + '.css', css)
@@ -26,7 +26,7 @@ from xml.sax.saxutils import unescape, quoteattr
 import xdxf
 
 from . import _normalize
-from pyglossary.plugins.formats_common import log, toStr
+from pyglossary.plugins.formats_common import log, toStr, openResumable
 
 def dictionary_begin(glos, f, frontBackMatter):
     # write header
@@ -64,8 +64,7 @@ def base36(x):
     digits.reverse()
     return ''.join(digits)
 
-def id_generator():
-    cnt = 1
+def id_generator(cnt=1):
 
     while True:
         s = '_%s' % base36(cnt)
@@ -248,9 +247,16 @@ def write_entries(glos, f, cleanHTML, indexes):
         BeautifulSoup = None
 
     # write entries
-    generate_id = id_generator()
+    resume = glos.getWriterResume()
+    idCount = resume['state']['idCount'] if resume else 0
+    generate_id = id_generator(idCount + 1)
     generate_indexes = indexes_generator(indexes)
-    _buffer = ''
+    glos.setWriterCheckpoint(lambda: ({'idCount': idCount}, [f]))
+    # cleaned content and indexes of entries, in incremental mode
+    cache = glos.getWorkCache('AppleDict', {
+        'BeautifulSoup': bool(BeautifulSoup),
+        'indexes': indexes,
+    })
 
     xdxf.xdxf_init()
 
@@ -267,6 +273,7 @@ def write_entries(glos, f, cleanHTML, indexes):
             continue
 
         _id = next(generate_id)
+        idCount += 1
         if BeautifulSoup:
             title_attr = BeautifulSoup.dammit.EntitySubstitution.substitute_xml(long_title, True)
         else:
@@ -277,33 +284,41 @@ def write_entries(glos, f, cleanHTML, indexes):
             'title': title_attr,
         }
 
-        if format == 'x':
-            content = xdxf.xdxf_to_html(defi)
-            content = format_clean_content(None, content, BeautifulSoup)
+        cached = None
+        if cache is not None:
+            cache_key = cache.getKey(entry)
+            cached = cache.get(cache_key)
+
+        if cached:
+            content, indexes = cached
         else:
-            content = defi
-            content = format_clean_content(long_title, content, BeautifulSoup)
+            if format == 'x':
+                content = xdxf.xdxf_to_html(defi)
+                content = format_clean_content(None, content, BeautifulSoup)
+            else:
+                content = defi
+                content = format_clean_content(long_title, content, BeautifulSoup)
 
-        indexes = generate_indexes(long_title, alts, content, BeautifulSoup)
+            indexes = generate_indexes(long_title, alts, content, BeautifulSoup)
+            if cache is not None:
+                cache.put(cache_key, (content, indexes))
 
         end_entry = '\n</d:entry>\n'
 
-        _buffer += begin_entry
-        _buffer += indexes
-        _buffer += content
-        _buffer += end_entry
-
-        if i % 1000 == 0:
-            f.write(_buffer)
-            _buffer = ''
-    f.write(_buffer)
+        # file object is buffered, and the checkpoint flushes it
+        f.write(begin_entry)
+        f.write(indexes)
+        f.write(content)
+        f.write(end_entry)
 
 def dictionary_end(glos, f):
     f.write('</d:dictionary>\n')
 
 
 def write_xml(glos, filename, cleanHTML, frontBackMatter, indexes):
-    with open(filename, 'w') as f:
-        dictionary_begin(glos, f, frontBackMatter)
+    resume = glos.getWriterResume()
+    with openResumable(filename, 'w', resume) as f:
+        if resume is None:
+            dictionary_begin(glos, f, frontBackMatter)
         write_entries(glos, f, cleanHTML, indexes)
         dictionary_end(glos, f)
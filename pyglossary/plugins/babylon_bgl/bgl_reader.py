@@ -293,6 +293,15 @@ class BglReader(object):
             return 0
         return self.numEntries
 
+    def byteProgress(self):
+        """
+            returns (consumed bytes, size) of the gzip stream in bgl file
+        """
+        if not self.file:
+            return None
+        fileobj = self.file.fileobj
+        return fileobj.tell(), fileobj.filesize - fileobj.offset
+
     def createResDir(self, resPath):
         if not resPath:
             # resPath is not specified.
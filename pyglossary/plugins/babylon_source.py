@@ -15,6 +15,7 @@ writeOptions = [
     'newline',## str, or choice ('\r\n', '\n', or '\r')
     'encoding',## str
 ]
+writeCompressed = True
 
 def entryCleanWinArabic(entry):
     from pyglossary.arabic_utils import cleanWinArabicStr
@@ -30,6 +30,8 @@ writeOptions = [
     'encoding',## str
 ]
 supportsAlternates = True
+readCompressed = True
+writeCompressed = True
 
 import csv
 from pyglossary.file_utils import fileCountLines
@@ -40,13 +42,20 @@ class Reader(object):
         self._glos = glos
         self._filename = ''
         self._file = None
+        self._rawFile = None
+        self._fileSize = 0
         self._leadingLinesCount = 0
         self._len = None
         self._pos = -1
         self._csvReader = None
     def open(self, filename, encoding='utf-8'):
         self._filename = filename
-        self._file = open(filename, 'r', encoding=encoding)
+        self._file, self._rawFile = compressionOpenWithRaw(
+            filename,
+            'rt',
+            encoding=encoding,
+        )
+        self._fileSize = os.path.getsize(filename)
         self._csvReader = csv.reader(
             self._file,
             dialect='excel',
@@ -56,15 +65,21 @@ class Reader(object):
             return
         try:
             self._file.close()
+            self._rawFile.close()
         except:
             log.exception('error while closing tabfile')
         self._file = None
+        self._rawFile = None
         self._csvReader = None
     def __len__(self):
         if self._len is None:
             log.debug('Try not to use len(reader) as it takes extra time')
             self._len = fileCountLines(self._filename) - self._leadingLinesCount
         return self._len
+    def byteProgress(self):
+        if not self._rawFile:
+            return None
+        return self._rawFile.tell(), self._fileSize
     __iter__ = lambda self: self
     def __next__(self):
         if not self._csvReader:
@@ -95,7 +110,7 @@ class Reader(object):
 
 
 def write(glos, filename, encoding='utf-8'):
-    with open(filename, 'w', encoding=encoding) as csvfile:
+    with compressionOpen(filename, 'wt', encoding=encoding) as csvfile:
         writer = csv.writer(
             csvfile,
             dialect='excel',
@@ -35,17 +35,31 @@ class Reader(object):
             reverse=True,
         )
         self._tabFileNames = [x[1] for x in orderFileNames]
+        self._totalSize = sum(
+            os.path.getsize(join(dirname, fname))
+            for fname in self._tabFileNames
+        )
+        self._doneSize = 0
         self.nextTabFile()
 
     def __len__(self):## FIXME
         raise NotImplementedError
 
+    def byteProgress(self):
+        pos = self._doneSize
+        if self._tabFileReader:
+            progress = self._tabFileReader.byteProgress()
+            if progress:
+                pos += progress[0]
+        return pos, self._totalSize
+
     __iter__ = lambda self: self
     def __next__(self):
         for _ in range(10):
             try:
                 return next(self._tabFileReader)
             except StopIteration:
+                self._doneSize += self._tabFileReader.byteProgress()[1]
                 self._tabFileReader.close()
                 self.nextTabFile()
     def nextTabFile(self):
@@ -13,6 +13,9 @@ writeOptions = [
 ]
 sortOnWrite = DEFAULT_YES
 
+from array import array
+
+from pyglossary.lookup import WordIndex, openDictData
 
 b64_chars = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
 b64_chars_ord = dict(zip(b64_chars, range(len(b64_chars))))
@@ -98,6 +101,13 @@ class Reader(object):
             self._len = fileCountLines(self._filename+'.index') - self._leadingLinesCount
         return self._len
     __iter__ = lambda self: self
+    def byteProgress(self):
+        if not self._indexFp:
+            return None
+        return (
+            self._indexFp.tell(),
+            os.path.getsize(self._filename+'.index'),
+        )
     def __iter__(self):
         if not self._indexFp:
             log.error('reader is not open, can not iterate')
@@ -107,6 +117,7 @@ class Reader(object):
         sumLen = 0
         wrongSortedN = 0
         wordCount = 0
+        bytesMode = self._glos.getBytesMode()
         ############################## IMPORTANT PART ############################
         for line in self._indexFp:
             line = line.strip()
@@ -125,27 +136,82 @@ class Reader(object):
             defi = self._dictFp.read(defiLen)
             defi = defi.replace(b'<BR>', b'\n').replace(b'<br>', b'\n')
             sumLen += defiLen
-            yield Entry(toStr(word), toStr(defi)) ; wordCount += 1
+            yield Entry(toStr(word), defi if bytesMode else toStr(defi)) ; wordCount += 1
         ############################################################################
         if wrongSortedN>0:
             log.warning('Warning: wrong sorting count: %d'%wrongSortedN)
         self._len = wordCount
 
 
+class Lookup(Reader):
+    """
+        random access by .index file (see pyglossary.lookup)
+        .index is sorted by dictfmt in an order that depends on its
+        options and locale (like ignoring case and non-alphanumeric
+        characters), so it's loaded into a WordIndex
+    """
+    def __init__(self, glos):
+        Reader.__init__(self, glos)
+        self._index = None
+        self._offsets = array('Q')
+        self._sizes = array('Q')
+    def open(self, filename):
+        if filename.endswith('.index'):
+            filename = filename[:-6]
+        self._filename = filename
+        items = []
+        with open(filename+'.index', 'rb') as indexFp:
+            for line in indexFp:
+                line = line.strip()
+                if not line:
+                    continue
+                parts = line.split(b'\t')
+                if len(parts) != 3:
+                    log.error('invalid index line: %r' % line)
+                    continue
+                word = parts[0].replace(b'<BR>', b'\\n')\
+                               .replace(b'<br>', b'\\n')
+                items.append((toStr(word), len(self._offsets)))
+                self._offsets.append(indexStrToInt(parts[1]))
+                self._sizes.append(indexStrToInt(parts[2]))
+        self._index = WordIndex(items)
+        self._dictFp = openDictData(filename)
+    def close(self):
+        if self._dictFp is not None:
+            self._dictFp.close()
+            self._dictFp = None
+        self._index = None
+    def lookup(self, word):
+        bytesMode = self._glos.getBytesMode()
+        entries = []
+        for pos in self._index.find(word):
+            defi = self._dictFp.read(self._offsets[pos], self._sizes[pos])
+            defi = defi.replace(b'<BR>', b'\n').replace(b'<br>', b'\n')
+            entries.append(Entry(word, defi if bytesMode else toStr(defi)))
+        return entries
+    def lookupPrefix(self, prefix, limit):
+        return self._index.prefix(prefix, limit)
+
+
 def write(glos, filename, dictzip=True, install=True):## FIXME
     from pyglossary.text_utils import runDictzip
     (filename_nox, ext) = splitext(filename)
     if ext.lower()=='.index':
         filename = filename_nox
-    indexFd = open(filename+'.index', 'wb')
-    dictFd = open(filename+'.dict', 'wb')
-    dictMark = 0
+    resume = glos.getWriterResume()
+    indexFd = openResumable(filename+'.index', 'wb', resume)
+    dictFd = openResumable(filename+'.dict', 'wb', resume)
+    dictMark = resume['state']['dictMark'] if resume else 0
+    glos.setWriterCheckpoint(lambda: (
+        {'dictMark': dictMark},
+        [indexFd, dictFd],
+    ))
     for entry in glos:
         word = toBytes(entry.getWord())
-        defi = toBytes(entry.getDefi())
+        defi = entry.getDefiBytes()
         lm = len(defi)
         indexFd.write(word + b'\t' + intToIndexStr(dictMark) + b'\t' + intToIndexStr(lm) + b'\n')## FIXME
-        dictFd.write(toBytes(defi))
+        dictFd.write(defi)
         dictMark += lm
     indexFd.close()
     dictFd.close()
@@ -155,6 +221,11 @@ def write(glos, filename, dictzip=True, install=True):## FIXME
     #    pass ## FIXME
     if dictzip:
         runDictzip(filename)
+    glos.addOutputFile(filename+'.index')
+    if isfile(filename+'.dict'):
+        glos.addOutputFile(filename+'.dict')
+    else:  # replaced by dictzip
+        glos.addOutputFile(filename+'.dict.dz')
     if install:
         installToDictd(filename, glos.getInfo('name').replace(' ', '_'))
 
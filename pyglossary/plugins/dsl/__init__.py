@@ -30,6 +30,7 @@ description = 'ABBYY Lingvo DSL (dsl)'
 extentions = ['.dsl']
 readOptions = ['encoding', 'audio', 'onlyFixMarkUp']
 writeOptions = []
+readCompressed = True
 
 __all__ = ['read']
 
@@ -258,7 +259,7 @@ def read(glos, fname, **options):
     line_type = 'header'
     unfinished_line = ''
 
-    fp = open(fname, 'r', encoding=encoding)
+    fp = compressionOpen(fname, 'rt', encoding=encoding)
     for line in fp:
         line = line.rstrip()
         if not line:
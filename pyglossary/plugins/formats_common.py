@@ -28,12 +28,20 @@ sys.path.insert(0, rootDir)
 from pyglossary.flags import *
 sortOnWrite = DEFAULT_NO
 sortKey = None
+## True if Reader/read opens the file with `compressionOpen`,
+## so compressed input files are decompressed on the fly
+readCompressed = False
+## True if write opens the output file with `compressionOpen` (or uses
+## glos.writeTxt), so compressed output is written on the fly
+writeCompressed = False
 
 
 from pyglossary import core
 from pyglossary.file_utils import FileLineWrapper
 from pyglossary.text_utils import toStr, toBytes
 from pyglossary.os_utils import indir
+from pyglossary.compression import compressionOpen, compressionOpenWithRaw
+from pyglossary.checkpoint import openResumable
 from pyglossary.entry import Entry
 
 
@@ -8,6 +8,7 @@ description = 'Gettext Source (po)'
 extentions = ['.po',]
 readOptions = []
 writeOptions = []
+readCompressed = True
 
 
 class Reader(object):
@@ -15,18 +16,27 @@ class Reader(object):
         self._glos = glos
         self._filename = ''
         self._file = None
+        self._rawFile = None
+        self._fileSize = 0
         self._len = None
     def open(self, filename):
         self._filename = filename
-        self._file = open(filename)
+        self._file, self._rawFile = compressionOpenWithRaw(filename, 'rt')
+        self._fileSize = os.path.getsize(filename)
     def close(self):
         if not self._file:
             return
         try:
             self._file.close()
+            self._rawFile.close()
         except:
             log.exception('error while closing file "%s"'%self._filename)
         self._file = None
+        self._rawFile = None
+    def byteProgress(self):
+        if not self._rawFile:
+            return None
+        return self._rawFile.tell(), self._fileSize
     def __len__(self):
         from pyglossary.file_utils import fileCountLines
         if self._len is None:
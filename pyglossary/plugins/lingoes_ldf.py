@@ -11,6 +11,7 @@ description = 'Lingoes Source (LDF)'
 extentions = ['.ldf']
 readOptions = []
 writeOptions = []
+writeCompressed = True
 
 infoKeys = [
     'title',
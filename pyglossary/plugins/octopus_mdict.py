@@ -95,9 +95,12 @@ class Reader(object):
         if self._mdx is None:
             log.error('trying to iterate on a closed MDX file')
         else:
+            ## definitions are utf-8 encoded by MDX
+            bytesMode = self._glos.getBytesMode()
             for word, defi in self._mdx.items():
                 word = toStr(word)
-                defi = toStr(defi)
+                if not bytesMode:
+                    defi = toStr(defi)
                 yield Entry(word, defi)
             self._mdx = None
 
@@ -113,3 +116,42 @@ class Reader(object):
         self.clear()
 
 
+
+class Lookup(Reader):
+    """
+        random access by key list of MDX file (see pyglossary.lookup)
+        only the record block of a looked up word is decompressed
+        keys are sorted by MDict in an order that depends on the
+        dictionary (like ignoring case and punctuations), so they are
+        loaded into a WordIndex
+        MDD data files are not extracted
+    """
+    def clear(self):
+        Reader.clear(self)
+        self._index = None
+
+    def open(self, filename, **options):
+        from pyglossary.plugin_lib.readmdict import MDX
+        from pyglossary.lookup import WordIndex
+        self._filename = filename
+        self._encoding = options.get('encoding', '')
+        self._substyle = options.get('substyle', True)
+        self._mdx = MDX(filename, self._encoding, self._substyle)
+        self._index = WordIndex(
+            (toStr(key), index)
+            for index, key in enumerate(self._mdx.keys())
+        )
+
+    def lookup(self, word):
+        ## definitions are utf-8 encoded by MDX
+        bytesMode = self._glos.getBytesMode()
+        entries = []
+        for index in self._index.find(word):
+            defi = self._mdx.get_record(index)
+            if defi is None:
+                continue
+            entries.append(Entry(word, defi if bytesMode else toStr(defi)))
+        return entries
+
+    def lookupPrefix(self, prefix, limit):
+        return self._index.prefix(prefix, limit)
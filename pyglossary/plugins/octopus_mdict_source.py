@@ -9,6 +9,7 @@ description = 'Octopus MDict Source'
 extentions = ['.mtxt']
 readOptions = []
 writeOptions = []
+writeCompressed = True
 
 def read(glos, filename):
     with open(filename) as fp:
@@ -178,6 +178,7 @@ class Reader(object):
     def __iter__(self):
         pos = self._header.full_index_offset
         next_ptr = 0
+        bytesMode = self._glos.getBytesMode()
         while True:
             pos += next_ptr
             item = self.readFullIndexItem(pos)
@@ -188,8 +189,9 @@ class Reader(object):
                 break
             word = toStr(word)
             defi = self.readUnit(self._header.articles_offset + ptr)
-            defi = toStr(defi)
-            defi = defi.replace('<BR>', '\n').replace('<br>', '\n')
+            defi = defi.replace(b'<BR>', b'\n').replace(b'<br>', b'\n')
+            if not bytesMode:
+                defi = toStr(defi)
             yield Entry(word, defi)
 
     def readFullIndexItem(self, pointer):
@@ -213,3 +215,71 @@ class Reader(object):
 
 
 
+
+
+class Lookup(Reader):
+    """
+        random access by short index and full index (see pyglossary.lookup)
+        the short index has the position (in full index) of the first word
+        of every prefix of words (up to short_index_depth characters), and
+        words of a prefix are together in full index, so a lookup reads
+        only the words of the longest prefix that is in short index
+    """
+    def open(self, filename, encoding='utf-8'):
+        self._file = open(filename, 'rb')
+        self._header.parse(self._file.read(43))
+        self._compression = compressions[self._header.compressionType]
+        self.short_index = self.readShortIndex()
+
+    def iterPrefixItems(self, prefix):
+        """
+            yields (word, article pointer) of full index items, from the
+            first word of the longest prefix of `prefix` in short index,
+            while words start with that prefix
+        """
+        pos = None
+        for length in range(min(len(prefix), self._header.short_index_depth), 0, -1):
+            pointer = self.short_index[length].get(prefix[:length])
+            if pointer is not None:
+                pos = self._header.full_index_offset + pointer
+                prefix = prefix[:length]
+                break
+        if pos is None:
+            if prefix:
+                return
+            pos = self._header.full_index_offset
+        next_ptr = 0
+        while True:
+            pos += next_ptr
+            item = self.readFullIndexItem(pos)
+            if item==None:
+                break
+            (next_ptr, word, ptr) = item
+            if word==None:
+                break
+            word = toStr(word)
+            if not word.startswith(prefix):
+                break
+            yield word, ptr
+
+    def lookup(self, word):
+        bytesMode = self._glos.getBytesMode()
+        entries = []
+        for indexWord, ptr in self.iterPrefixItems(word):
+            if indexWord != word:
+                continue
+            defi = self.readArticle(ptr)
+            defi = defi.replace(b'<BR>', b'\n').replace(b'<br>', b'\n')
+            if not bytesMode:
+                defi = toStr(defi)
+            entries.append(Entry(word, defi))
+        return entries
+
+    def lookupPrefix(self, prefix, limit):
+        words = []
+        for word, ptr in self.iterPrefixItems(prefix):
+            if len(words) >= limit:
+                break
+            if word.startswith(prefix) and word not in words:
+                words.append(word)
+        return words
@@ -11,6 +11,7 @@ writeOptions = [
     'writeInfo',## bool
     'newline',## str, or choice ('\r\n', '\n', or '\r')
 ]
+writeCompressed = True
 
 def write(glos, filename, writeInfo=True, newline='\n'):
     ## Source Glossary for "Sdictionary" (http://sdict.org)
@@ -8,9 +8,10 @@ description = 'SQL'
 extentions = ['.sql']
 readOptions = []
 writeOptions = []
+writeCompressed = True
 
 def write(glos, filename):
-    with open(filename, 'w') as fp:
+    with compressionOpen(filename, 'wt') as fp:
         for line in glos.iterSqlLines(
             transaction=False,
         ):
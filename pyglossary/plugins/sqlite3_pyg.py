@@ -99,6 +99,83 @@ class Reader(object):
                     yield Entry(word, defi)
 
 
+class Lookup(Reader):
+    """
+        random access by index of `w` column of `word` table, with
+        NOCASE collation, like the index written by this plugin
+        (see pyglossary.lookup)
+        if there is no such index, words are copied into a temporary
+        table with that index, on open
+    """
+    def _clear(self):
+        Reader._clear(self)
+        self._indexTable = 'word'
+        self._indexRowid = 'rowid'
+
+    def open(self, filename):
+        from sqlite3 import connect
+        self._filename = filename
+        self._con = connect(filename)
+        self._cur = self._con.cursor()
+        if not self.hasWordIndex():
+            log.info('no index of words in "%s", creating a temporary index' % filename)
+            self._cur.execute(
+                'CREATE TEMP TABLE lookup_word AS SELECT rowid AS rid, w FROM word'
+            )
+            self._cur.execute(
+                'CREATE INDEX temp.ix_lookup_word_w ON lookup_word(w COLLATE NOCASE)'
+            )
+            self._indexTable = 'temp.lookup_word'
+            self._indexRowid = 'rid'
+
+    def hasWordIndex(self):
+        """
+            returns True if `word` table has an index whose first column
+            is `w` with NOCASE collation
+        """
+        for row in self._cur.execute('PRAGMA index_list(word)').fetchall():
+            if len(row) > 4 and row[4]:## partial index
+                continue
+            columns = self._cur.execute(
+                'PRAGMA index_xinfo("%s")' % row[1].replace('"', '""')
+            ).fetchall()
+            if columns and columns[0][2] == 'w' and \
+                    (columns[0][4] or '').upper() == 'NOCASE':
+                return True
+        return False
+
+    def lookup(self, word):
+        self._cur.execute(
+            'SELECT word.w, word.m FROM %s AS ix ' % self._indexTable +
+            'JOIN word ON word.rowid = ix.%s ' % self._indexRowid +
+            'WHERE ix.w = ? COLLATE NOCASE ORDER BY word.rowid',
+            (word,),
+        )
+        return [
+            Entry(w, m)
+            for w, m in self._cur.fetchall()
+            if w == word
+        ]
+
+    def lookupPrefix(self, prefix, limit):
+        cur = self._con.execute(
+            'SELECT w FROM %s ' % self._indexTable +
+            'WHERE w >= ? COLLATE NOCASE AND w < ? COLLATE NOCASE ' +
+            'ORDER BY w COLLATE NOCASE',
+            (prefix, prefix + '\U0010ffff'),
+        )
+        words = []
+        try:
+            for w, in cur:
+                if w.startswith(prefix) and w not in words:
+                    words.append(w)
+                    if len(words) >= limit:
+                        break
+        finally:
+            cur.close()
+        return words
+
+
 
 
 def write_2(glos, filename):
@@ -11,7 +11,7 @@ writeOptions = [
     'resOverwrite',## bool
 ]
 sortOnWrite = ALWAYS
-## sortKey also is defined in line 51
+## sortKey is defined below stardictStrCmp
 supportsAlternates = True
 
 import sys
@@ -20,8 +20,13 @@ import os
 import os.path
 import re
 from functools import cmp_to_key
+from collections import OrderedDict as odict
+from struct import unpack_from
+from array import array
+from bisect import bisect_left, bisect_right
 
 from pyglossary.text_utils import intToBinStr, binStrToInt, runDictzip
+from pyglossary.lookup import bisectLeft, openDictData
 
 infoKeys = (
     'bookname',
@@ -46,9 +51,36 @@ def stardictStrCmp(s1, s2):
     else:
         return a
 
-## using my key function `sortKeyMy` might not be safe
-## the safest way in Python 3 is using functools.cmp_to_key
-sortKey = cmp_to_key(stardictStrCmp)
+asciiLowerTable = bytes.maketrans(
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+    b'abcdefghijklmnopqrstuvwxyz',
+)
+
+def sortKey(s):
+    """
+        key function to sort index items in StarDict dictionary
+        gives exactly the same order as cmp_to_key(stardictStrCmp),
+        but it's computed once per item, instead of once per comparison
+
+        the key is the ascii-lowercased bytes (like asciiStrCaseCmp),
+        followed by b'\x00' and then the original bytes (like strCmp)
+        b'\x00' and b'\x01' in the lowercased part are escaped as
+        b'\x01\x01' and b'\x01\x02' so that the b'\x00' separator
+        is lower than any byte of a longer item (keeps the order exact)
+    """
+    ba = toBytes(s)
+    return sortKeyLower(ba) + b'\x00' + ba
+
+def sortKeyLower(ba):
+    """
+        the ascii-lowercased (and escaped) part of sortKey, for bytes `ba`
+        sortKey of every item that starts with `ba` (ignoring ascii case)
+        starts with sortKeyLower(ba)
+    """
+    lower = ba.translate(asciiLowerTable)
+    if b'\x00' in lower or b'\x01' in lower:
+        lower = lower.replace(b'\x01', b'\x01\x02').replace(b'\x00', b'\x01\x01')
+    return lower
 
 def stardictStrCmpMy(s1, s2):
     """
@@ -57,12 +89,37 @@ def stardictStrCmpMy(s1, s2):
         
         s1 and s2 must be utf-8 encoded strings
     """
-    s1 = toBytes(s1)
-    s2 = toBytes(s2)
-    return cmp(
-        sortKeyMy(s1),
-        sortKeyMy(s2),
-    )
+    k1 = sortKey(s1)
+    k2 = sortKey(s2)
+    return (k1 > k2) - (k1 < k2)
+
+def testSortKey(count=20000, seed=0):
+    """
+        equivalence test harness for sortKey
+        compares sortKey with the reference comparator stardictStrCmp
+        on random words, both by sign of pairwise comparison
+        and by the whole sorted order
+    """
+    import random
+    rand = random.Random(seed)
+    alphabet = 'aAbBzZ09 !-_@[`{~\x00\x01\x7féÉßжЖ中'
+    words = [
+        ''.join(
+            rand.choice(alphabet)
+            for _ in range(rand.randint(0, 6))
+        )
+        for _ in range(count)
+    ]
+    sign = lambda n: (n > 0) - (n < 0)
+    for _ in range(count):
+        w1 = rand.choice(words)
+        w2 = rand.choice(words)
+        if sign(stardictStrCmp(w1, w2)) != stardictStrCmpMy(w1, w2):
+            raise AssertionError('sortKey mismatch: %r, %r' % (w1, w2))
+    if sorted(words, key=cmp_to_key(stardictStrCmp)) != sorted(words, key=sortKey):
+        raise AssertionError('sortKey gives a different sort order')
+    log.info('sortKey: OK, %s words' % count)
+    return True
 
 
 def isAsciiAlpha(c):
@@ -104,13 +161,6 @@ def asciiLower(c):
     else:
         return c
 
-def sortKeyMy(ba):
-    """
-        ba is a bytes instance
-    """
-    assert isinstance(ba, bytes)
-    return ba.lower() + ba
-
 def asciiStrCaseCmp(ba1, ba2):
     """
         ba1 and ba2 are instances of bytes
@@ -191,9 +241,15 @@ class StarDictReader(object):
         self.readResources()
 
     def readIfoFile(self):
+        for key, value in self.parseIfoFile().items():
+            self.glos.setInfo(key, value)
+
+    def parseIfoFile(self):
         """
             .ifo file is a text file in utf-8 encoding
+            returns an OrderedDict of info
         """
+        info = odict()
         with open(self.fileBasePath+'.ifo', 'r') as f:
             for line in f:
                 line = line.strip()
@@ -205,7 +261,8 @@ class StarDictReader(object):
                 if not (key and value):
                     log.warning('Invalid ifo file line: {0}'.format(line))
                     continue
-                self.glos.setInfo(key, value)
+                info[key] = value
+        return info
 
     def readIdxFile(self):
         if isfile(self.fileBasePath+'.idx.gz'):
@@ -238,6 +295,7 @@ class StarDictReader(object):
 
     def readDictFile(self, indexData, synData, sametypesequence):
         #from collections import Counter
+        bytesMode = self.glos.getBytesMode()
         if isfile(self.fileBasePath+'.dict.dz'):
             import gzip
             dictFd = gzip.open(self.fileBasePath+'.dict.dz')
@@ -259,37 +317,11 @@ class StarDictReader(object):
                 log.error("Unable to read definition for word \"{0}\"".format(word))
                 continue
 
-            if sametypesequence:
-                rawDefis = self.parseDefiBlockCompact(data, sametypesequence, word)
-            else:
-                rawDefis = self.parseDefiBlockGeneral(data, word)
-
-            if not rawDefis:
+            result = self.decodeDefiBlock(data, sametypesequence, word, bytesMode)
+            if result is None:
                 continue
+            defis, defiFormat = result
 
-            defis = []
-            defiFormats = []
-            for rawDefi in rawDefis:
-                _type = chr(rawDefi[1])
-                defis.append(toStr(rawDefi[0]))
-                defiFormats.append(
-                    {
-                        'm': 'm',
-                        't': 'm',
-                        'y': 'm',
-                        'g': 'h',
-                        'h': 'h',
-                        'x': 'x',
-                    }.get(_type, '')
-                )
-
-            ## FIXME
-            defiFormat = defiFormats[0]
-            #defiFormat = Counter(defiFormats).most_common(1)[0][0]
-            
-            if not defiFormat:
-                log.warning("Definition format %s is not supported"%defiFormat)
-            
             word = toStr(word)
 
             self.glos.addEntry(
@@ -301,6 +333,46 @@ class StarDictReader(object):
 
         dictFd.close()
 
+    def decodeDefiBlock(self, data, sametypesequence, word, bytesMode=False):
+        """
+            returns (defis, defiFormat) of definition block `data`
+            or None if it's corrupted or empty
+        """
+        if sametypesequence:
+            rawDefis = self.parseDefiBlockCompact(data, sametypesequence, word)
+        else:
+            rawDefis = self.parseDefiBlockGeneral(data, word)
+
+        if not rawDefis:
+            return None
+
+        defis = []
+        defiFormats = []
+        for rawDefi in rawDefis:
+            _type = chr(rawDefi[1])
+            defis.append(
+                rawDefi[0] if bytesMode else toStr(rawDefi[0])
+            )
+            defiFormats.append(
+                {
+                    'm': 'm',
+                    't': 'm',
+                    'y': 'm',
+                    'g': 'h',
+                    'h': 'h',
+                    'x': 'x',
+                }.get(_type, '')
+            )
+
+        ## FIXME
+        defiFormat = defiFormats[0]
+        #defiFormat = Counter(defiFormats).most_common(1)[0][0]
+        
+        if not defiFormat:
+            log.warning("Definition format %s is not supported"%defiFormat)
+
+        return defis, defiFormat
+
     def readSynFile(self, indexCount):
         """
             returns synData, a dict { wordIndex -> synWordsList }
@@ -433,6 +505,207 @@ class StarDictReader(object):
             if isfile(resDbFilePath):
                 log.warning("StarDict resource database is not supported. Skipping.")
 
+class Lookup(StarDictReader):
+    """
+        random access by .idx and .syn files (see pyglossary.lookup)
+        records of .idx and .syn are sorted by sortKey, so a word is
+        found by binary search, using the array of offsets of records
+        (plain .idx and .syn files are memory-mapped, .idx.gz is read)
+    """
+    def __init__(self, glos):
+        self.glos = glos
+        self.fileBasePath = ''
+        self._sametypesequence = ''
+        self._idx = b''
+        self._idxOffsets = array('Q')
+        self._syn = b''
+        self._synOffsets = array('Q')
+        self._synOrder = None  # positions of .syn records, sorted by target
+        self._synTargets = None  # sorted targets (.idx positions)
+        self._dictFile = None
+        self._mmaps = []
+
+    def open(self, filename):
+        StarDictReader.__init__(self, self.glos, filename)
+        self._sametypesequence = self.parseIfoFile().get('sametypesequence', '')
+        if not verifySameTypeSequence(self._sametypesequence):
+            raise ValueError('invalid sametypesequence')
+        if isfile(self.fileBasePath+'.idx.gz'):
+            import gzip
+            with gzip.open(self.fileBasePath+'.idx.gz') as f:
+                self._idx = f.read()
+        else:
+            self._idx = self._mapFile(self.fileBasePath+'.idx')
+        self._idxOffsets = self._scanRecords(self._idx, 8)
+        if isfile(self.fileBasePath+'.syn'):
+            self._syn = self._mapFile(self.fileBasePath+'.syn')
+            self._synOffsets = self._scanRecords(self._syn, 4)
+        self._dictFile = openDictData(self.fileBasePath)
+
+    def close(self):
+        if self._dictFile is not None:
+            self._dictFile.close()
+            self._dictFile = None
+        self._idx = self._syn = b''
+        for mm in self._mmaps:
+            mm.close()
+        self._mmaps = []
+
+    def _mapFile(self, path):
+        import mmap
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mmaps.append(mm)
+        return mm
+
+    def _scanRecords(self, data, tailSize):
+        """
+            returns the array of offsets of records in .idx or .syn data
+            every record is a null-terminated word and `tailSize` bytes
+        """
+        offsets = array('Q')
+        dataLen = len(data)
+        pos = 0
+        while pos < dataLen:
+            end = data.find(b'\x00', pos)
+            if end < 0 or end + 1 + tailSize > dataLen:
+                log.error("Index file is corrupted.")
+                break
+            offsets.append(pos)
+            pos = end + 1 + tailSize
+        return offsets
+
+    def _recordWord(self, data, offsets, pos):
+        offset = offsets[pos]
+        return data[offset:data.find(b'\x00', offset)]
+
+    def _findRange(self, data, offsets, wordBytes):
+        """
+            returns (start, end) positions of records of `wordBytes`
+        """
+        start = bisectLeft(
+            sortKey(wordBytes),
+            lambda pos: sortKey(self._recordWord(data, offsets, pos)),
+            0,
+            len(offsets),
+        )
+        end = start
+        while end < len(offsets) and \
+                self._recordWord(data, offsets, end) == wordBytes:
+            end += 1
+        return start, end
+
+    def _prefixWords(self, data, offsets, prefixBytes, limit):
+        lowerPrefix = sortKeyLower(prefixBytes)
+        pos = bisectLeft(
+            lowerPrefix,
+            lambda pos: sortKey(self._recordWord(data, offsets, pos)),
+            0,
+            len(offsets),
+        )
+        words = []
+        while pos < len(offsets) and len(words) < limit:
+            word = self._recordWord(data, offsets, pos)
+            pos += 1
+            if not sortKeyLower(word).startswith(lowerPrefix):
+                break
+            if word.startswith(prefixBytes) and not (words and words[-1] == word):
+                words.append(word)
+        return words
+
+    def _synTarget(self, pos):
+        offset = self._syn.find(b'\x00', self._synOffsets[pos]) + 1
+        return unpack_from('>I', self._syn, offset)[0]
+
+    def _getSynonyms(self, index):
+        if not self._synOffsets:
+            return []
+        if self._synOrder is None:
+            targets = array('L', [
+                self._synTarget(pos)
+                for pos in range(len(self._synOffsets))
+            ])
+            # sorted() is stable, keeps the order of synonyms in .syn file
+            self._synOrder = array('Q', sorted(
+                range(len(targets)),
+                key=targets.__getitem__,
+            ))
+            self._synTargets = array('L', [
+                targets[pos] for pos in self._synOrder
+            ])
+        return [
+            toStr(self._recordWord(self._syn, self._synOffsets, self._synOrder[i]))
+            for i in range(
+                bisect_left(self._synTargets, index),
+                bisect_right(self._synTargets, index),
+            )
+        ]
+
+    def _getEntry(self, index):
+        offset = self._idxOffsets[index]
+        end = self._idx.find(b'\x00', offset)
+        word = self._idx[offset:end]
+        defiOffset, defiSize = unpack_from('>II', self._idx, end + 1)
+        data = self._dictFile.read(defiOffset, defiSize)
+        if len(data) != defiSize:
+            log.error("Unable to read definition for word \"{0}\"".format(word))
+            return None
+        result = self.decodeDefiBlock(
+            data,
+            self._sametypesequence,
+            word,
+            self.glos.getBytesMode(),
+        )
+        if result is None:
+            return None
+        defis, defiFormat = result
+        return Entry(
+            [toStr(word)] + self._getSynonyms(index),
+            defis,
+            defiFormat=defiFormat,
+        )
+
+    def lookup(self, word):
+        wordBytes = toBytes(word)
+        indexes = set(range(*self._findRange(
+            self._idx,
+            self._idxOffsets,
+            wordBytes,
+        )))
+        for pos in range(*self._findRange(
+            self._syn,
+            self._synOffsets,
+            wordBytes,
+        )):
+            target = self._synTarget(pos)
+            if target < len(self._idxOffsets):
+                indexes.add(target)
+        entries = []
+        for index in sorted(indexes):
+            entry = self._getEntry(index)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def lookupPrefix(self, prefix, limit):
+        prefixBytes = toBytes(prefix)
+        words = set(self._prefixWords(
+            self._idx,
+            self._idxOffsets,
+            prefixBytes,
+            limit,
+        ))
+        words.update(self._prefixWords(
+            self._syn,
+            self._synOffsets,
+            prefixBytes,
+            limit,
+        ))
+        return [toStr(word) for word in sorted(words, key=sortKey)[:limit]]
+
+
 class StarDictWriter(object):
     def __init__(self, glos, filename):
         self.glos = glos
@@ -464,6 +737,10 @@ class StarDictWriter(object):
 
         if dictzip:
             runDictzip(self.fileBasePath)
+        if isfile(self.fileBasePath + '.dict'):
+            self.glos.addOutputFile(self.fileBasePath + '.dict')
+        else:  # replaced by dictzip
+            self.glos.addOutputFile(self.fileBasePath + '.dict.dz')
         self.copyResources(
             self.glos.resPath,
             join(os.path.dirname(self.fileBasePath), 'res'),
@@ -512,18 +789,36 @@ class StarDictWriter(object):
         dictMark = 0
         #idxStr = ''
         #dictStr = ''
-        alternates = [] # contains tuples ('alternate', index-of-word)
-
-        dictFp = open(self.fileBasePath+'.dict', 'wb')
-        idxFp = open(self.fileBasePath+'.idx', 'wb')
         indexFileSize = 0
-
         wordCount = 0
-        for i, entry in enumerate(self.glos):
 
-            words = entry.getWords()## list
+        resume = self.glos.getWriterResume()
+        if resume:
+            state = resume['state']
+            dictMark = state['dictMark']
+            indexFileSize = state['indexFileSize']
+            wordCount = state['wordCount']
+        dictFp = openResumable(self.fileBasePath+'.dict', 'wb', resume)
+        idxFp = openResumable(self.fileBasePath+'.idx', 'wb', resume)
+        # alternates are written to a temporary file, as records of
+        # (alternate + b'\x00' + index-of-word), and sorted at the end
+        # so checkpoints only keep its size
+        altPath = self.fileBasePath+'.syn.tmp'
+        altFp = openResumable(altPath, 'wb', resume)
+        self.glos.setWriterCheckpoint(lambda: (
+            {
+                'dictMark': dictMark,
+                'indexFileSize': indexFileSize,
+                'wordCount': wordCount,
+            },
+            [dictFp, idxFp, altFp],
+        ))
+
+        for i, entry in enumerate(self.glos, wordCount):
+
+            words = entry.getWords()
             word = words[0]
-            defis = entry.getDefis()## list
+            defis = entry.getDefisBytes()## bytes, not decoded
 
             defiFormat = entry.getDefiFormat()
             if defiFormat not in ('m', 'h'):
@@ -533,12 +828,14 @@ class StarDictWriter(object):
             dictBlock = b''
             
             for altWord in words[1:]:
-                alternates.append((altWord, i))
+                altFp.write(toBytes(altWord) + b'\x00' + intToBinStr(i, 4))
+
+            defiFormat = toBytes(defiFormat)
 
-            dictBlock += toBytes(defiFormat + defis[0]) + b'\x00'
+            dictBlock += defiFormat + defis[0] + b'\x00'
 
             for altDefi in defis[1:]:
-                dictBlock += toBytes(defiFormat + altDefi) + b'\x00'
+                dictBlock += defiFormat + altDefi + b'\x00'
             
             dictFp.write(dictBlock)
             
@@ -553,22 +850,36 @@ class StarDictWriter(object):
 
         dictFp.close()
         idxFp.close()
+        altFp.close()
+        self.glos.addOutputFile(self.fileBasePath+'.idx')
 
-        self.writeSynFile(alternates)
-        self.writeIfoFile(wordCount, indexFileSize, len(alternates))
+        synwordcount = self.writeSynFile(altPath)
+        os.remove(altPath)
+        self.writeIfoFile(wordCount, indexFileSize, synwordcount)
 
-    def writeSynFile(self, alternates):
+    def writeSynFile(self, altPath):
         """
-            Build .syn file
+            Build .syn file, from the file of alternates `altPath`
+            returns the number of alternates
         """
+        with open(altPath, 'rb') as f:
+            data = f.read()
+        alternates = [] # contains tuples (b'alternate', b'index-of-word')
+        pos = 0
+        while pos < len(data):
+            end = data.index(b'\x00', pos)
+            alternates.append((data[pos:end], data[end+1:end+5]))
+            pos = end + 5
+        del data
         if len(alternates) > 0:
             alternates.sort(key=lambda x: sortKey(x[0]))
-            synBytes = b''
-            for item in alternates:
-                synBytes += toBytes(item[0]) + b'\x00' + intToBinStr(item[1], 4)
             with open(self.fileBasePath+'.syn', 'wb') as f:
-                f.write(synBytes)
-            del synBytes
+                f.write(b''.join([
+                    word + b'\x00' + index
+                    for word, index in alternates
+                ]))
+            self.glos.addOutputFile(self.fileBasePath+'.syn')
+        return len(alternates)
 
     def writeIfoFile(
         self,
@@ -602,6 +913,7 @@ class StarDictWriter(object):
         with open(self.fileBasePath+'.ifo', 'wb') as f:
             f.write(toBytes(ifoStr))
         del ifoStr
+        self.glos.addOutputFile(self.fileBasePath+'.ifo')
 
     def copyResources(self, fromPath, toPath, overwrite):
         """
@@ -630,6 +942,7 @@ Clear the output directory before running the converter or pass option: --write-
                 return
             os.rmdir(toPath)
         shutil.copytree(fromPath, toPath)
+        self.glos.addOutputFile(toPath)
 
     def glossaryHasAdditionalDefinitions(self):
         """
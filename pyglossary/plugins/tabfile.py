@@ -13,6 +13,8 @@ writeOptions = [
     'encoding',## str
     'writeInfo',## bool
 ]
+readCompressed = True
+writeCompressed = True
 
 from pyglossary.text_reader import TextGlossaryReader
 from pyglossary.text_utils import escapeNTB, unescapeNTB, splitByBarUnescapeNTB
@@ -59,6 +59,7 @@ def write(glos, filename, encoding='utf-8', archive='tar.bz2', sep=os.sep):
             ).communicate()
         else:
             log.error('Undefined archive format: "%s"'%archive)
+        glos.addOutputFile('%s.%s'%(filename, archive))
         try:
             shutil.rmtree(filename, ignore_errors=True)
         except:
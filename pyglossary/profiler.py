@@ -0,0 +1,627 @@
+# -*- coding: utf-8 -*-
+
+"""
+stage-level profiler for conversions, see Glossary.setProfiler
+
+time is measured per stage: wall time and CPU time (of this process)
+stages are nested (for example in direct mode, the writer pulls entries
+from the filter chain, which pulls entries from the reader), and time
+is counted only for the innermost active stage, so the times of stages
+add up to the total time
+
+MemoryProfiler records peak and steady-state memory of coarse phases of
+conversion (read, sort, write, ...), see Glossary.setMemoryProfiler
+
+both profilers only count stages (or phases) of the thread they are
+started in, in pipeline mode (see pipeline.py) the stages of producer
+thread are seen as the 'pipeline wait' stage of the writer
+"""
+
+import os
+import sys
+import json
+import threading
+from time import perf_counter, process_time
+from collections import OrderedDict as odict
+
+import logging
+log = logging.getLogger('root')
+
+
+# stage names, in the order of a conversion
+stageNames = (
+    'plugin load',
+    'reader open',
+    'read iteration',
+    'filter chain',
+    'dedupe',
+    'incremental',
+    'sort',
+    'pipeline wait',
+    'writer',
+    'archive',
+)
+
+
+class StageStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.count = 0  # number of times the stage was entered
+
+    def toDict(self):
+        return odict([
+            ('wall', self.wall),
+            ('cpu', self.cpu),
+            ('count', self.count),
+        ])
+
+
+class _StageContext(object):
+    def __init__(self, profiler, name, plugin):
+        self._profiler = profiler
+        self._name = name
+        self._plugin = plugin
+
+    def __enter__(self):
+        self._profiler.enter(self._name, self._plugin)
+
+    def __exit__(self, *args):
+        self._profiler.exit()
+
+
+class ConvertProfiler(object):
+    """
+        records wall time and CPU time per stage
+        pluginsProfile: also run cProfile on plugin code (reader and
+            writer stages), one cProfile per plugin
+    """
+    def __init__(self, pluginsProfile=False):
+        self.stages = odict(
+            (name, StageStats(name))
+            for name in stageNames
+        )
+        self._stack = []  # list of (stageStats, plugin)
+        self._lastWall = 0.0
+        self._lastCpu = 0.0
+        self._startWall = None
+        self._startCpu = None
+        self._endWall = None
+        self._endCpu = None
+        self._pluginsProfile = pluginsProfile
+        self._cProfiles = odict()  # plugin => cProfile.Profile
+        self._activeCProfile = None
+        self.info = odict()  # extra information for report
+        self.memory = None  # report of MemoryProfiler, if any
+        self._threadId = None
+
+    def _isOtherThread(self):
+        return threading.get_ident() != self._threadId
+
+    def start(self):
+        self._threadId = threading.get_ident()
+        self._startWall = self._lastWall = perf_counter()
+        self._startCpu = self._lastCpu = process_time()
+
+    def stop(self):
+        self._switch(None)
+        self._endWall = perf_counter()
+        self._endCpu = process_time()
+
+    def _charge(self):
+        wall = perf_counter()
+        cpu = process_time()
+        if self._stack:
+            stats = self._stack[-1][0]
+            stats.wall += wall - self._lastWall
+            stats.cpu += cpu - self._lastCpu
+        self._lastWall = wall
+        self._lastCpu = cpu
+
+    def _switch(self, plugin):
+        """
+            switches cProfile to `plugin` (or disables it if None)
+        """
+        if not self._pluginsProfile:
+            return
+        prof = None
+        if plugin:
+            prof = self._cProfiles.get(plugin)
+            if prof is None:
+                import cProfile
+                prof = self._cProfiles[plugin] = cProfile.Profile()
+        if prof is self._activeCProfile:
+            return
+        if self._activeCProfile is not None:
+            self._activeCProfile.disable()
+        self._activeCProfile = None
+        if prof is not None:
+            try:
+                prof.enable()
+            except ValueError:
+                # another profiler is active (python >= 3.12)
+                log.warning('can not run cProfile for plugin %s' % plugin)
+                self._pluginsProfile = False
+                return
+            self._activeCProfile = prof
+
+    def enter(self, name, plugin=None):
+        if self._isOtherThread():
+            return
+        self._charge()
+        try:
+            stats = self.stages[name]
+        except KeyError:
+            stats = self.stages[name] = StageStats(name)
+        stats.count += 1
+        self._stack.append((stats, plugin))
+        self._switch(plugin)
+
+    def exit(self):
+        if self._isOtherThread():
+            return
+        self._charge()
+        self._stack.pop()
+        self._switch(self._stack[-1][1] if self._stack else None)
+
+    def stage(self, name, plugin=None):
+        """
+            context manager, for example:
+                with profiler.stage('writer', 'stardict'):
+                    ...
+            plugin: plugin module name, if the stage runs plugin code
+        """
+        return _StageContext(self, name, plugin)
+
+    def timedIter(self, iterable, name, plugin=None):
+        """
+            yields items of `iterable`, time spent to get items
+            is counted for stage `name`
+        """
+        it = iter(iterable)
+        if self._isOtherThread():
+            yield from it
+            return
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(name)
+        stats.count += 1
+        stack = self._stack
+        while True:
+            self._charge()
+            stack.append((stats, plugin))
+            self._switch(plugin)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._charge()
+                stack.pop()
+                self._switch(stack[-1][1] if stack else None)
+            yield item
+
+    def getCProfileStats(self, limit=30):
+        """
+            returns dict of plugin => list of top functions
+            (sorted by cumulative time) as dicts
+        """
+        import pstats
+        result = odict()
+        for plugin, prof in self._cProfiles.items():
+            stats = pstats.Stats(prof)
+            funcs = []
+            for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+                funcs.append(odict([
+                    ('function', '%s:%s(%s)' % func),
+                    ('ncalls', nc),
+                    ('primitiveCalls', cc),
+                    ('tottime', tt),
+                    ('cumtime', ct),
+                ]))
+            funcs.sort(key=lambda f: f['cumtime'], reverse=True)
+            result[plugin] = funcs[:limit]
+        return result
+
+    def _getTotal(self):
+        return (
+            self._endWall - self._startWall,
+            self._endCpu - self._startCpu,
+        )
+
+    def getReport(self):
+        """
+            returns the report as a JSON-serializable OrderedDict
+        """
+        report = odict()
+        report['info'] = self.info
+        report['stages'] = odict(
+            (name, stats.toDict())
+            for name, stats in self.stages.items()
+        )
+        if self._endWall is not None:
+            wall, cpu = self._getTotal()
+            report['total'] = odict([
+                ('wall', wall),
+                ('cpu', cpu),
+            ])
+            # time not spent in any stage
+            report['other'] = odict([
+                ('wall', wall - sum(s.wall for s in self.stages.values())),
+                ('cpu', cpu - sum(s.cpu for s in self.stages.values())),
+            ])
+        if self.memory is not None:
+            report['memory'] = self.memory
+        if self._cProfiles:
+            report['plugins'] = self.getCProfileStats()
+        return report
+
+    def formatReport(self):
+        """
+            returns stage times as a text table
+        """
+        lines = ['%-16s %9s %9s' % ('stage', 'wall', 'cpu')]
+        for name, stats in self.stages.items():
+            if not stats.count:
+                continue
+            lines.append('%-16s %9.3f %9.3f' % (name, stats.wall, stats.cpu))
+        if self._endWall is not None:
+            wall, cpu = self._getTotal()
+            lines.append('%-16s %9.3f %9.3f' % (
+                'other',
+                wall - sum(s.wall for s in self.stages.values()),
+                cpu - sum(s.cpu for s in self.stages.values()),
+            ))
+            lines.append('%-16s %9.3f %9.3f' % ('total', wall, cpu))
+        return '\n'.join(lines)
+
+    def saveReport(self, filename):
+        with open(filename, 'w', encoding='utf-8') as fp:
+            json.dump(
+                self.getReport(),
+                fp,
+                ensure_ascii=False,
+                indent='\t',
+            )
+            fp.write('\n')
+
+
+memoryPhaseNames = (
+    'read',
+    'direct mode inactivation',
+    'sort',
+    'write',
+)
+
+
+def getCurrentRss():
+    """
+        returns current RSS of this process in bytes,
+        or None if it's not available (non-Linux)
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def getPeakRss():
+    """
+        returns peak RSS of this process (since start) in bytes, or None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak  # bytes
+    return peak * 1024  # kilobytes
+
+
+class MemoryPhaseStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.count = 0  # number of times the phase was entered
+        self.startTraced = None  # traced memory at first enter
+        self.endTraced = None  # traced memory at last exit
+        self.peakTraced = 0
+        self.startRss = None
+        self.endRss = None
+        self.peakRss = 0
+        self.snapshotTraced = 0  # traced memory at the time of snapshot
+        self.topSites = []  # list of (site, size, count) at peak
+
+    def toDict(self):
+        retained = None
+        if self.endTraced is not None:
+            retained = self.endTraced - self.startTraced
+        return odict([
+            ('count', self.count),
+            ('startTraced', self.startTraced),
+            ('peakTraced', self.peakTraced),
+            ('endTraced', self.endTraced),
+            ('retainedTraced', retained),
+            ('startRss', self.startRss),
+            ('peakRss', self.peakRss or None),
+            ('endRss', self.endRss),
+            ('topSites', [
+                odict([
+                    ('site', site),
+                    ('size', size),
+                    ('count', count),
+                ])
+                for site, size, count in self.topSites
+            ]),
+        ])
+
+
+class _MemoryPhaseContext(object):
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler.enter(self._name)
+
+    def __exit__(self, *args):
+        self._profiler.exit()
+
+
+class MemoryProfiler(object):
+    """
+        records peak memory and steady-state (retained) memory per phase
+        phases can be nested (sort inside write), peak of a nested phase
+        counts for its outer phases too
+
+        trace: use tracemalloc, for traced (python heap) memory, and
+            for attributing peak memory to allocation sites
+            without it, only RSS is recorded (sampled by a thread)
+        interval: RSS sampling interval, in seconds
+        traceFrames: number of frames stored for each traced allocation
+        topCount: number of top allocation sites to keep per phase
+        snapshotGrowth: a new snapshot (for top allocation sites) is
+            taken when traced memory grows by this ratio since the last one
+
+        tracemalloc slows down allocations a lot (2x to 4x overall),
+        so it's only for finding out where memory goes
+    """
+    def __init__(
+        self,
+        trace=True,
+        interval=0.05,
+        traceFrames=1,
+        topCount=10,
+        snapshotGrowth=0.25,
+    ):
+        self.phases = odict(
+            (name, MemoryPhaseStats(name))
+            for name in memoryPhaseNames
+        )
+        self._stack = []  # list of MemoryPhaseStats
+        self._trace = trace
+        self._interval = interval
+        self._traceFrames = traceFrames
+        self._topCount = topCount
+        self._snapshotGrowth = snapshotGrowth
+        self._startedTracing = False
+        self._thread = None
+        self._stopEvent = threading.Event()
+        self._lock = threading.Lock()
+        self._peakRss = 0
+        self._rssAvailable = getCurrentRss() is not None
+        self._threadId = None
+
+    def _isOtherThread(self):
+        return threading.get_ident() != self._threadId
+
+    def start(self):
+        self._threadId = threading.get_ident()
+        if self._trace:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self._traceFrames)
+                self._startedTracing = True
+        if self._rssAvailable or self._trace:
+            self._stopEvent.clear()
+            self._thread = threading.Thread(
+                target=self._sampleLoop,
+                name='MemoryProfiler',
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopEvent.set()
+            self._thread.join()
+            self._thread = None
+        if self._startedTracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self._startedTracing = False
+
+    def _getTraced(self):
+        """
+            returns (current, peak) of traced memory since the last call,
+            or (None, None) if not tracing
+        """
+        if not self._trace:
+            return None, None
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        try:
+            tracemalloc.reset_peak()
+        except AttributeError:
+            # python < 3.9, peak is since start, so peaks of later phases
+            # are not lower than peaks of earlier phases
+            pass
+        return current, peak
+
+    def _updatePeaks(self, traced, rss):
+        """
+            must be called with self._lock acquired
+        """
+        for stats in self._stack:
+            if traced is not None and traced > stats.peakTraced:
+                stats.peakTraced = traced
+            if rss is not None and rss > stats.peakRss:
+                stats.peakRss = rss
+        if rss is not None and rss > self._peakRss:
+            self._peakRss = rss
+
+    def _takeSnapshot(self, traced):
+        """
+            takes a tracemalloc snapshot if traced memory of any active
+            phase has grown enough since its last snapshot
+        """
+        stack = [
+            stats for stats in list(self._stack)
+            if traced >= max(
+                stats.snapshotTraced * (1 + self._snapshotGrowth),
+                stats.startTraced + 1024**2,
+            )
+        ]
+        if not stack:
+            return
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, threading.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        topSites = [
+            (str(stat.traceback), stat.size, stat.count)
+            for stat in snapshot.statistics('lineno')[:self._topCount]
+        ]
+        del snapshot
+        for stats in stack:
+            stats.snapshotTraced = traced
+            stats.topSites = topSites
+
+    def _sampleLoop(self):
+        while not self._stopEvent.wait(self._interval):
+            rss = getCurrentRss()
+            with self._lock:
+                if not self._stack:
+                    continue
+                current, peak = self._getTraced()
+                self._updatePeaks(peak, rss)
+                if current is not None:
+                    self._takeSnapshot(current)
+
+    def enter(self, name, sampleRss=True):
+        """
+            sampleRss: read RSS now, otherwise it's only sampled
+                by the sampling thread
+        """
+        if self._isOtherThread():
+            return
+        rss = getCurrentRss() if sampleRss else None
+        with self._lock:
+            current, peak = self._getTraced()
+            self._updatePeaks(peak, rss)
+            try:
+                stats = self.phases[name]
+            except KeyError:
+                stats = self.phases[name] = MemoryPhaseStats(name)
+            stats.count += 1
+            if stats.count == 1:
+                stats.startTraced = current
+                stats.startRss = rss
+                stats.snapshotTraced = current or 0
+            self._stack.append(stats)
+            self._updatePeaks(current, rss)
+
+    def exit(self, sampleRss=True):
+        if self._isOtherThread():
+            return
+        rss = getCurrentRss() if sampleRss else None
+        with self._lock:
+            current, peak = self._getTraced()
+            self._updatePeaks(peak, rss)
+            stats = self._stack.pop()
+            stats.endTraced = current
+            if sampleRss:
+                stats.endRss = rss
+
+    def phase(self, name):
+        """
+            context manager, for example:
+                with memProfiler.phase('read'):
+                    ...
+        """
+        return _MemoryPhaseContext(self, name)
+
+    def phaseIter(self, iterable, name):
+        """
+            yields items of `iterable`, memory used while getting items
+            is counted for phase `name`
+            for lazy phases, like external sort in direct mode
+        """
+        it = iter(iterable)
+        while True:
+            self.enter(name, sampleRss=False)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.exit(sampleRss=False)
+            yield item
+
+    def getReport(self):
+        """
+            returns the report as a JSON-serializable OrderedDict
+            all sizes are in bytes, traced sizes are None if not tracing
+            and RSS sizes are None if not available
+        """
+        return odict([
+            ('tracemalloc', self._trace),
+            ('peakRss', self._peakRss or getPeakRss()),
+            ('phases', odict(
+                (name, stats.toDict())
+                for name, stats in self.phases.items()
+                if stats.count
+            )),
+        ])
+
+    def formatReport(self):
+        """
+            returns peak and retained memory of phases as a text table,
+            followed by top allocation sites of every phase
+        """
+        def mb(size):
+            if size is None:
+                return '-'
+            return '%.1f' % (size / 1024**2)
+
+        lines = ['%-24s %10s %12s %10s %10s' % (
+            'phase', 'peak MB', 'retained MB', 'peak RSS', 'end RSS',
+        )]
+        for name, stats in self.phases.items():
+            if not stats.count:
+                continue
+            retained = None
+            if stats.endTraced is not None:
+                retained = stats.endTraced - stats.startTraced
+            lines.append('%-24s %10s %12s %10s %10s' % (
+                name,
+                mb(stats.peakTraced if self._trace else None),
+                mb(retained),
+                mb(stats.peakRss or None),
+                mb(stats.endRss),
+            ))
+        for name, stats in self.phases.items():
+            if not stats.topSites:
+                continue
+            lines.append('top allocation sites at peak of %s:' % name)
+            for site, size, count in stats.topSites:
+                lines.append('    %10s MB %10d blocks  %s' % (
+                    mb(size),
+                    count,
+                    site,
+                ))
+        return '\n'.join(lines)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+"""
+cache of whole conversion results, see Glossary.convert(cache=...)
+
+a conversion job is identified by a key, which is a hash of digests of
+input files, input and output formats, digests of their plugins, read and
+write options and other options that affect the output, and VERSION
+
+the output files of a job are kept in a directory of the cache
+(in core.cacheDir), and an identical job later gets a copy of them
+instead of running the conversion again
+
+least recently used results are removed when the total size of cache
+is more than its maximum size
+"""
+
+import os
+from os.path import (
+    join,
+    isdir,
+    isfile,
+    basename,
+    dirname,
+    abspath,
+)
+import json
+import shutil
+from hashlib import sha256
+
+from . import VERSION
+from .core import cacheDir
+
+import logging
+log = logging.getLogger('root')
+
+
+resultsDir = join(cacheDir, 'results')
+defaultMaxSize = 1024  # megabytes
+
+# preferences that don't affect the output, not in the key of conversion
+ignoredPrefKeys = ('resultCache', 'resultCacheMaxSize', 'noProgressBar')
+
+
+def _updateFileDigest(h, path):
+    with open(path, 'rb') as fp:
+        while True:
+            chunk = fp.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+
+
+def getPathDigest(path):
+    """
+        returns sha256 hex digest of a file, or of names and contents
+        of files in a directory
+    """
+    h = sha256()
+    if not isdir(path):
+        _updateFileDigest(h, path)
+        return h.hexdigest()
+    for dirPath, dirNames, fnames in os.walk(path):
+        dirNames.sort()
+        for fname in sorted(fnames):
+            fpath = join(dirPath, fname)
+            h.update(os.path.relpath(fpath, path).encode('utf-8') + b'\x00')
+            _updateFileDigest(h, fpath)
+    return h.hexdigest()
+
+
+def getPluginDigest(info):
+    """
+        info: plugin metadata, see Glossary.getPluginInfo
+        returns digest of source files of plugin module (or package)
+    """
+    path = join(info['directory'], info['module'])
+    if isfile(path + '.py'):
+        return getPathDigest(path + '.py')
+    h = sha256()
+    for dirPath, dirNames, fnames in os.walk(path):
+        dirNames.sort()
+        if '__pycache__' in dirNames:
+            dirNames.remove('__pycache__')
+        for fname in sorted(fnames):
+            if fname.endswith('.py'):
+                _updateFileDigest(h, join(dirPath, fname))
+    return h.hexdigest()
+
+
+def _linkOrCopy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _removePath(path):
+    if isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _listFiles(path):
+    """
+        returns dict of relative path => [size, mtime_ns]
+        of files in `path` (recursively)
+    """
+    files = {}
+    for dirPath, dirNames, fnames in os.walk(path):
+        for fname in fnames:
+            fpath = join(dirPath, fname)
+            st = os.stat(fpath)
+            files[os.path.relpath(fpath, path)] = [st.st_size, st.st_mtime_ns]
+    return files
+
+
+class ResultCache(object):
+    """
+        path: directory of cache, with a sub-directory for each result:
+            meta.json: names of output files, stat of stored files,
+                number of entries
+            files/: the output files
+        maxSize: maximum total size of results in megabytes
+        `put` hardlinks output files to stored files when possible, so
+        they are checked (by size and mtime) before use, and a result
+        whose files are modified through an output file is removed
+        `get` copies stored files, so output files of a cache hit
+        never share data with the cache or with each other
+    """
+    def __init__(self, path=resultsDir, maxSize=defaultMaxSize):
+        self.path = path
+        self.maxSize = maxSize * 1024 ** 2
+
+    @staticmethod
+    def getKey(job):
+        """
+            job: JSON-serializable dict that identifies the conversion
+        """
+        return sha256(json.dumps(
+            job,
+            sort_keys=True,
+            ensure_ascii=False,
+        ).encode('utf-8')).hexdigest()
+
+    def _loadMeta(self, resultDir):
+        try:
+            with open(join(resultDir, 'meta.json'), encoding='utf-8') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key, outputFilename):
+        """
+            puts a copy of the output files of result `key`
+            next to `outputFilename`
+            returns (paths, entryCount), or None if there is no
+            (valid) result
+        """
+        resultDir = join(self.path, key)
+        meta = self._loadMeta(resultDir)
+        if meta is None:
+            return None
+        filesDir = join(resultDir, 'files')
+        if _listFiles(filesDir) != meta['files']:
+            log.warning('cached result %s is modified, removing it' % key)
+            shutil.rmtree(resultDir, ignore_errors=True)
+            return None
+        outDir = dirname(abspath(outputFilename))
+        os.makedirs(outDir, exist_ok=True)
+        paths = []
+        for name in meta['names']:
+            src = join(filesDir, name)
+            dst = join(outDir, name)
+            _removePath(dst)
+            if isdir(src):
+                shutil.copytree(src, dst)
+            else:
+                shutil.copy2(src, dst)
+            paths.append(dst)
+        # mtime of meta.json is the last use time, for LRU eviction
+        os.utime(join(resultDir, 'meta.json'))
+        return paths, meta.get('entryCount', 0)
+
+    def put(self, key, paths, entryCount=0):
+        """
+            stores output files (or directories) `paths` as result `key`
+            entryCount: number of written entries, given back by `get`
+            returns True if stored
+        """
+        size = 0
+        for path in paths:
+            if isdir(path):
+                size += sum(item[0] for item in _listFiles(path).values())
+            else:
+                size += os.path.getsize(path)
+        if size > self.maxSize:
+            log.info(
+                'output is larger than maximum size of cache, not caching it'
+            )
+            return False
+        resultDir = join(self.path, key)
+        if isdir(resultDir):
+            return True
+        tmpDir = '%s.%s.tmp' % (resultDir, os.getpid())
+        filesDir = join(tmpDir, 'files')
+        os.makedirs(filesDir)
+        try:
+            for path in paths:
+                dst = join(filesDir, basename(path))
+                if isdir(path):
+                    shutil.copytree(path, dst, copy_function=_linkOrCopy)
+                else:
+                    _linkOrCopy(path, dst)
+            with open(join(tmpDir, 'meta.json'), 'w', encoding='utf-8') as fp:
+                json.dump({
+                    'version': VERSION,
+                    'names': [basename(path) for path in paths],
+                    'size': size,
+                    'files': _listFiles(filesDir),
+                    'entryCount': entryCount,
+                }, fp, ensure_ascii=False)
+            os.rename(tmpDir, resultDir)
+        except Exception:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+            if isdir(resultDir):  # stored by another process
+                return True
+            raise
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+            removes least recently used results, until the total size
+            is not more than maximum size
+            returns the number of removed results
+        """
+        results = []  # list of (lastUseTime, size, resultDir)
+        totalSize = 0
+        for name in os.listdir(self.path):
+            resultDir = join(self.path, name)
+            if name.endswith('.tmp'):
+                continue
+            meta = self._loadMeta(resultDir)
+            if meta is None:
+                continue
+            lastUse = os.stat(join(resultDir, 'meta.json')).st_mtime
+            results.append((lastUse, meta['size'], resultDir))
+            totalSize += meta['size']
+        results.sort()
+        count = 0
+        for _, size, resultDir in results:
+            if totalSize <= self.maxSize:
+                break
+            shutil.rmtree(resultDir, ignore_errors=True)
+            totalSize -= size
+            count += 1
+        if count:
+            log.info('removed %s old results from cache' % count)
+        return count
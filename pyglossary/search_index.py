@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+inverted index of words in definitions, used by Glossary.searchWordInDef
+(with matchWord=True) and Glossary.reverse
+"""
+
+import re
+from array import array
+from collections import Counter
+
+from .text_utils import toStr
+
+import logging
+log = logging.getLogger('root')
+
+
+class DefiSearchIndex(object):
+    """
+        maps each word (token) of definitions to its postings:
+            entry ids (positions in glos._data), and relevance of the token
+            in that entry
+
+        definitions are split into parts by `sepChars`, and tokens are
+        found by the same regex as searchWordInDef, relevance of a token
+        in a part is (token count in part) / (number of tokens in part)
+        and relevance in an entry is the maximum over its parts, so it's
+        exactly the same `rel` that searchWordInDef computes by scanning
+    """
+    def __init__(self, sepChars='.,،', minWordLen=3):
+        self.sepChars = sepChars
+        self.minWordLen = minWordLen
+        self._splitPattern = re.compile(
+            '|'.join([re.escape(x) for x in sepChars]),
+            re.U,
+        )
+        self._wordPattern = re.compile('[\w]{%d,}' % minWordLen, re.U)
+        self._entryIds = {}  # token => array of entry ids
+        self._rels = {}  # token => array of relevance values
+        self.entryCount = 0
+
+    def __len__(self):
+        return len(self._entryIds)
+
+    def tokens(self):
+        return self._entryIds.keys()
+
+    def build(self, rawEntries):
+        """
+            rawEntries: iterable of raw entries, like glos._data
+            one pass, entry ids are positions in `rawEntries`
+        """
+        splitPattern = self._splitPattern
+        wordPattern = self._wordPattern
+        entryIds = self._entryIds
+        rels = self._rels
+        entryId = -1
+        for entryId, rawEntry in enumerate(rawEntries):
+            defi = rawEntry[1]
+            if isinstance(defi, bytes):
+                defi = toStr(defi)
+            elif not isinstance(defi, str):
+                defi = '\n'.join([toStr(part) for part in defi])
+            best = {}
+            for part in re.split(splitPattern, defi):
+                if not part:
+                    continue
+                partWords = re.findall(wordPattern, part)
+                if not partWords:
+                    continue
+                partLen = len(partWords)
+                for token, count in Counter(partWords).items():
+                    rel = count / partLen
+                    if rel > best.get(token, 0):
+                        best[token] = rel
+            for token, rel in best.items():
+                try:
+                    entryIds[token].append(entryId)
+                except KeyError:
+                    entryIds[token] = array('L', (entryId,))
+                    rels[token] = array('d', (rel,))
+                else:
+                    rels[token].append(rel)
+        self.entryCount = entryId + 1
+
+    def getPostings(self, token):
+        """
+            returns an iterable of (entryId, rel) for `token`,
+            sorted by entryId
+        """
+        try:
+            return zip(self._entryIds[token], self._rels[token])
+        except KeyError:
+            return ()
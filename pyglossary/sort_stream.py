@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+import pickle
+import tempfile
+import shutil
 from heapq import heappush, heappop
 from heapq import merge
 
@@ -7,6 +12,10 @@ import logging
 log = logging.getLogger('root')
 
 
+defaultMemLimit = 64  # in megabytes
+defaultMaxFanIn = 64
+
+
 def hsortStream(stream, maxHeapSize, key=None):
     """
         stream: a generator or iterable
@@ -15,6 +24,10 @@ def hsortStream(stream, maxHeapSize, key=None):
              if key is None, we consume less memory
         
         the sort is Stable (unlike normal heapsort) because we include the index (after item / output of key function)
+
+        this is only an approximate sort, items that are more than
+        `maxHeapSize` positions out of place are yielded out of order
+        use `extSortStream` for an exact sort with bounded memory
     """
     hp = []
     if key:
@@ -49,6 +62,123 @@ def hsortStreamList(streams, *args, **kwargs):
 
 
 
+def estimateItemSize(item):
+    """
+        rough estimate of the memory used by `item` in bytes
+        item: str, bytes, or a (nested) list/tuple of them
+    """
+    if isinstance(item, (str, bytes)):
+        return len(item) + 50
+    if isinstance(item, (list, tuple)):
+        return 60 + sum(estimateItemSize(x) for x in item)
+    return sys.getsizeof(item)
+
+
+def _writeRun(items, tmpDir):
+    fd, path = tempfile.mkstemp(prefix='run-', suffix='.pickle', dir=tmpDir)
+    with os.fdopen(fd, 'wb') as fp:
+        pickler = pickle.Pickler(fp, pickle.HIGHEST_PROTOCOL)
+        for item in items:
+            pickler.dump(item)
+            # the memo would keep a reference to every item
+            pickler.clear_memo()
+    return path
+
+
+def _iterRun(path):
+    with open(path, 'rb', buffering=1024*1024) as fp:
+        unpickler = pickle.Unpickler(fp)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                break
+    os.remove(path)
+
+
+def _mergeRuns(paths, key=None):
+    return merge(
+        *tuple(_iterRun(path) for path in paths),
+        key=key
+    )
+
+
+def extSortStream(
+    stream,
+    key=None,
+    memLimit=None,
+    maxRunLen=None,
+    maxFanIn=defaultMaxFanIn,
+    tmpDir=None,
+    sizeFunc=estimateItemSize,
+):
+    """
+        external (spill-to-disk) merge sort, this is a generator
+        stream: a generator or iterable of picklable items
+        key: a key function, as in `list.sort` method, or `sorted` function
+             key does not need to be picklable, it's re-computed on merge
+        memLimit: int, memory budget of each in-memory run, in megabytes
+        maxRunLen: int or None, maximum number of items in each run
+        maxFanIn: int, maximum number of runs (files) merged at once
+        tmpDir: parent directory for temporary run files, or None
+
+        sorted runs are written to temporary files, then merged with a k-way
+        merge, so the order is exact no matter how disordered the input is
+        the sort is Stable, like `sorted` (runs are merged in input order)
+    """
+    if memLimit is None:
+        memLimit = defaultMemLimit
+    maxSize = int(memLimit * 1024 * 1024)
+    if maxFanIn < 2:
+        raise ValueError('maxFanIn must be at least 2')
+
+    runDir = None
+    runPaths = []
+    run = []
+    runSize = 0
+    try:
+        for item in stream:
+            run.append(item)
+            runSize += sizeFunc(item)
+            if runSize < maxSize and not (maxRunLen and len(run) >= maxRunLen):
+                continue
+            if runDir is None:
+                runDir = tempfile.mkdtemp(prefix='pyglossary-sort-', dir=tmpDir)
+            run.sort(key=key)
+            runPaths.append(_writeRun(run, runDir))
+            run = []
+            runSize = 0
+
+        run.sort(key=key)
+        if not runPaths:
+            # everything fits in memory, no need to touch the disk
+            yield from run
+            return
+
+        if run:
+            runPaths.append(_writeRun(run, runDir))
+        del run
+        log.debug('external sort: %s sorted runs' % len(runPaths))
+
+        while len(runPaths) > maxFanIn:
+            newPaths = []
+            for i in range(0, len(runPaths), maxFanIn):
+                group = runPaths[i:i + maxFanIn]
+                if len(group) == 1:
+                    newPaths.append(group[0])
+                    continue
+                newPaths.append(_writeRun(
+                    _mergeRuns(group, key=key),
+                    runDir,
+                ))
+            runPaths = newPaths
+
+        yield from _mergeRuns(runPaths, key=key)
+    finally:
+        if runDir is not None:
+            shutil.rmtree(runDir, ignore_errors=True)
+
+
 def stdinIntegerStream():
     while True:
         line = input(' Input item: ')
@@ -81,8 +211,24 @@ def test_hsortStreamList(count=10):
     ):
         print(item)
 
+def test_extSortStream(count=10000):
+    import random
+    items = [
+        (random.randint(0, count // 10), index)
+        for index in range(count)
+    ]
+    result = list(extSortStream(
+        iter(items),
+        key=lambda x: x[0],
+        memLimit=0.01,
+        maxFanIn=4,
+    ))
+    assert result == sorted(items, key=lambda x: x[0])
+    print('extSortStream: OK, %s items' % count)
+
 def main():
     test_hsortStreamList()
+    test_extSortStream()
     #stream = stdinIntegerStream()
     #for line in hsortStream(stream, 3):
     #    print('------ Placed item: %s'%line)
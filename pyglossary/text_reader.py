@@ -1,4 +1,6 @@
 from pyglossary.file_utils import fileCountLines
+from pyglossary.compression import compressionOpenWithRaw
+import os
 from pyglossary.entry import Entry
 
 import logging
@@ -9,6 +11,8 @@ class TextGlossaryReader(object):
         self._glos = glos
         self._filename = ''
         self._file = None
+        self._rawFile = None
+        self._fileSize = 0
         self._hasInfo = True
         self._leadingLinesCount = 0
         self._pendingEntries = []
@@ -16,7 +20,12 @@ class TextGlossaryReader(object):
         self._pos = -1
     def open(self, filename, encoding='utf-8'):
         self._filename = filename
-        self._file = open(filename, 'r', encoding=encoding)
+        self._file, self._rawFile = compressionOpenWithRaw(
+            filename,
+            'rt',
+            encoding=encoding,
+        )
+        self._fileSize = os.path.getsize(filename)
         if self._hasInfo:
             self.loadInfo()
     def close(self):
@@ -24,9 +33,11 @@ class TextGlossaryReader(object):
             return
         try:
             self._file.close()
+            self._rawFile.close()
         except:
             log.exception('error while closing file "%s"'%self._filename)
         self._file = None
+        self._rawFile = None
     def loadInfo(self):
         self._pendingEntries = []
         self._leadingLinesCount = 0
@@ -70,6 +81,34 @@ class TextGlossaryReader(object):
         return self._len
     __iter__ = lambda self: self
 
+    def byteProgress(self):
+        """
+            returns (consumed bytes, file size) of the input file
+            for compressed files, both are in compressed bytes
+        """
+        if not self._rawFile:
+            return None
+        return self._rawFile.tell(), self._fileSize
+
+    def getPosToken(self):
+        """
+            returns a token of the current position, to continue reading
+            from there later with setPosToken (resuming from checkpoint)
+            or None if the position can not be restored
+        """
+        if self._pendingEntries or not self._file:
+            return None
+        try:
+            return [self._file.tell(), self._pos]
+        except (OSError, ValueError):
+            return None
+
+    def setPosToken(self, token):
+        offset, pos = token
+        self._pendingEntries = []
+        self._file.seek(offset)
+        self._pos = pos
+
     def isInfoWord(self, word):
         raise NotImplementedError
 
@@ -0,0 +1,5 @@
+import sys
+
+from pyglossary.bench import main
+
+sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,26 @@
+import sys
+from pprint import pformat
+
+from pyglossary.glossary import Glossary
+
+## usage: lookup.py [--index] FILE WORD
+##        lookup.py [--index] FILE --prefix PREFIX
+## --index: use (and build) the lookup index file FILE.lookup
+
+index = None
+if sys.argv[1] == '--index':
+    index = True
+    del sys.argv[1]
+
+glos = Glossary()
+if not glos.setLookup(sys.argv[1], index=index):
+    sys.exit(1)
+if sys.argv[2] == '--prefix':
+    for word in glos.lookupPrefix(sys.argv[3], limit=50):
+        print(word)
+    sys.exit(0)
+for entry in glos.lookup(sys.argv[2]):
+    print('Words: ' + pformat(entry.getWords()))
+    print('Definitions: ' + pformat(entry.getDefis()))
+    print('-------------------------')
+glos.closeLookup()
@@ -45,6 +45,9 @@ class UIBase(object):
         'lower',
         'utf8Check',
         'enable_alts',
+        'resultCache',
+        'resultCacheMaxSize',
+        'compressLevel',
         ## Reverse Options:
         'reverse_matchWord',
         'reverse_showRel',
@@ -282,3 +282,67 @@ class UI(UIBase):
             return succeed
 
         return True
+
+    def runBatch(
+        self,
+        manifest='',
+        pattern='',
+        outDir='',
+        outputFormat='',
+        processes=None,
+        prefOptions=None,
+        readOptions=None,
+        writeOptions=None,
+        convertOptions=None,
+    ):
+        from pyglossary.batch import (
+            parseManifest,
+            globJobs,
+            runBatch,
+            formatBatchSummary,
+        )
+        if not prefOptions:
+            prefOptions = {}
+        convertOptions = dict(convertOptions or {})
+        if readOptions:
+            convertOptions['readOptions'] = readOptions
+        if writeOptions:
+            convertOptions['writeOptions'] = writeOptions
+
+        self.pref_load(**prefOptions)
+
+        if outputFormat and not outputFormat in Glossary.writeFormats:
+            log.error('invalid write format %s'%outputFormat)
+            log.error('try: %s --help'%COMMAND)
+            return False
+        if manifest:
+            try:
+                jobs = parseManifest(manifest)
+            except (OSError, ValueError) as e:
+                log.error('invalid manifest file: %s'%e)
+                return False
+            if outputFormat:
+                for job in jobs:
+                    if not job.outputFormat:
+                        job.outputFormat = outputFormat
+        elif outputFormat:
+            jobs = globJobs(pattern, outputFormat)
+        else:
+            log.error('--batch-glob requires --write-format')
+            return False
+        if not jobs:
+            log.error('no input files')
+            return False
+
+        tm0 = time.time()
+        results = runBatch(
+            jobs,
+            processes=processes,
+            outDir=outDir,
+            pref=self.pref,
+            convertOptions=convertOptions,
+            verbosity=min(log.getVerbosity(), 2),
+        )
+        log.info('')
+        log.info(formatBatchSummary(results, time.time() - tm0))
+        return all(result['ok'] for result in results)